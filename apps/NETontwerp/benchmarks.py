@@ -0,0 +1,373 @@
+"""Benchmarks for the NETontwerp processing pipelines, run via manage.py."""
+
+import math
+import random
+import sys
+import time
+
+from apps.NETontwerp.buildings import extract_houses
+
+UTRECHT = (52.0907, 5.1214)
+
+
+def synthetic_overpass_elements(count, seed=0):
+    """Generate an Overpass-style payload with `count` rectangular buildings.
+
+    Buildings are laid out on a grid around Utrecht with areas from sheds to
+    detached houses. Returns (elements, polygon_coords) where the polygon
+    covers roughly the inner three quarters of the grid.
+    """
+    rng = random.Random(seed)
+    side = math.ceil(math.sqrt(count))
+    spacing = 0.0003
+    elements = []
+    nodes = []
+    node_id = 1
+
+    for i in range(count):
+        row, col = divmod(i, side)
+        lat = UTRECHT[0] + row * spacing
+        lon = UTRECHT[1] + col * spacing
+        h = rng.uniform(0.00003, 0.00015)
+        w = rng.uniform(0.00005, 0.00020)
+        corners = [(lat, lon), (lat, lon + w), (lat + h, lon + w), (lat + h, lon)]
+        ids = []
+        for c_lat, c_lon in corners:
+            nodes.append({'type': 'node', 'id': node_id, 'lat': c_lat, 'lon': c_lon})
+            ids.append(node_id)
+            node_id += 1
+        ids.append(ids[0])
+        tags = {'building': rng.choice(['yes', 'house', 'terrace', 'detached'])}
+        if rng.random() < 0.05:
+            tags['name'] = f'Gebouw {i}'
+        elements.append(
+            {'type': 'way', 'id': 10_000_000 + i, 'nodes': ids, 'tags': tags}
+        )
+
+    elements.extend(nodes)
+
+    extent = side * spacing
+    margin = extent / 8
+    south, west = UTRECHT[0] + margin, UTRECHT[1] + margin
+    north, east = UTRECHT[0] + extent - margin, UTRECHT[1] + extent - margin
+    polygon_coords = [[south, west], [south, east], [north, east], [north, west]]
+    return elements, polygon_coords
+
+
+def legacy_extract_houses(elements, polygon_coords):
+    """Reference per-way implementation the vectorized pipeline replaced."""
+    from shapely.geometry import Point, Polygon
+
+    def calculate_area_m2(building_poly, center_lat):
+        meters_per_lat = 111320
+        meters_per_lon = 111320 * math.cos(math.radians(center_lat))
+        return abs(building_poly.area * meters_per_lat * meters_per_lon)
+
+    def classify_house_type(area_m2):
+        if area_m2 < 30:
+            return None
+        elif area_m2 < 80:
+            return 'Rijtjeshuis'
+        elif area_m2 < 150:
+            return 'Twee onder een kap'
+        else:
+            return 'Vrijstaand'
+
+    poly = Polygon(polygon_coords)
+    buildings = []
+    nodes = {}
+    total_area = 0
+
+    for element in elements:
+        if element['type'] == 'node':
+            nodes[element['id']] = (element['lat'], element['lon'])
+
+    for element in elements:
+        if element['type'] == 'way' and 'building' in element.get('tags', {}):
+            building_coords = [
+                list(nodes[node_id])
+                for node_id in element.get('nodes', [])
+                if node_id in nodes
+            ]
+            if len(building_coords) >= 3:
+                building_poly = Polygon(building_coords)
+                center = building_poly.centroid
+                if poly.contains(Point(center.x, center.y)):
+                    area_m2 = calculate_area_m2(building_poly, center.x)
+                    house_type = classify_house_type(area_m2)
+                    if house_type:
+                        buildings.append(
+                            {
+                                'id': element['id'],
+                                'coords': building_coords,
+                                'center': [center.x, center.y],
+                                'type': house_type,
+                                'osm_type': element.get('tags', {}).get(
+                                    'building', 'yes'
+                                ),
+                                'name': element.get('tags', {}).get('name', ''),
+                                'area_m2': round(area_m2, 1),
+                            }
+                        )
+                        total_area += area_m2
+
+    return buildings, total_area
+
+
+def _best_time(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def benchmark_building_extraction(count=5000, repeat=3, seed=0):
+    """Time the legacy loop against the vectorized pipeline on synthetic data."""
+    elements, polygon_coords = synthetic_overpass_elements(count, seed=seed)
+
+    legacy_time, (legacy_buildings, legacy_area) = _best_time(
+        lambda: legacy_extract_houses(elements, polygon_coords), repeat
+    )
+    vector_time, (buildings, total_area) = _best_time(
+        lambda: extract_houses(elements, polygon_coords), repeat
+    )
+
+    return {
+        'buildings_in': count,
+        'houses_out': len(buildings),
+        'legacy_seconds': round(legacy_time, 4),
+        'vectorized_seconds': round(vector_time, 4),
+        'speedup': round(legacy_time / vector_time, 1) if vector_time else None,
+        'output_matches': buildings == legacy_buildings
+        and round(total_area, 1) == round(legacy_area, 1),
+    }
+
+
+MAP_BACKGROUND = (233, 239, 242)  # BGR, light map background
+MAP_STREET = (255, 255, 255)
+MAP_STREET_CASING = (205, 205, 205)
+MAP_PARK = (196, 234, 205)
+HOUSE_FILL = (185, 192, 201)
+HOUSE_OUTLINE = (150, 160, 171)
+
+MAP_CELL = 160  # pixels per grid cell, a house fits in one cell
+BLOCK_CELLS = 4  # cells per block between streets
+STREET_WIDTH = 28
+
+
+def synthetic_map_image(megapixels, seed=0):
+    """Generate a map-like BGR image with a known set of rectangular houses.
+
+    Houses sit in a grid of blocks separated by streets, with some empty
+    cells turned into parks and a few street labels as clutter. Returns
+    (image, houses) where houses holds the (x, y, w, h) box of every house.
+    """
+    import cv2
+    import numpy as np
+
+    rng = random.Random(seed)
+    width = int(math.sqrt(megapixels * 1_000_000 * 4 / 3))
+    height = int(megapixels * 1_000_000 / width)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = MAP_BACKGROUND
+
+    block = MAP_CELL * BLOCK_CELLS + STREET_WIDTH
+    for offset in range(0, max(width, height), block):
+        for start, end in (
+            ((offset, 0), (offset, height)),
+            ((0, offset), (width, offset)),
+        ):
+            cv2.line(image, start, end, MAP_STREET_CASING, STREET_WIDTH)
+            cv2.line(image, start, end, MAP_STREET, STREET_WIDTH - 6)
+        if offset and rng.random() < 0.5:
+            cv2.putText(
+                image,
+                f'Straat {offset // block}',
+                (offset + 40, offset - 4),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                (90, 90, 90),
+                1,
+            )
+
+    houses = []
+    half_street = STREET_WIDTH // 2 + 4
+    for block_y in range(0, height, block):
+        for block_x in range(0, width, block):
+            for row in range(BLOCK_CELLS):
+                for col in range(BLOCK_CELLS):
+                    x0 = block_x + half_street + col * MAP_CELL
+                    y0 = block_y + half_street + row * MAP_CELL
+                    if x0 + MAP_CELL >= width or y0 + MAP_CELL >= height:
+                        continue
+                    roll = rng.random()
+                    if roll < 0.1:
+                        cv2.circle(
+                            image,
+                            (x0 + MAP_CELL // 2, y0 + MAP_CELL // 2),
+                            MAP_CELL // 3,
+                            MAP_PARK,
+                            -1,
+                        )
+                        continue
+                    if roll < 0.25:
+                        continue
+                    w = rng.randint(50, MAP_CELL - 30)
+                    h = rng.randint(50, MAP_CELL - 30)
+                    x = x0 + rng.randint(0, MAP_CELL - 20 - w)
+                    y = y0 + rng.randint(0, MAP_CELL - 20 - h)
+                    corner = (x + w - 1, y + h - 1)
+                    cv2.rectangle(image, (x, y), corner, HOUSE_FILL, -1)
+                    cv2.rectangle(image, (x, y), corner, HOUSE_OUTLINE, 1)
+                    houses.append((x, y, w, h))
+
+    return image, houses
+
+
+def _box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    overlap_w = min(ax + aw, bx + bw) - max(ax, bx)
+    overlap_h = min(ay + ah, by + bh) - max(ay, by)
+    if overlap_w <= 0 or overlap_h <= 0:
+        return 0.0
+    overlap = overlap_w * overlap_h
+    return overlap / (aw * ah + bw * bh - overlap)
+
+
+def match_detections(detected, expected, min_iou=0.5):
+    """Precision and recall of detected boxes against the ground truth.
+
+    Every expected house is matched to at most one detection with an IoU
+    of at least min_iou; further detections of the same house count as
+    false positives.
+    """
+    by_cell = {}
+    for i, (x, y, w, h) in enumerate(expected):
+        cell = ((x + w // 2) // MAP_CELL, (y + h // 2) // MAP_CELL)
+        by_cell.setdefault(cell, []).append(i)
+
+    matched = set()
+    true_positives = 0
+    for box in detected:
+        x, y, w, h = box
+        cell_x, cell_y = (x + w // 2) // MAP_CELL, (y + h // 2) // MAP_CELL
+        best, best_iou = None, min_iou
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for i in by_cell.get((cell_x + dx, cell_y + dy), ()):
+                    iou = _box_iou(box, expected[i])
+                    if i not in matched and iou >= best_iou:
+                        best, best_iou = i, iou
+        if best is not None:
+            matched.add(best)
+            true_positives += 1
+
+    return {
+        'expected': len(expected),
+        'detected': len(detected),
+        'true_positives': true_positives,
+        'precision': round(true_positives / len(detected), 4) if detected else None,
+        'recall': round(true_positives / len(expected), 4) if expected else None,
+    }
+
+
+def _peak_rss_mb():
+    """Peak RSS of this process in MB, None where resource is missing."""
+    try:
+        import resource
+    except ImportError:
+        # Windows has no resource module
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+def _run_detection_case(image_path, output_path, tiled, repeat):
+    """Run detection and drawing on one image, in a fresh process."""
+    import cv2
+
+    from apps.NETontwerp import house_analysis
+
+    gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    contour_count = len(contours)
+    del gray, edges, contours
+
+    detect_time, (image, house_shapes) = _best_time(
+        lambda: house_analysis.detect_houses_from_image(image_path, tiled=tiled),
+        repeat,
+    )
+    draw_time, _ = _best_time(
+        lambda: house_analysis.draw_house_detections(image, house_shapes, output_path),
+        repeat,
+    )
+
+    # Pool workers would keep this process from exiting
+    house_analysis.shutdown_detection_pool()
+
+    return {
+        'detect_seconds': round(detect_time, 4),
+        'draw_seconds': round(draw_time, 4),
+        'contours': contour_count,
+        'contours_per_second': round(contour_count / detect_time),
+        'peak_rss_mb': _peak_rss_mb(),
+        'boxes': [cv2.boundingRect(shape) for shape in house_shapes],
+    }
+
+
+def benchmark_house_detection(sizes=(1, 5, 12, 25, 50), tiled=None, repeat=1, seed=0):
+    """Benchmark house detection on synthetic maps of the given megapixels.
+
+    Every size runs in its own process, so the peak RSS belongs to that
+    size alone; the pool workers of tiled detection are not included, and
+    it is None on Windows.
+    Returns one result dict per size, ready for JSON.
+    """
+    import multiprocessing
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    import cv2
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in sizes:
+            image, houses = synthetic_map_image(megapixels, seed=seed)
+            image_path = f'{tmp}/map_{megapixels}mp.png'
+            cv2.imwrite(image_path, image)
+            height, width = image.shape[:2]
+            del image
+
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context('spawn')
+            ) as executor:
+                case = executor.submit(
+                    _run_detection_case,
+                    image_path,
+                    f'{tmp}/detection_{megapixels}mp.png',
+                    tiled,
+                    repeat,
+                ).result()
+
+            accuracy = match_detections(case.pop('boxes'), houses)
+            results.append(
+                {
+                    'megapixels': megapixels,
+                    'width': width,
+                    'height': height,
+                    'tiled': tiled,
+                    **case,
+                    **accuracy,
+                }
+            )
+
+    return results
@@ -0,0 +1,375 @@
+"""Offline building index built from a local OSM PBF or BAG GeoPackage.
+
+The index is a directory of .npy files that are memory-mapped at runtime:
+building ids, type codes and a ragged coordinate buffer, ordered along a
+Hilbert curve, plus a packed R-tree over the building bounds. Looking up a
+polygon touches only the tree nodes and buildings around it.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+
+import numpy as np
+
+from apps.NETontwerp.building_store import take_ragged
+from apps.NETontwerp.osm_stream import BuildingWays
+from apps.NETontwerp.overpass_query import polygon_bbox
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+NODE_SIZE = 16
+HILBERT_ORDER = 16
+
+# BAG statuses of buildings that exist on the ground
+BAG_ACTIVE_STATUSES = (
+    'Pand in gebruik',
+    'Pand in gebruik (niet ingemeten)',
+    'Verbouwing pand',
+)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def rd_to_wgs84(x, y):
+    """Convert Rijksdriehoek (EPSG:28992) to WGS84 lat/lon arrays.
+
+    Uses the Schreutelkamp & Strang van Hees approximation, accurate to
+    about a meter inside the Netherlands.
+    """
+    dx = (np.asarray(x, dtype=np.float64) - 155000) * 1e-5
+    dy = (np.asarray(y, dtype=np.float64) - 463000) * 1e-5
+    som_n = (
+        3235.65389 * dy
+        - 32.58297 * dx**2
+        - 0.2475 * dy**2
+        - 0.84978 * dx**2 * dy
+        - 0.0655 * dy**3
+        - 0.01709 * dx**2 * dy**2
+        - 0.00738 * dx
+        + 0.0053 * dx**4
+        - 0.00039 * dx**2 * dy**3
+        + 0.00033 * dx**4 * dy
+        - 0.00012 * dx * dy
+    )
+    som_e = (
+        5260.52916 * dx
+        + 105.94684 * dx * dy
+        + 2.45656 * dx * dy**2
+        - 0.81885 * dx**3
+        + 0.05594 * dx * dy**3
+        - 0.05607 * dx**3 * dy
+        + 0.01199 * dy
+        - 0.00256 * dx**3 * dy**2
+        + 0.00128 * dx * dy**4
+        + 0.00022 * dy**2
+        - 0.00022 * dx**2
+        + 0.00026 * dx**5
+    )
+    return 52.15517 + som_n / 3600, 5.387206 + som_e / 3600
+
+
+def _hilbert_index(x, y, order=HILBERT_ORDER):
+    """Hilbert curve distance for integer grid coordinates in [0, 2**order)."""
+    x = x.astype(np.int64).copy()
+    y = y.astype(np.int64).copy()
+    d = np.zeros(len(x), dtype=np.int64)
+    s = 1 << (order - 1)
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant
+        flip = ~ry
+        swap_x = flip & rx
+        x[swap_x] = s - 1 - x[swap_x]
+        y[swap_x] = s - 1 - y[swap_x]
+        x[flip], y[flip] = y[flip], x[flip].copy()
+        s >>= 1
+    return d
+
+
+def _way_bounds(coords, offsets):
+    starts = offsets[:-1]
+    lat_min = np.minimum.reduceat(coords[:, 0], starts)
+    lon_min = np.minimum.reduceat(coords[:, 1], starts)
+    lat_max = np.maximum.reduceat(coords[:, 0], starts)
+    lon_max = np.maximum.reduceat(coords[:, 1], starts)
+    return np.column_stack([lat_min, lon_min, lat_max, lon_max])
+
+
+def write_index(path, ids, coords, offsets, osm_types, source=''):
+    """Sort buildings along a Hilbert curve, pack the R-tree and save it.
+
+    osm_types is a list with the building type string of every building.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    type_table = sorted(set(osm_types))
+    type_lookup = {name: code for code, name in enumerate(type_table)}
+    type_codes = np.array([type_lookup[t] for t in osm_types], dtype=np.uint16)
+
+    bounds = _way_bounds(coords, offsets)
+    centers = (bounds[:, :2] + bounds[:, 2:]) / 2
+    low = centers.min(axis=0)
+    span = np.maximum(centers.max(axis=0) - low, 1e-12)
+    grid = ((centers - low) / span * ((1 << HILBERT_ORDER) - 1)).astype(np.int64)
+    order = np.argsort(_hilbert_index(grid[:, 1], grid[:, 0]), kind='stable')
+
+    coords, offsets = take_ragged(coords, offsets, order)
+    ids = ids[order]
+    type_codes = type_codes[order]
+    bounds = bounds[order]
+
+    levels = [bounds]
+    while len(levels[-1]) > NODE_SIZE:
+        child = levels[-1]
+        starts = np.arange(0, len(child), NODE_SIZE)
+        levels.append(
+            np.column_stack(
+                [
+                    np.minimum.reduceat(child[:, 0], starts),
+                    np.minimum.reduceat(child[:, 1], starts),
+                    np.maximum.reduceat(child[:, 2], starts),
+                    np.maximum.reduceat(child[:, 3], starts),
+                ]
+            )
+        )
+    level_offsets = np.cumsum([0] + [len(level) for level in levels]).tolist()
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, 'ids.npy'), ids)
+    np.save(os.path.join(path, 'coords.npy'), coords)
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+    np.save(os.path.join(path, 'type_codes.npy'), type_codes)
+    np.save(os.path.join(path, 'tree.npy'), np.concatenate(levels))
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(
+            {
+                'version': INDEX_VERSION,
+                'count': len(ids),
+                'node_size': NODE_SIZE,
+                'level_offsets': level_offsets,
+                'osm_types': type_table,
+                'source': source,
+            },
+            f,
+            indent=2,
+        )
+    logger.info(f'Wrote building index with {len(ids)} buildings to {path}')
+    return len(ids)
+
+
+class BuildingIndex:
+    """Memory-mapped building index with a packed R-tree."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('version') != INDEX_VERSION:
+            raise ValueError(f'Unsupported building index version in {path}')
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode='r')
+
+        self.ids = load('ids.npy')
+        self.coords = load('coords.npy')
+        self.offsets = load('offsets.npy')
+        self.type_codes = load('type_codes.npy')
+        self.tree = load('tree.npy')
+        self.node_size = self.meta['node_size']
+        self.level_offsets = self.meta['level_offsets']
+        self.osm_types = self.meta['osm_types']
+
+    def __len__(self):
+        return self.meta['count']
+
+    def query_bbox(self, south, west, north, east):
+        """Return the sorted indices of buildings whose bounds hit the bbox."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+
+        levels = len(self.level_offsets) - 1
+        top = self.tree[self.level_offsets[-2] : self.level_offsets[-1]]
+        candidates = np.arange(len(top))
+        for level in range(levels - 1, -1, -1):
+            start, end = self.level_offsets[level], self.level_offsets[level + 1]
+            if level < levels - 1:
+                children = candidates[:, None] * self.node_size + np.arange(
+                    self.node_size
+                )
+                candidates = children.ravel()
+                candidates = candidates[candidates < end - start]
+            boxes = self.tree[start + candidates] if len(candidates) else top[:0]
+            hit = (
+                (boxes[:, 0] <= north)
+                & (boxes[:, 2] >= south)
+                & (boxes[:, 1] <= east)
+                & (boxes[:, 3] >= west)
+            )
+            candidates = candidates[hit]
+            if not len(candidates):
+                break
+        return candidates
+
+    def query_polygon(self, polygon_coords):
+        """Return the buildings around a polygon as BuildingWays.
+
+        Selection is by bbox; the centroid-in-polygon test happens in
+        extract_houses like for Overpass results.
+        """
+        indices = self.query_bbox(*polygon_bbox(polygon_coords))
+        coords, offsets = take_ragged(self.coords, self.offsets, indices)
+        return BuildingWays(
+            np.asarray(self.ids[indices]),
+            coords,
+            offsets,
+            [self.osm_types[code] for code in self.type_codes[indices].tolist()],
+            [''] * len(indices),
+        )
+
+
+def get_building_index(config):
+    """Return the shared BuildingIndex, or None when no index file exists."""
+    path = config.get('BUILDING_INDEX_PATH')
+    if not path or not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = BuildingIndex(path)
+            _indexes[path] = index
+            logger.info(f'Loaded offline building index with {len(index)} buildings')
+        return index
+
+
+def read_osm_pbf(path, bbox=None):
+    """Read closed building ways from an OSM PBF file (needs pyosmium)."""
+    try:
+        import osmium
+    except ImportError as e:
+        raise RuntimeError(
+            'Reading OSM PBF files requires pyosmium (pip install osmium)'
+        ) from e
+
+    ids = array('q')
+    coords = array('d')
+    offsets = array('q', [0])
+    osm_types = []
+
+    class BuildingHandler(osmium.SimpleHandler):
+        def way(self, way):
+            building = way.tags.get('building')
+            if not building or len(way.nodes) < 4 or not way.is_closed():
+                return
+            try:
+                points = [(node.lat, node.lon) for node in way.nodes]
+            except osmium.InvalidLocationError:
+                return
+            if bbox is not None:
+                lat, lon = points[0]
+                if not (bbox[0] <= lat <= bbox[2] and bbox[1] <= lon <= bbox[3]):
+                    return
+            ids.append(way.id)
+            for lat, lon in points:
+                coords.append(lat)
+                coords.append(lon)
+            offsets.append(offsets[-1] + len(points))
+            osm_types.append(building)
+
+    BuildingHandler().apply_file(path, locations=True)
+    return (
+        np.frombuffer(ids, dtype=np.int64).copy(),
+        np.frombuffer(coords, dtype=np.float64).reshape(-1, 2).copy(),
+        np.frombuffer(offsets, dtype=np.int64).copy(),
+        osm_types,
+    )
+
+
+def _gpkg_wkb(blob):
+    """Strip the GeoPackage header from a geometry blob."""
+    flags = blob[3]
+    envelope_size = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[(flags >> 1) & 0x07]
+    return bytes(blob[8 + envelope_size :])
+
+
+def read_bag_geopackage(path, table='pand', bbox=None, batch_size=50000):
+    """Read building footprints from a BAG GeoPackage (EPSG:28992 or 4326)."""
+    import shapely
+
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        row = connection.execute(
+            'SELECT column_name, srs_id FROM gpkg_geometry_columns '
+            'WHERE table_name = ?',
+            (table,),
+        ).fetchone()
+        if row is None:
+            raise ValueError(f'No geometry table {table!r} in {path}')
+        geom_column, srs_id = row
+        columns = [r[1] for r in connection.execute(f'PRAGMA table_info("{table}")')]
+        id_column = 'identificatie' if 'identificatie' in columns else 'fid'
+
+        sql = f'SELECT "{id_column}", "{geom_column}" FROM "{table}"'
+        params = ()
+        if 'status' in columns:
+            placeholders = ','.join('?' * len(BAG_ACTIVE_STATUSES))
+            sql += f' WHERE status IN ({placeholders})'
+            params = BAG_ACTIVE_STATUSES
+
+        ids = []
+        coord_parts = []
+        counts = []
+        cursor = connection.execute(sql, params)
+        while rows := cursor.fetchmany(batch_size):
+            geoms = shapely.from_wkb([_gpkg_wkb(geom) for _, geom in rows if geom])
+            row_ids = [int(row_id) for row_id, geom in rows if geom]
+            for row_id, geom in zip(row_ids, geoms, strict=True):
+                if geom is None or geom.is_empty:
+                    continue
+                if geom.geom_type == 'MultiPolygon':
+                    geom = max(geom.geoms, key=lambda part: part.area)
+                if geom.geom_type != 'Polygon':
+                    continue
+                ring = shapely.get_coordinates(geom.exterior)
+                if srs_id == 28992:
+                    lat, lon = rd_to_wgs84(ring[:, 0], ring[:, 1])
+                else:
+                    lat, lon = ring[:, 1], ring[:, 0]
+                if bbox is not None and not (
+                    bbox[0] <= lat[0] <= bbox[2] and bbox[1] <= lon[0] <= bbox[3]
+                ):
+                    continue
+                ids.append(row_id)
+                coord_parts.append(np.column_stack([lat, lon]))
+                counts.append(len(lat))
+    finally:
+        connection.close()
+
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    coords = np.concatenate(coord_parts) if coord_parts else np.empty((0, 2))
+    return np.array(ids, dtype=np.int64), coords, offsets, ['yes'] * len(ids)
+
+
+def build_index(source, output, bbox=None):
+    """Ingest a .osm.pbf or .gpkg extract into an index directory."""
+    if source.endswith('.pbf'):
+        ids, coords, offsets, osm_types = read_osm_pbf(source, bbox=bbox)
+    elif source.endswith('.gpkg'):
+        ids, coords, offsets, osm_types = read_bag_geopackage(source, bbox=bbox)
+    else:
+        raise ValueError('Source must be an OSM .pbf or a BAG .gpkg file')
+    if not len(ids):
+        raise ValueError(f'No buildings found in {source}')
+    return write_index(
+        output, ids, coords, offsets, osm_types, source=os.path.basename(source)
+    )
@@ -0,0 +1,265 @@
+"""Columnar in-memory storage of extracted buildings.
+
+A BuildingStore keeps one row per building in a NumPy structured array
+(id, center, area, type codes) plus a ragged coordinate buffer, instead of
+a dict with nested lists per building. Finished extractions are kept in
+the ResultStore under their result id, so street assignment, cable sizing,
+vector tiles and export work on the same arrays without extracting or
+parsing the buildings again.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from apps.NETontwerp.overpass_query import DETAIL_CENTERS, DETAIL_FULL
+
+MAX_RESULTS = 16
+
+BUILDING_DTYPE = np.dtype(
+    [
+        ('id', np.int64),
+        ('lat', np.float64),
+        ('lon', np.float64),
+        ('area_m2', np.float64),
+        ('type_code', np.uint8),
+        ('osm_type_code', np.uint16),
+    ]
+)
+
+_results = None
+_results_lock = threading.Lock()
+
+
+def take_ragged(coords, offsets, indices):
+    """Gather the ragged rows at indices into new (coords, offsets)."""
+    counts = (offsets[1:] - offsets[:-1])[indices]
+    new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+    point_index = np.repeat(offsets[:-1][indices] - new_offsets[:-1], counts)
+    point_index += np.arange(int(new_offsets[-1]))
+    return coords[point_index], new_offsets
+
+
+def _dictionary_encode(values, table=None):
+    table = {value: code for code, value in enumerate(table or [])}
+    codes = [table.setdefault(value, len(table)) for value in values]
+    return list(table), codes
+
+
+class BuildingStore:
+    """The buildings of one extraction result in columnar form.
+
+    records holds one BUILDING_DTYPE row per building; the footprint of
+    building i is coords[offsets[i]:offsets[i + 1]] as (lat, lon) rows.
+    type_code and osm_type_code index into type_names and osm_types.
+    """
+
+    def __init__(
+        self,
+        records,
+        coords,
+        offsets,
+        type_names,
+        osm_types,
+        names,
+        polygon_coords=None,
+        detail=DETAIL_FULL,
+    ):
+        self.records = records
+        self.coords = coords
+        self.offsets = offsets
+        self.type_names = type_names
+        self.osm_types = osm_types
+        self.names = names
+        self.polygon_coords = polygon_coords
+        self.detail = detail
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def from_buildings(cls, buildings, polygon_coords=None, detail=DETAIL_FULL):
+        """Build a store from building dicts as the endpoints return them."""
+        records = np.zeros(len(buildings), dtype=BUILDING_DTYPE)
+        records['id'] = [building['id'] for building in buildings]
+        centers = np.array([b['center'] for b in buildings], dtype=np.float64)
+        records['lat'] = centers.reshape(-1, 2)[:, 0]
+        records['lon'] = centers.reshape(-1, 2)[:, 1]
+        records['area_m2'] = [b.get('area_m2', 0) for b in buildings]
+
+        type_names, type_codes = _dictionary_encode(
+            (b.get('type') for b in buildings), table=[None]
+        )
+        osm_types, osm_type_codes = _dictionary_encode(
+            b.get('osm_type', 'yes') for b in buildings
+        )
+        records['type_code'] = type_codes
+        records['osm_type_code'] = osm_type_codes
+
+        counts = np.array([len(b.get('coords', ())) for b in buildings], dtype=np.int64)
+        offsets = np.zeros(len(buildings) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        coords = np.array(
+            [point for b in buildings for point in b.get('coords', ())],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+
+        return cls(
+            records,
+            coords,
+            offsets,
+            type_names,
+            osm_types,
+            [b.get('name', '') for b in buildings],
+            polygon_coords,
+            detail,
+        )
+
+    @property
+    def has_footprints(self):
+        return self.detail != DETAIL_CENTERS
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays, not counting the shared name strings."""
+        return self.records.nbytes + self.coords.nbytes + self.offsets.nbytes
+
+    def way_coords(self, i):
+        return self.coords[self.offsets[i] : self.offsets[i + 1]]
+
+    def total_area_m2(self):
+        # Summed in order, as the per-building loop always did
+        return sum(self.records['area_m2'].tolist())
+
+    def type_counts(self):
+        """Number of buildings per house type name."""
+        counts = np.bincount(self.records['type_code'], minlength=len(self.type_names))
+        return {
+            name: int(count)
+            for name, count in zip(self.type_names, counts.tolist(), strict=True)
+            if name is not None
+        }
+
+    def select(self, indices):
+        """Return a store with the buildings at indices (or a boolean mask)."""
+        indices = np.arange(len(self))[indices]
+        coords, offsets = take_ragged(self.coords, self.offsets, indices)
+        return BuildingStore(
+            self.records[indices],
+            coords,
+            offsets,
+            self.type_names,
+            self.osm_types,
+            [self.names[i] for i in indices.tolist()],
+            self.polygon_coords,
+            self.detail,
+        )
+
+    def sorted_by_id(self):
+        """Return the store ordered by way id.
+
+        Sub-areas and cached tiles deliver buildings in varying order, this
+        keeps the numbering, exports and tile features of a result stable.
+        """
+        ids = self.records['id']
+        if np.all(ids[:-1] <= ids[1:]):
+            return self
+        return self.select(np.argsort(ids, kind='stable'))
+
+    @classmethod
+    def concat(cls, stores, polygon_coords=None, detail=DETAIL_FULL):
+        """Join stores into one, merging their type tables."""
+        if not stores:
+            return cls.from_buildings([], polygon_coords, detail)
+
+        type_names = [None]
+        osm_types = []
+        records = []
+        for store in stores:
+            type_names, type_map = _dictionary_encode(store.type_names, type_names)
+            osm_types, osm_map = _dictionary_encode(store.osm_types, osm_types)
+            part = store.records.copy()
+            part['type_code'] = np.asarray(type_map, dtype=np.uint8)[part['type_code']]
+            part['osm_type_code'] = np.asarray(osm_map, dtype=np.uint16)[
+                part['osm_type_code']
+            ]
+            records.append(part)
+
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for store in stores:
+            offsets.append(store.offsets[1:] + base)
+            base += store.offsets[-1]
+
+        return cls(
+            np.concatenate(records),
+            np.concatenate([store.coords for store in stores]),
+            np.concatenate(offsets),
+            type_names,
+            osm_types,
+            [name for store in stores for name in store.names],
+            polygon_coords,
+            detail,
+        )
+
+    def to_buildings(self, start=0, stop=None):
+        """Building dicts in the format the endpoints have always returned."""
+        rows = self.records[start:stop].tolist()
+        if not self.has_footprints:
+            return [
+                {
+                    'id': way_id,
+                    'center': [lat, lon],
+                    'osm_type': self.osm_types[osm_code],
+                    'name': self.names[start + offset],
+                }
+                for offset, (way_id, lat, lon, _, _, osm_code) in enumerate(rows)
+            ]
+
+        return [
+            {
+                'id': way_id,
+                'coords': self.way_coords(start + offset).tolist(),
+                'center': [lat, lon],
+                'type': self.type_names[type_code],
+                'osm_type': self.osm_types[osm_code],
+                'name': self.names[start + offset],
+                'area_m2': round(area, 1),
+            }
+            for offset, (way_id, lat, lon, area, type_code, osm_code) in enumerate(rows)
+        ]
+
+
+class ResultStore:
+    """Keeps the most recent BuildingStores by result id."""
+
+    def __init__(self, max_results=MAX_RESULTS):
+        self.max_results = max_results
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, result_id, store):
+        with self._lock:
+            self._results[result_id] = store
+            self._results.move_to_end(result_id)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return store
+
+    def get(self, result_id):
+        with self._lock:
+            store = self._results.get(result_id)
+            if store is not None:
+                self._results.move_to_end(result_id)
+            return store
+
+
+def get_result_store():
+    """Return the process-wide ResultStore."""
+    global _results
+    with _results_lock:
+        if _results is None:
+            _results = ResultStore()
+        return _results
@@ -0,0 +1,154 @@
+"""Cable route lengths from stations to the houses they feed.
+
+The houses of a station are connected by a minimum spanning tree over the
+station and the house centers. The Euclidean MST is part of the Delaunay
+triangulation, so triangulating every station's points (GEOS, through
+shapely) leaves about three candidate edges per point instead of all
+pairs, and Kruskal picks the tree from those. All stations are
+triangulated in one call and share one sorted edge list.
+"""
+
+import numpy as np
+import shapely
+
+from apps.NETontwerp.placement import project_to_meters
+
+
+def nearest_stations(centers, stations):
+    """Index of the nearest station for every (lat, lon) house center."""
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    stations = np.asarray(stations, dtype=np.float64).reshape(-1, 2)
+    points = project_to_meters(np.vstack([stations, centers]))
+    tree = shapely.STRtree(shapely.points(points[: len(stations)]))
+    houses, nearest = tree.query_nearest(
+        shapely.points(points[len(stations) :]), all_matches=False
+    )
+    assignment = np.empty(len(centers), dtype=np.int64)
+    assignment[houses] = nearest
+    return assignment
+
+
+def _candidate_edges(points, groups):
+    """Delaunay edges (first, second) of the points within every group."""
+    order = np.argsort(groups, kind='stable')
+    edges = shapely.delaunay_triangles(
+        shapely.multipoints(points[order], indices=groups[order]), only_edges=True
+    )
+    parts, part_groups = shapely.get_parts(edges, return_index=True)
+    ends = shapely.get_coordinates(parts).reshape(-1, 2, 2)
+
+    # Edge ends carry the input coordinates, map them back to point indices.
+    # Points at the same spot as an earlier one are left out of the
+    # triangulation, they are tied to that point with a zero-length edge.
+    index = {}
+    first, second = [], []
+    for i, (group, x, y) in enumerate(
+        zip(groups.tolist(), *points.T.tolist(), strict=True)
+    ):
+        known = index.setdefault((group, x, y), i)
+        if known != i:
+            first.append(known)
+            second.append(i)
+    for group, ((x1, y1), (x2, y2)) in zip(
+        part_groups.tolist(), ends.tolist(), strict=True
+    ):
+        first.append(index[group, x1, y1])
+        second.append(index[group, x2, y2])
+    return np.array(first, dtype=np.int64), np.array(second, dtype=np.int64)
+
+
+def _kruskal(count, first, second, lengths):
+    """Mask of the edges that form a minimum spanning forest."""
+    parent = list(range(count))
+    chosen = np.zeros(len(lengths), dtype=bool)
+    order = np.argsort(lengths, kind='stable')
+    ends = zip(
+        order.tolist(), first[order].tolist(), second[order].tolist(), strict=True
+    )
+    for edge, a, b in ends:
+        while parent[a] != a:
+            parent[a] = a = parent[parent[a]]
+        while parent[b] != b:
+            parent[b] = b = parent[parent[b]]
+        if a != b:
+            parent[a] = b
+            chosen[edge] = True
+    return chosen
+
+
+def cable_routes(centers, stations, assignment=None):
+    """Minimum spanning tree cable route from every station to its houses.
+
+    centers and stations are (lat, lon) rows; assignment gives the station
+    index of every house and defaults to the nearest station. Returns a
+    dict with per station 'houses', 'length_m' and 'segments' (a list of
+    ((lat, lon), (lat, lon)) pairs), plus 'total_length_m'.
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    stations = np.asarray(stations, dtype=np.float64).reshape(-1, 2)
+    if not len(stations):
+        raise ValueError('Plaats eerst minimaal één station')
+    if assignment is None:
+        assignment = nearest_stations(centers, stations)
+    assignment = np.asarray(assignment, dtype=np.int64)
+    if assignment.shape != (len(centers),):
+        raise ValueError('Geef voor elk huis een station op')
+    if len(assignment) and (assignment.min() < 0 or assignment.max() >= len(stations)):
+        raise ValueError('Onbekend station in de toewijzing')
+
+    # Stations are nodes 0..S-1, house i is node S + i
+    coords = np.vstack([stations, centers])
+    groups = np.concatenate([np.arange(len(stations)), assignment])
+    points = project_to_meters(coords)
+
+    first, second = _candidate_edges(points, groups)
+    lengths = np.hypot(*(points[first] - points[second]).T)
+    chosen = _kruskal(len(points), first, second, lengths)
+    first, second, lengths = first[chosen], second[chosen], lengths[chosen]
+
+    edge_groups = groups[first]
+    length_m = np.bincount(edge_groups, weights=lengths, minlength=len(stations))
+    segments = [[] for _ in stations]
+    for group, a, b in zip(
+        edge_groups.tolist(),
+        coords[first].tolist(),
+        coords[second].tolist(),
+        strict=True,
+    ):
+        segments[group].append((a, b))
+
+    return {
+        'houses': np.bincount(assignment, minlength=len(stations)),
+        'length_m': length_m,
+        'segments': segments,
+        'total_length_m': float(lengths.sum()),
+    }
+
+
+def route_features(routes, cables):
+    """GeoJSON FeatureCollection with a MultiLineString route per station."""
+    features = []
+    for i, (segments, houses, length, cable) in enumerate(
+        zip(
+            routes['segments'],
+            routes['houses'].tolist(),
+            routes['length_m'].tolist(),
+            cables,
+            strict=True,
+        )
+    ):
+        # Houses at the station's own spot need no line
+        lines = [[a[::-1], b[::-1]] for a, b in segments if a != b]
+        features.append(
+            {
+                'type': 'Feature',
+                'geometry': {'type': 'MultiLineString', 'coordinates': lines},
+                'properties': {
+                    'station': i + 1,
+                    'houses': houses,
+                    'length_m': round(length, 1),
+                    'cable': cable,
+                },
+            }
+        )
+    return {'type': 'FeatureCollection', 'features': features}
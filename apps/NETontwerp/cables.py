@@ -0,0 +1,104 @@
+"""Catalog of cable types, loaded once from a JSON data file.
+
+The file is a list of cable objects with at least a name and a capacity
+in ampere, for example::
+
+    {"name": "4*150mm2 Al (basis)", "capacity": 150, "cost_per_m": 12.5}
+
+cost_per_m is optional. When every cable has one, the cheapest adequate
+cable is the one with the lowest cost; otherwise it is the one with the
+smallest capacity. Cables keep the order of the file for display.
+"""
+
+import bisect
+import json
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(__file__), 'cable_types.json')
+AUTO_CABLE = 'auto'  # form value asking for the cheapest adequate cable
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+class CableCatalog:
+    """Cable types with an index by name and one sorted by capacity."""
+
+    def __init__(self, cables):
+        self.cables = [dict(cable) for cable in cables]
+        for cable in self.cables:
+            capacity = cable.get('capacity')
+            if not cable.get('name') or not isinstance(capacity, int | float):
+                raise ValueError(f'Ongeldige kabel in catalogus: {cable}')
+        self._by_name = {cable['name']: cable for cable in self.cables}
+
+        by_capacity = sorted(
+            range(len(self.cables)), key=lambda i: self.cables[i]['capacity']
+        )
+        self._sorted = [self.cables[i] for i in by_capacity]
+        self._capacities = [cable['capacity'] for cable in self._sorted]
+        self._capacity_array = np.asarray(self._capacities, dtype=np.float64)
+
+        # cheapest[i] is the cheapest cable among _sorted[i:], so the cheapest
+        # cable carrying a load is one bisect plus one lookup away.
+        with_costs = all('cost_per_m' in cable for cable in self.cables)
+        cheapest = [None] * (len(self._sorted) + 1)
+        for i in range(len(self._sorted) - 1, -1, -1):
+            cable, best = self._sorted[i], cheapest[i + 1]
+            if (
+                not with_costs
+                or best is None
+                or cable['cost_per_m'] <= best['cost_per_m']
+            ):
+                best = cable
+            cheapest[i] = best
+        self._cheapest = cheapest
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_CATALOG_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.cables)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def names(self):
+        return [cable['name'] for cable in self.cables]
+
+    def get(self, name):
+        """The cable with this name, or None."""
+        return self._by_name.get(name)
+
+    def capacity(self, name):
+        """Capacity of a cable in ampere, 0 for unknown names."""
+        cable = self._by_name.get(name)
+        return cable['capacity'] if cable else 0
+
+    def capacities(self, names):
+        """Capacities for a list of cable names, 0 for unknown names or None."""
+        return np.array([self.capacity(name) for name in names], dtype=np.float64)
+
+    def cheapest_adequate(self, ampere):
+        """The cheapest cable carrying at least ampere, or None if none can."""
+        return self._cheapest[bisect.bisect_left(self._capacities, ampere)]
+
+    def select(self, amperes):
+        """cheapest_adequate for an array of loads, as a list of cables."""
+        positions = np.searchsorted(self._capacity_array, amperes, side='left')
+        return [self._cheapest[i] for i in np.ravel(positions).tolist()]
+
+
+def get_cable_catalog(config=None):
+    """Return the process-wide CableCatalog, loaded on first use."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            path = (config or {}).get('CABLE_CATALOG_PATH') or DEFAULT_CATALOG_PATH
+            _catalog = CableCatalog.from_file(path)
+        return _catalog
@@ -0,0 +1,107 @@
+"""Street capacity calculations on NumPy arrays.
+
+Every street is one array element, so thousands of streets, or a batch of
+scenarios as a 2-D array of (scenario, street), are checked in one pass.
+Per-house load and simultaneity factor may be scalars or arrays that
+broadcast against the houses.
+"""
+
+import numpy as np
+
+from apps.NETontwerp.cables import AUTO_CABLE
+
+AMPERE_PER_HOUSE = 10
+SIMULTANEITY = 1
+KVA_PER_AMPERE = 0.23  # 230 V
+
+
+def even_split(house_count, street_count):
+    """Houses per street when house_count is divided evenly, rounded down."""
+    return np.full(street_count, house_count // street_count, dtype=np.int64)
+
+
+def load_ampere(houses, ampere_per_house=AMPERE_PER_HOUSE, simultaneity=SIMULTANEITY):
+    """Current needed for the houses on a street."""
+    return np.asarray(houses) * np.asarray(ampere_per_house) * np.asarray(simultaneity)
+
+
+def assign_cables(
+    cables,
+    houses,
+    catalog,
+    ampere_per_house=AMPERE_PER_HOUSE,
+    simultaneity=SIMULTANEITY,
+):
+    """Fill in the streets set to AUTO_CABLE with the cheapest adequate cable.
+
+    Returns (cables, auto) where auto marks the streets that were filled
+    in. A street no cable can carry gets None.
+    """
+    cables = list(cables)
+    auto = [cable == AUTO_CABLE for cable in cables]
+    if any(auto):
+        if np.ndim(houses) != 1:
+            raise ValueError('Automatische kabelkeuze werkt per scenario')
+        load = np.broadcast_to(
+            load_ampere(houses, ampere_per_house, simultaneity), len(cables)
+        )
+        indices = np.flatnonzero(auto)
+        picked = catalog.select(load[indices])
+        for i, cable in zip(indices.tolist(), picked, strict=True):
+            cables[i] = cable['name'] if cable else None
+    return cables, auto
+
+
+def street_capacity(
+    houses,
+    capacities,
+    has_cable=None,
+    ampere_per_house=AMPERE_PER_HOUSE,
+    simultaneity=SIMULTANEITY,
+):
+    """Load and capacity check per street.
+
+    houses and capacities (ampere) broadcast against each other; has_cable
+    marks the streets that got a cable at all and defaults to a capacity
+    above zero. A street is connected completely when its cable carries
+    the needed current, otherwise none of its houses are. Returns a dict
+    of arrays plus the totals over the last (street) axis.
+    """
+    houses = np.asarray(houses)
+    capacities = np.asarray(capacities)
+    if has_cable is None:
+        has_cable = capacities > 0
+    if np.any(houses < 0):
+        raise ValueError('Het aantal huizen kan niet negatief zijn')
+
+    ampere_needed = load_ampere(houses, ampere_per_house, simultaneity)
+    kva_needed = ampere_needed * KVA_PER_AMPERE
+    can_handle = np.asarray(has_cable) & (capacities >= ampere_needed)
+    connected = np.where(can_handle, houses, 0)
+
+    total_houses = houses.sum(axis=-1)
+    total_connected = connected.sum(axis=-1)
+    return {
+        'ampere_needed': ampere_needed,
+        'kva_needed': kva_needed,
+        'can_handle': can_handle,
+        'connected': connected,
+        'total_houses': total_houses,
+        'total_connected': total_connected,
+        'total_unconnected': total_houses - total_connected,
+    }
+
+
+def _round_nested(values, digits):
+    if isinstance(values, list):
+        return [_round_nested(value, digits) for value in values]
+    return round(values, digits)
+
+
+def round_kva(kva_needed):
+    """kVA values as (nested) lists, rounded to 2 decimals as always shown.
+
+    Python's round is used on purpose, np.round can differ in the last
+    decimal.
+    """
+    return _round_nested(np.asarray(kva_needed).tolist(), 2)
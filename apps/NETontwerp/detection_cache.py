@@ -0,0 +1,88 @@
+"""Memoization of house detection results.
+
+Designers upload the same screenshot again, often under another name.
+Results are kept under the SHA-256 of the uploaded bytes together with the
+detection parameters, so a repeat upload skips decoding, detection and
+drawing and only has to hash the bytes.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def detection_key(data, params, **options):
+    """Cache key for upload bytes detected with params and output options."""
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps([params, options], sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _pages_size(pages):
+    return sum(len(page['image'][0]) for page in pages)
+
+
+class DetectionCache:
+    """Detection pages by key, bounded in bytes, least recently used out first.
+
+    The cached pages are shared between requests and must not be modified.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, pages):
+        size = _pages_size(pages)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (pages, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+def get_detection_cache(config):
+    """Return the process-wide DetectionCache, sized from the app config."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            max_bytes = config.get('DETECTION_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+            _cache = DetectionCache(max_bytes=max_bytes)
+        return _cache
@@ -0,0 +1,77 @@
+"""Export of stored extraction results as GeoJSON or CSV."""
+
+import csv
+import io
+import json
+
+EXPORT_GEOJSON = 'geojson'
+EXPORT_CSV = 'csv'
+
+CSV_COLUMNS = ['nr', 'id', 'lat', 'lon', 'type', 'area_m2', 'osm_type', 'name']
+
+
+def iter_geojson(store, chunk_size=500):
+    """Yield a GeoJSON FeatureCollection of the store in text chunks.
+
+    Footprints become Polygons and buildings without one a Point, both in
+    GeoJSON's (lon, lat) order.
+    """
+    yield '{"type":"FeatureCollection","features":['
+    separator = ''
+    chunk = []
+    for i, (way_id, lat, lon, area, type_code, osm_code) in enumerate(
+        store.records.tolist()
+    ):
+        properties = {
+            'nr': i + 1,
+            'osm_type': store.osm_types[osm_code],
+            'name': store.names[i],
+        }
+        if store.has_footprints:
+            ring = store.way_coords(i)[:, ::-1].tolist()
+            geometry = {'type': 'Polygon', 'coordinates': [ring]}
+            properties['type'] = store.type_names[type_code]
+            properties['area_m2'] = round(area, 1)
+        else:
+            geometry = {'type': 'Point', 'coordinates': [lon, lat]}
+        feature = {
+            'type': 'Feature',
+            'id': way_id,
+            'geometry': geometry,
+            'properties': properties,
+        }
+        chunk.append(json.dumps(feature, separators=(',', ':')))
+        if len(chunk) >= chunk_size:
+            yield separator + ','.join(chunk)
+            separator = ','
+            chunk = []
+    if chunk:
+        yield separator + ','.join(chunk)
+    yield ']}'
+
+
+def iter_csv(store, chunk_size=500):
+    """Yield the buildings of the store as CSV text, in chunks of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for i, (way_id, lat, lon, area, type_code, osm_code) in enumerate(
+        store.records.tolist()
+    ):
+        writer.writerow(
+            [
+                i + 1,
+                way_id,
+                lat,
+                lon,
+                store.type_names[type_code] or '',
+                round(area, 1) if store.has_footprints else '',
+                store.osm_types[osm_code],
+                store.names[i],
+            ]
+        )
+        if (i + 1) % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
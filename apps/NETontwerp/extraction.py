@@ -0,0 +1,344 @@
+"""Building extraction for a polygon, usable outside a request context."""
+
+import hashlib
+import json
+import logging
+
+import numpy as np
+import requests
+import shapely
+
+from apps.NETontwerp.building_index import get_building_index
+from apps.NETontwerp.building_store import BuildingStore, get_result_store
+from apps.NETontwerp.buildings import (
+    AMPERE_PER_HOUSE,
+    extract_building_centers,
+    extract_house_store,
+    iter_building_center_batches,
+    iter_house_batches,
+)
+from apps.NETontwerp.overpass import fetch_building_elements
+from apps.NETontwerp.overpass_query import (
+    DETAIL_CENTERS,
+    DETAIL_FULL,
+    select_output_mode,
+)
+from apps.NETontwerp.singleflight import SingleFlight
+from apps.NETontwerp.tile_cache import get_tile_cache
+
+logger = logging.getLogger(__name__)
+
+extraction_flight = SingleFlight()
+
+MIN_ADDED_AREA = 1e-10  # degrees2; smaller parts are slivers of unchanged edges
+
+
+class ExtractionRequestError(ValueError):
+    """Invalid extraction request; the message is shown to the user."""
+
+
+def parse_extraction_request(data):
+    """Validate the JSON body of an extraction request.
+
+    Returns (polygon_coords, detail) or raises ExtractionRequestError.
+    """
+    data = data or {}
+    polygon_coords = data.get('polygon', [])
+    detail = data.get('detail', DETAIL_FULL)
+
+    if len(polygon_coords) < 3:
+        raise ExtractionRequestError('Polygon moet minimaal 3 punten hebben')
+
+    if detail not in (DETAIL_FULL, DETAIL_CENTERS):
+        raise ExtractionRequestError(f'Onbekend detailniveau: {detail}')
+
+    return polygon_coords, detail
+
+
+def extraction_settings(config):
+    """Snapshot the app config needed by run_extraction."""
+    return {
+        'index': get_building_index(config),
+        'cache': get_tile_cache(config),
+        'fetch_options': {
+            'subtile_size': config.get('OVERPASS_SUBTILE_SIZE', 0.02),
+            'max_workers': config.get('OVERPASS_MAX_PARALLEL', 3),
+            'urls': config.get('OVERPASS_URLS'),
+            'hedge_delay': config.get('OVERPASS_HEDGE_DELAY', 2.0),
+            'timeout': config.get('OVERPASS_TIMEOUT', 60),
+        },
+    }
+
+
+def _building_elements(polygon_coords, detail, settings, progress=None):
+    """Return (elements, detail) from the best available source."""
+
+    def fetch_progress(done, total):
+        if progress:
+            progress('fetch', done, total)
+
+    # The offline index always has footprints, so it answers every detail
+    # level. Otherwise footprints come from the tile cache where possible
+    # and the elements are streamed straight into the building pipeline.
+    index = settings['index']
+    if index is not None:
+        logger.info('Using offline building index')
+        return index.query_polygon(polygon_coords), DETAIL_FULL
+
+    elements = fetch_building_elements(
+        polygon_coords,
+        cache=settings['cache'],
+        output=select_output_mode(detail),
+        progress=fetch_progress,
+        **settings['fetch_options'],
+    )
+    return elements, detail
+
+
+def _extract_store(elements, polygon_coords, detail):
+    """Turn building elements into a BuildingStore for the detail level."""
+    if detail == DETAIL_CENTERS:
+        buildings = extract_building_centers(elements, polygon_coords)
+        return BuildingStore.from_buildings(buildings, polygon_coords, detail)
+    # Centroid-in-polygon test, area and classification for all ways at once
+    return extract_house_store(elements, polygon_coords)
+
+
+def result_summary(store):
+    """Totals of a stored result as the extraction endpoints report them."""
+    summary = {
+        'success': True,
+        'count': len(store),
+        'total_amperage': len(store) * AMPERE_PER_HOUSE,
+    }
+    if store.has_footprints:
+        summary['total_area_m2'] = round(store.total_area_m2(), 1)
+    else:
+        summary['detail'] = store.detail
+    return summary
+
+
+def run_extraction(polygon_coords, detail, settings, progress=None):
+    """Extract the buildings in a polygon and return the response payload.
+
+    progress(stage, done, total) is called while sub-areas are fetched
+    ('fetch') and once the buildings are being processed ('process'). The
+    buildings are kept in the result store under the returned result_id.
+    """
+    result_id = extraction_key(polygon_coords, detail)
+    elements, detail = _building_elements(polygon_coords, detail, settings, progress)
+
+    store = _extract_store(elements, polygon_coords, detail).sorted_by_id()
+    if progress:
+        progress('process', len(store), len(store))
+    logger.info(f'Found {len(store)} buildings ({detail})')
+    get_result_store().put(result_id, store)
+
+    result = result_summary(store)
+    result['result_id'] = result_id
+    result['buildings'] = store.to_buildings()
+    return result
+
+
+def _batch_stores(polygon_coords, detail, settings, progress):
+    """Return (detail, BuildingStore batches) classified as elements arrive."""
+    elements, detail = _building_elements(polygon_coords, detail, settings, progress)
+    if detail == DETAIL_CENTERS:
+        stores = (
+            BuildingStore.from_buildings(buildings, polygon_coords, detail)
+            for buildings in iter_building_center_batches(elements, polygon_coords)
+        )
+    else:
+        stores = iter_house_batches(elements, polygon_coords)
+    return detail, stores
+
+
+def _store_batches(result_id, batches, polygon_coords, detail):
+    """Keep the combined batches in the result store and return the totals."""
+    store = BuildingStore.concat(batches, polygon_coords, detail).sorted_by_id()
+    logger.info(f'Streamed {len(store)} buildings')
+    get_result_store().put(result_id, store)
+    return {'result_id': result_id, **result_summary(store)}
+
+
+def run_extraction_job(polygon_coords, detail, settings, progress, publish):
+    """Extract the buildings in a polygon for a background job.
+
+    Every non-empty batch is passed to publish(store) as soon as it is
+    classified. Returns the totals and result_id; the buildings themselves
+    are only kept in the result store.
+    """
+    result_id = extraction_key(polygon_coords, detail)
+    detail, stores = _batch_stores(polygon_coords, detail, settings, progress)
+    batches = []
+    for batch in stores:
+        if len(batch):
+            batches.append(batch)
+            publish(batch)
+    count = sum(len(batch) for batch in batches)
+    progress('process', count, count)
+    return _store_batches(result_id, batches, polygon_coords, detail)
+
+
+def iter_extraction_records(polygon_coords, detail, settings):
+    """Yield the extraction result as a sequence of records.
+
+    Buildings are classified in batches while the elements stream in and
+    every batch is yielded as a {'type': 'batch', 'buildings': [...]}
+    record, interleaved with {'type': 'progress', ...} records for fetched
+    sub-areas. The last record is {'type': 'summary', ...} with the totals
+    and result_id run_extraction would return, or {'type': 'error', ...}.
+    """
+    result_id = extraction_key(polygon_coords, detail)
+    updates = []
+
+    def progress(stage, done, total):
+        updates.append(
+            {'type': 'progress', 'stage': stage, 'done': done, 'total': total}
+        )
+
+    batches = []
+    try:
+        detail, stores = _batch_stores(polygon_coords, detail, settings, progress)
+        for batch in stores:
+            yield from updates
+            updates.clear()
+            if len(batch):
+                batches.append(batch)
+                yield {'type': 'batch', 'buildings': batch.to_buildings()}
+        yield from updates
+    except Exception as e:
+        yield {'type': 'error', 'error': extraction_error_message(e)}
+        return
+
+    summary = _store_batches(result_id, batches, polygon_coords, detail)
+    yield {'type': 'summary', **summary}
+
+
+def _valid_polygon(polygon_coords):
+    polygon = shapely.Polygon(polygon_coords)
+    if not polygon.is_valid:
+        polygon = shapely.make_valid(polygon)
+    return polygon
+
+
+def run_incremental_extraction(polygon_coords, detail, previous_id, settings):
+    """Update a previous result for an edited polygon and return a delta.
+
+    Only the area that was added to the polygon is fetched; buildings of
+    the previous result whose center is now outside the polygon are
+    removed. The response has the added buildings under 'buildings', the
+    removed ids under 'removed' and the totals of the updated result.
+
+    Returns None when the previous result is unknown or has another detail
+    level, so the caller can fall back to a full extraction.
+    """
+    previous = get_result_store().get(previous_id)
+    expected_detail = DETAIL_FULL if settings['index'] is not None else detail
+    if previous is None or previous.detail != expected_detail:
+        return None
+
+    new_area = _valid_polygon(polygon_coords)
+    shapely.prepare(new_area)
+    added_area = shapely.difference(new_area, _valid_polygon(previous.polygon_coords))
+    added_parts = [
+        [list(coord) for coord in part.exterior.coords[:-1]]
+        for part in shapely.get_parts(added_area)
+        if isinstance(part, shapely.Polygon) and part.area > MIN_ADDED_AREA
+    ]
+
+    inside = shapely.contains_xy(
+        new_area, previous.records['lat'], previous.records['lon']
+    )
+    kept = previous.select(inside)
+    removed = previous.records['id'][~inside].tolist()
+
+    parts = []
+    for part_coords in added_parts:
+        elements, part_detail = _building_elements(part_coords, detail, settings)
+        parts.append(_extract_store(elements, polygon_coords, part_detail))
+    added = BuildingStore.concat(parts, polygon_coords, previous.detail)
+
+    # Ways crossing the old outline or several added parts come back again
+    ids = added.records['id']
+    is_new = np.zeros(len(added), dtype=bool)
+    is_new[np.unique(ids, return_index=True)[1]] = True
+    is_new &= ~np.isin(ids, kept.records['id'])
+    added = added.select(is_new)
+
+    logger.info(
+        f'Incremental extraction: {len(added_parts)} added parts, '
+        f'{len(added)} buildings added, {len(removed)} removed'
+    )
+
+    store = BuildingStore.concat([kept, added], polygon_coords, previous.detail)
+    store = store.sorted_by_id()
+    result_id = extraction_key(polygon_coords, detail)
+    get_result_store().put(result_id, store)
+
+    result = result_summary(store)
+    result.update(
+        {
+            'result_id': result_id,
+            'previous': previous_id,
+            'delta': True,
+            'buildings': added.to_buildings(),
+            'removed': removed,
+        }
+    )
+    return result
+
+
+def run_extraction_coalesced(polygon_coords, detail, settings, progress=None):
+    """run_extraction, shared between identical concurrent requests.
+
+    Requests for the same normalized polygon and detail level that arrive
+    while one is being processed wait for it and get the same result.
+    """
+    result, shared = extraction_flight.do(
+        extraction_key(polygon_coords, detail),
+        lambda: run_extraction(polygon_coords, detail, settings, progress),
+    )
+    if shared:
+        logger.info('Coalesced identical extraction request')
+    return result
+
+
+def extraction_error_message(error):
+    """User-facing message for an exception raised by run_extraction."""
+    if isinstance(error, requests.RequestException):
+        logger.error(f'Overpass API error: {error}')
+        return f'API fout: {str(error)}'
+    logger.error(f'Building extraction error: {error}')
+    return f'Extractie fout: {str(error)}'
+
+
+def normalize_polygon(polygon_coords, precision=6):
+    """Canonical form of a polygon for comparing requests.
+
+    Coordinates are rounded, a closing point is dropped, the ring is
+    oriented counter-clockwise and starts at its smallest vertex, so the
+    same shape drawn from another corner or direction compares equal.
+    """
+    points = [
+        (round(float(lat), precision), round(float(lon), precision))
+        for lat, lon in polygon_coords
+    ]
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+
+    signed_area = sum(
+        x0 * y1 - x1 * y0
+        for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1], strict=True)
+    )
+    if signed_area < 0:
+        points.reverse()
+
+    start = points.index(min(points))
+    return points[start:] + points[:start]
+
+
+def extraction_key(polygon_coords, detail):
+    """Stable key for an extraction request, used to deduplicate work."""
+    payload = json.dumps([normalize_polygon(polygon_coords), detail])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
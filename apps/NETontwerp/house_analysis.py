@@ -1,72 +1,343 @@
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import cv2
+import numpy as np
+
+from apps.NETontwerp.pdf_pages import PDF_DPI, is_pdf, iter_pdf_pages
+
+# Threshold profiles for the contour filter, picked with
+# HOUSE_DETECTION_PROFILE. Areas are in pixels.
+DETECTION_PROFILES = {
+    'default': {
+        'min_area': 1500,
+        'max_area': 100000,
+        'min_solidity': 0.7,
+        'max_aspect_ratio': 5.0,
+    },
+    # Screenshots zoomed out further, where houses are a few hundred pixels
+    'zoomed_out': {
+        'min_area': 400,
+        'max_area': 25000,
+        'min_solidity': 0.7,
+        'max_aspect_ratio': 5.0,
+    },
+}
+DETECTION_PARAMS = DETECTION_PROFILES['default']
 
+# Images of at least TILED_MIN_PIXELS are split into TILE_SIZE tiles that
+# are processed in parallel. Every tile is read with TILE_MARGIN extra pixels
+# on each side, which must exceed half the size of the largest house so that
+# each house lies completely inside the tile that owns its center.
+TILE_SIZE = 2048
+TILE_MARGIN = 512
+TILED_MIN_PIXELS = 8_000_000
 
-def calculate_shape_properties(contour):
-    """Calculate properties of a shape."""
-    area = cv2.contourArea(contour)
-    hull = cv2.convexHull(contour)
-    hull_area = cv2.contourArea(hull)
-    solidity = area / hull_area if hull_area > 0 else 0
+IMAGE_MIMETYPES = {'.png': 'image/png', '.jpg': 'image/jpeg'}
 
-    x, y, w, h = cv2.boundingRect(contour)
-    aspect_ratio = max(w, h) / min(w, h) if min(w, h) > 0 else 0
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
 
-    return {
-        'area': area,
-        'solidity': solidity,
-        'aspect_ratio': aspect_ratio,
-        'width': w,
-        'height': h,
-    }
+
+def detection_params(profile=None, **overrides):
+    """Return the thresholds of a profile, with single values overridden."""
+    if profile is not None and profile not in DETECTION_PROFILES:
+        raise ValueError(f'Onbekend detectieprofiel: {profile}')
+    params = dict(DETECTION_PROFILES[profile or 'default'])
+    params.update({key: value for key, value in overrides.items() if value is not None})
+    return params
+
+
+def _bounding_boxes(contours):
+    """Bounding boxes (x, y, w, h) of all contours at once, as boundingRect."""
+    counts = np.array([len(contour) for contour in contours], dtype=np.int64)
+    points = np.concatenate(contours).reshape(-1, 2)
+    starts = np.cumsum(counts) - counts
+    low = np.minimum.reduceat(points, starts)
+    high = np.maximum.reduceat(points, starts)
+    return counts, low, high - low + 1
+
+
+def filter_house_contours(contours, params=DETECTION_PARAMS):
+    """Keep the contours that pass the thresholds in params.
+
+    The checks run cheapest first: the point counts and bounding boxes of
+    all contours are checked together (a contour never covers more than
+    its box, and the aspect ratio only needs the box), then the area is
+    computed for the remaining contours and the convex hull only for those
+    within the area limits.
+    """
+    if not contours:
+        return []
+
+    counts, _, size = _bounding_boxes(contours)
+    short_side = size.min(axis=1)
+    long_side = size.max(axis=1)
+    candidates = (
+        (counts >= 3)
+        & (size[:, 0] * size[:, 1] >= params['min_area'])
+        & (long_side <= params['max_aspect_ratio'] * short_side)
+    )
+
+    house_shapes = []
+    for i in np.flatnonzero(candidates).tolist():
+        contour = contours[i]
+        area = cv2.contourArea(contour)
+        if area < params['min_area'] or area > params['max_area']:
+            continue
+
+        hull_area = cv2.contourArea(cv2.convexHull(contour))
+        solidity = area / hull_area if hull_area > 0 else 0
+        if solidity < params['min_solidity']:
+            continue
+
+        house_shapes.append(contour)
+
+    return house_shapes
+
+
+def find_house_contours(gray, params=DETECTION_PARAMS):
+    """Return the contours in a grayscale image that look like houses."""
+    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    return filter_house_contours(contours, params)
+
+
+def plan_tiles(width, height, tile_size=TILE_SIZE, margin=TILE_MARGIN):
+    """Split an image into tiles.
+
+    Returns (core, window) pairs of (x0, y0, x1, y1) boxes: the cores cover
+    the image without overlap, each window is its core plus the margin.
+    """
+    tiles = []
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            core = (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+            window = (
+                max(core[0] - margin, 0),
+                max(core[1] - margin, 0),
+                min(core[2] + margin, width),
+                min(core[3] + margin, height),
+            )
+            tiles.append((core, window))
+    return tiles
+
+
+def _detect_tile(gray, core, window, image_size, params):
+    """Detect the houses owned by one tile, in image coordinates.
+
+    A contour is kept when the center of its bounding box lies in the core
+    and it does not touch a window edge inside the image; a contour cut off
+    by the window is found whole by the tile that owns it.
+    """
+    width, height = image_size
+    wx0, wy0, wx1, wy1 = window
+    cx0, cy0, cx1, cy1 = core
+    owned = []
+    for contour in find_house_contours(gray, params):
+        x, y, w, h = cv2.boundingRect(contour)
+        if (
+            (x <= 0 < wx0)
+            or (y <= 0 < wy0)
+            or (x + w >= wx1 - wx0 and wx1 < width)
+            or (y + h >= wy1 - wy0 and wy1 < height)
+        ):
+            continue
+        center_x = wx0 + x + w // 2
+        center_y = wy0 + y + h // 2
+        if cx0 <= center_x < cx1 and cy0 <= center_y < cy1:
+            contour += (wx0, wy0)
+            owned.append(contour)
+    return owned
+
+
+def _init_worker():
+    # The pool already uses every core, one OpenCV thread per process
+    cv2.setNumThreads(1)
+
+
+def get_detection_pool(workers=None):
+    """Return the process pool shared by tiled detections."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None:
+            _pool_workers = workers or os.cpu_count()
+            _pool = ProcessPoolExecutor(
+                max_workers=_pool_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def shutdown_detection_pool():
+    """Stop the worker processes of tiled detection, if they were started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
 
 
-def detect_houses_from_image(image_path):
+def find_house_contours_tiled(
+    gray, params=DETECTION_PARAMS, tile_size=TILE_SIZE, margin=TILE_MARGIN, workers=None
+):
+    """find_house_contours over overlapping tiles on a process pool."""
+    height, width = gray.shape[:2]
+    pool = get_detection_pool(workers)
+    futures = [
+        pool.submit(
+            _detect_tile,
+            gray[window[1] : window[3], window[0] : window[2]],
+            core,
+            window,
+            (width, height),
+            params,
+        )
+        for core, window in plan_tiles(width, height, tile_size, margin)
+    ]
+    return [contour for future in futures for contour in future.result()]
+
+
+def reading_order(house_shapes):
+    """Sort contours top to bottom, then left to right, by their bounding box.
+
+    Tiled and untiled detection find the same contours in a different
+    order; sorting gives the houses the same numbers either way.
+    """
+    boxes = [cv2.boundingRect(shape) for shape in house_shapes]
+    order = sorted(range(len(house_shapes)), key=lambda i: (boxes[i][1], boxes[i][0]))
+    return [house_shapes[i] for i in order]
+
+
+def decode_image(data):
+    """Decode uploaded image bytes into a BGR image."""
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('Could not decode image')
+    return image
+
+
+def detect_houses(
+    image,
+    params=DETECTION_PARAMS,
+    tiled=None,
+    tile_size=TILE_SIZE,
+    margin=TILE_MARGIN,
+    workers=None,
+):
+    """Detect houses in a BGR image.
+
+    Large images are processed in tiles on a process pool unless tiled is
+    given explicitly.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if tiled is None:
+        tiled = gray.size >= TILED_MIN_PIXELS
+
+    if tiled:
+        house_shapes = find_house_contours_tiled(
+            gray, params, tile_size=tile_size, margin=margin, workers=workers
+        )
+    else:
+        house_shapes = find_house_contours(gray, params)
+
+    return reading_order(house_shapes)
+
+
+def detect_houses_from_image(image_path, params=DETECTION_PARAMS, **options):
     """Detect houses in uploaded image."""
     image = cv2.imread(str(image_path))
     if image is None:
         raise ValueError(f'Could not load image from {image_path}')
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
-    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    return image, detect_houses(image, params, **options)
 
-    params = {
-        'min_area': 1500,
-        'max_area': 100000,
-        'min_solidity': 0.7,
-        'max_aspect_ratio': 5.0,
+
+def encode_detection_image(image, extension='.png'):
+    """Encode an image for serving, returning (bytes, mimetype)."""
+    if extension not in IMAGE_MIMETYPES:
+        extension = '.png'
+    ok, encoded = cv2.imencode(extension, image)
+    if not ok:
+        raise ValueError('Could not encode detection image')
+    return encoded.tobytes(), IMAGE_MIMETYPES[extension]
+
+
+def _detection_page(image, house_shapes, extension):
+    house_count = annotate_house_detections(image, house_shapes)
+    return {
+        'house_count': house_count,
+        'image': encode_detection_image(image, extension),
     }
 
-    house_shapes = []
-    for contour in contours:
-        props = calculate_shape_properties(contour)
 
-        if props['area'] < params['min_area'] or props['area'] > params['max_area']:
-            continue
+def _detect_pdf_page(image, params):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    house_shapes = reading_order(find_house_contours(gray, params))
+    return _detection_page(image, house_shapes, '.png')
 
-        if props['solidity'] < params['min_solidity']:
-            continue
 
-        if props['aspect_ratio'] > params['max_aspect_ratio']:
-            continue
+def detect_houses_in_pdf(
+    pdf_source, params=DETECTION_PARAMS, dpi=PDF_DPI, workers=None
+):
+    """Detect houses on every page of a PDF, one page per pool worker.
 
-        house_shapes.append(contour)
+    Pages are rendered here, straight from the uploaded bytes, while the
+    workers detect and draw the houses and encode the result as PNG. At
+    most one page per worker is submitted at a time, so only that many
+    rendered pages are in memory. Returns a page dict per page, as
+    described in detect_houses_in_upload.
+    """
+    pool = get_detection_pool(workers)
+    # The shared pool may have been started with another worker count
+    in_flight = _pool_workers
+    pending = deque()
+    pages = []
+    for _, image in iter_pdf_pages(pdf_source, dpi):
+        if len(pending) >= in_flight:
+            pages.append(pending.popleft().result())
+        pending.append(pool.submit(_detect_pdf_page, image, params))
+    pages.extend(future.result() for future in pending)
+    return pages
 
-    return image, house_shapes
 
+def detect_houses_in_upload(
+    data, params=DETECTION_PARAMS, extension='.png', dpi=PDF_DPI, **options
+):
+    """Detect houses in uploaded image or PDF bytes.
 
-def draw_house_detections(image, house_shapes, output_path):
-    """Draw detected houses and save result."""
-    result = image.copy()
+    Returns a dict per page (a single one for an image) with the
+    house_count and the annotated image as (bytes, mimetype).
+    """
+    if is_pdf(data):
+        workers = options.get('workers')
+        pages = detect_houses_in_pdf(data, params, dpi=dpi, workers=workers)
+        if not pages:
+            raise ValueError("Het PDF-bestand bevat geen pagina's")
+        return pages
+
+    image = decode_image(data)
+    house_shapes = detect_houses(image, params, **options)
+    # The decoded upload is not needed afterwards, draw on it directly
+    return [_detection_page(image, house_shapes, extension)]
+
+
+def annotate_house_detections(image, house_shapes):
+    """Draw detected houses onto the image itself and return their count."""
     for i, shape in enumerate(house_shapes):
-        cv2.drawContours(result, [shape], 0, (0, 255, 0), 2)
+        cv2.drawContours(image, [shape], 0, (0, 255, 0), 2)
 
         M = cv2.moments(shape)
         if M['m00'] != 0:
             cx = int(M['m10'] / M['m00'])
             cy = int(M['m01'] / M['m00'])
             cv2.putText(
-                result,
+                image,
                 str(i + 1),
                 (cx, cy),
                 cv2.FONT_HERSHEY_SIMPLEX,
@@ -75,5 +346,12 @@ def draw_house_detections(image, house_shapes, output_path):
                 2,
             )
 
-    cv2.imwrite(str(output_path), result)
     return len(house_shapes)
+
+
+def draw_house_detections(image, house_shapes, output_path):
+    """Draw detected houses and save result."""
+    result = image.copy()
+    house_count = annotate_house_detections(result, house_shapes)
+    cv2.imwrite(str(output_path), result)
+    return house_count
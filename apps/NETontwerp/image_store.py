@@ -0,0 +1,64 @@
+"""In-memory, content-addressed store for annotated detection images.
+
+Detection results are encoded once and kept here under the SHA-256 of
+their bytes, so the result pages can serve them without writing or
+reading a file. The same image always gets the same key, which makes the
+responses safe to cache for good. The JSON list of the pages of a PDF
+upload is kept here as well, so the session only holds its key.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class ImageStore:
+    """Keeps encoded images by content hash, least recently used out first."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, data, mimetype):
+        """Store encoded image bytes and return their key."""
+        key = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return key
+            self._images[key] = (data, mimetype)
+            self._size += len(data)
+            # Never evict the image that was just stored
+            while self._size > self.max_bytes and len(self._images) > 1:
+                _, (evicted, _) = self._images.popitem(last=False)
+                self._size -= len(evicted)
+        return key
+
+    def get(self, key):
+        """Return (data, mimetype) for a key, or None when it is unknown."""
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def stats(self):
+        with self._lock:
+            return {'images': len(self._images), 'bytes': self._size}
+
+
+def get_image_store(config):
+    """Return the process-wide ImageStore, sized from the app config."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            max_bytes = config.get('DETECTION_IMAGE_STORE_MAX_BYTES', DEFAULT_MAX_BYTES)
+            _store = ImageStore(max_bytes=max_bytes)
+        return _store
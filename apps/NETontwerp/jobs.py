@@ -0,0 +1,185 @@
+"""Background building extraction jobs for the map page.
+
+A POST creates a job and returns its id right away; a bounded thread pool
+does the Overpass fetch and processing while the browser polls the status
+endpoint or listens to its Server-Sent Events. Batches of buildings that
+are ready before the job finishes are published on the job, so the map
+can draw them without holding a request open. Jobs live in the memory of
+the web process, so the app must run as one gunicorn process with threads
+(see the deployment notes in README.md).
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+BATCH_RETENTION = 60  # seconds the batches of a finished job are kept
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+class ExtractionJob:
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = JOB_QUEUED
+        self.stage = None
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.batches = []
+        self.batch_count = 0
+        self.created_at = time.time()
+        self.finished_at = None
+        self.version = 0
+
+    @property
+    def finished(self):
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def to_dict(self, include_result=True):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': {'stage': self.stage, 'done': self.done, 'total': self.total},
+            'batches': self.batch_count,
+        }
+        if self.error:
+            data['error'] = self.error
+        if include_result and self.result is not None:
+            data['result'] = self.result
+        return data
+
+
+class JobManager:
+    """Runs extraction jobs on a bounded pool and deduplicates submissions.
+
+    A submission whose key matches a queued, running or recently finished
+    successful job gets that job back instead of starting new work.
+    """
+
+    def __init__(self, max_workers=4, ttl=3600, max_jobs=500):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='extraction-job'
+        )
+        self._jobs = {}
+        self._by_key = {}
+        self._changed = threading.Condition()
+
+    def submit(self, key, func, error_message, reusable=None):
+        """Queue func(progress, publish) unless an equivalent job exists.
+
+        publish(batch) makes a partial result available through
+        batches_since until the job finishes. error_message(exc) turns a
+        failure into the message stored on the job. A finished job for
+        which reusable(job) is false is replaced by a new one. Returns
+        (job, created).
+        """
+        with self._changed:
+            self._cleanup()
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None and existing.status == JOB_DONE:
+                if reusable is not None and not reusable(existing):
+                    existing = None
+            if existing is not None and existing.status != JOB_FAILED:
+                logger.info(f'Deduplicated extraction job {existing.id}')
+                return existing, False
+
+            job = ExtractionJob(key)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+
+        self._executor.submit(self._run, job, func, error_message)
+        return job, True
+
+    def get(self, job_id):
+        with self._changed:
+            return self._jobs.get(job_id)
+
+    def batches_since(self, job, start):
+        """Return (batches, next_start) for the batches published from start.
+
+        The result has all buildings, so the batches of a finished job are
+        only kept for BATCH_RETENTION seconds, for listeners that are still
+        catching up.
+        """
+        with self._changed:
+            return job.batches[start:], job.batch_count
+
+    def wait_for_change(self, job, version, timeout=15):
+        """Block until the job changed after version or the timeout passed."""
+        with self._changed:
+            self._changed.wait_for(lambda: job.version != version, timeout=timeout)
+            return job.version
+
+    def _update(self, job, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.version += 1
+            self._changed.notify_all()
+
+    def _run(self, job, func, error_message):
+        self._update(job, status=JOB_RUNNING)
+
+        def progress(stage, done, total):
+            self._update(job, stage=stage, done=done, total=total)
+
+        def publish(batch):
+            with self._changed:
+                job.batches.append(batch)
+                job.batch_count += 1
+                job.version += 1
+                self._changed.notify_all()
+
+        try:
+            result = func(progress, publish)
+        except Exception as e:
+            self._update(
+                job, status=JOB_FAILED, error=error_message(e), finished_at=time.time()
+            )
+            return
+        self._update(job, status=JOB_DONE, result=result, finished_at=time.time())
+
+    def _cleanup(self):
+        now = time.time()
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished),
+            key=lambda job: job.finished_at,
+        )
+        for job in finished:
+            if now - job.finished_at > BATCH_RETENTION:
+                job.batches = []
+        excess = len(self._jobs) - self.max_jobs
+        for job in finished:
+            if now - job.finished_at <= self.ttl and excess <= 0:
+                break
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) == job.id:
+                del self._by_key[job.key]
+            excess -= 1
+
+
+def get_job_manager(config):
+    """Return the process-wide JobManager for the app config."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(
+                max_workers=config.get('EXTRACTION_WORKERS', 4),
+                ttl=config.get('EXTRACTION_JOB_TTL', 3600),
+            )
+        return _manager
@@ -0,0 +1,255 @@
+"""Incremental parsing of Overpass JSON into compact building way storage.
+
+Overpass responses can be hundreds of MB. Instead of loading them with
+response.json(), elements are decoded one at a time from the byte stream,
+node coordinates go into flat arrays and building ways are resolved to
+coordinates as they arrive, so memory grows with the buildings kept rather
+than with the raw payload.
+"""
+
+import codecs
+import json
+import re
+from array import array
+
+import numpy as np
+
+_ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+_SEPARATOR = re.compile(r'[\s,]*')
+MAX_HEADER_CHARS = 1024 * 1024
+
+
+def iter_overpass_elements(chunks):
+    """Yield the items of the "elements" array from an iterable of byte chunks."""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    in_elements = False
+
+    for chunk in chunks:
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+
+        if not in_elements:
+            match = _ELEMENTS_START.search(buffer)
+            if match is None:
+                if len(buffer) > MAX_HEADER_CHARS:
+                    raise ValueError('No elements array in Overpass response')
+                continue
+            pos = match.end()
+            in_elements = True
+
+        while True:
+            pos = _SEPARATOR.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == ']':
+                return
+            try:
+                element, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # element continues in the next chunk
+            yield element
+
+    raise ValueError('Truncated Overpass response')
+
+
+class NodeStore:
+    """Array-backed node id -> (lat, lon) lookup."""
+
+    def __init__(self):
+        self._ids = array('q')
+        self._coords = array('d')
+        self._sorted_ids = None
+        self._sorted_coords = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def dirty(self):
+        return self._sorted_ids is None or len(self._sorted_ids) != len(self._ids)
+
+    @property
+    def stale(self):
+        """True when nodes were added after the last sort."""
+        return self._sorted_ids is not None and self.dirty
+
+    def add(self, node_id, lat, lon):
+        self._ids.append(node_id)
+        self._coords.append(lat)
+        self._coords.append(lon)
+
+    def _sort(self):
+        ids = np.frombuffer(self._ids, dtype=np.int64).copy()
+        coords = np.frombuffer(self._coords, dtype=np.float64).reshape(-1, 2)
+        order = np.argsort(ids, kind='stable')
+        self._sorted_ids = ids[order]
+        self._sorted_coords = coords[order]
+
+    def lookup(self, refs):
+        """Return (coords, found) for an int64 array of node ids."""
+        if self.dirty:
+            self._sort()
+        if not len(self._sorted_ids):
+            return np.empty((0, 2)), np.zeros(len(refs), dtype=bool)
+        pos = np.searchsorted(self._sorted_ids, refs)
+        pos = np.minimum(pos, len(self._sorted_ids) - 1)
+        found = self._sorted_ids[pos] == refs
+        return self._sorted_coords[pos[found]], found
+
+
+class BuildingWays:
+    """Resolved building ways as ragged coordinate arrays.
+
+    The coordinates of way i are coords[offsets[i]:offsets[i + 1]] as
+    (lat, lon) rows.
+    """
+
+    def __init__(self, ids, coords, offsets, osm_types, names):
+        self.ids = ids
+        self.coords = coords
+        self.offsets = offsets
+        self.osm_types = osm_types
+        self.names = names
+
+    def __len__(self):
+        return len(self.ids)
+
+    def way_coords(self, i):
+        return self.coords[self.offsets[i] : self.offsets[i + 1]]
+
+
+class BuildingCollector:
+    """Consumes Overpass elements and keeps only resolved building ways.
+
+    Ways may refer to nodes (``out body`` / ``out skel``) or carry their own
+    ``geometry`` (``out geom`` and cached tiles). Ways whose nodes are all
+    known on arrival are resolved immediately; others wait until finish()
+    and then skip missing nodes. Duplicate way ids are ignored.
+    """
+
+    def __init__(self):
+        self.nodes = NodeStore()
+        self._ids = array('q')
+        self._seq = array('q')
+        self._coords = array('d')
+        self._offsets = array('q', [0])
+        self._osm_types = []
+        self._names = []
+        self._seen = set()
+        self._pending = []
+        self._count = 0
+
+    def add(self, element):
+        kind = element.get('type')
+        if kind == 'node':
+            self.nodes.add(element['id'], element['lat'], element['lon'])
+            return
+        if kind != 'way' or element['id'] in self._seen:
+            return
+        tags = element.get('tags', {})
+        if 'building' not in tags:
+            return
+
+        self._seen.add(element['id'])
+        seq = self._count
+        self._count += 1
+        meta = (element['id'], tags.get('building', 'yes'), tags.get('name', ''))
+
+        if 'geometry' in element:
+            coords = [
+                (point['lat'], point['lon']) for point in element['geometry'] if point
+            ]
+            self._append(seq, meta, np.asarray(coords, dtype=np.float64))
+            return
+
+        refs = np.fromiter(element.get('nodes', []), dtype=np.int64)
+        # Ways are resolved on arrival as long as that costs one sort of the
+        # node store; in any other order they wait for finish().
+        if self._pending or not len(self.nodes) or self.nodes.stale:
+            self._pending.append((seq, meta, refs))
+            return
+        coords, found = self.nodes.lookup(refs)
+        if found.all():
+            self._append(seq, meta, coords)
+        else:
+            self._pending.append((seq, meta, refs))
+
+    def add_all(self, elements):
+        for element in elements:
+            self.add(element)
+        return self
+
+    def _append(self, seq, meta, coords):
+        way_id, osm_type, name = meta
+        self._ids.append(way_id)
+        self._seq.append(seq)
+        self._coords.extend(coords.reshape(-1).tolist())
+        self._offsets.append(self._offsets[-1] + len(coords))
+        self._osm_types.append(osm_type)
+        self._names.append(name)
+
+    @property
+    def ready(self):
+        """Number of resolved ways not yet taken by drain() or finish()."""
+        return len(self._ids)
+
+    def drain(self):
+        """Take the ways resolved so far, leaving waiting ways for later.
+
+        Way ids already seen stay deduplicated, so draining repeatedly while
+        elements stream in yields every building exactly once.
+        """
+        return self._take()
+
+    def finish(self):
+        """Resolve waiting ways and return the BuildingWays in arrival order."""
+        if self._pending:
+            counts = np.array([len(p[2]) for p in self._pending], dtype=np.int64)
+            refs = np.concatenate([p[2] for p in self._pending])
+            coords, found = self.nodes.lookup(refs)
+            way_of_ref = np.repeat(np.arange(len(counts)), counts)
+            ends = np.cumsum(np.bincount(way_of_ref[found], minlength=len(counts)))
+            start = 0
+            for (seq, meta, _), end in zip(self._pending, ends.tolist(), strict=True):
+                self._append(seq, meta, coords[start:end])
+                start = end
+            self._pending = []
+        return self._take()
+
+    def _take(self):
+        ids = np.frombuffer(self._ids, dtype=np.int64).copy()
+        seq = np.frombuffer(self._seq, dtype=np.int64).copy()
+        coords = np.frombuffer(self._coords, dtype=np.float64).copy().reshape(-1, 2)
+        offsets = np.frombuffer(self._offsets, dtype=np.int64).copy()
+        osm_types = self._osm_types
+        names = self._names
+
+        self._ids = array('q')
+        self._seq = array('q')
+        self._coords = array('d')
+        self._offsets = array('q', [0])
+        self._osm_types = []
+        self._names = []
+
+        if len(seq) and np.any(np.diff(seq) < 0):
+            order = np.argsort(seq, kind='stable')
+            counts = np.diff(offsets)[order]
+            starts = offsets[:-1][order]
+            point_index = np.repeat(starts - np.cumsum(counts) + counts, counts)
+            point_index += np.arange(int(counts.sum()))
+            coords = coords[point_index]
+            offsets = np.zeros(len(order) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            ids = ids[order]
+            osm_types = [osm_types[i] for i in order]
+            names = [names[i] for i in order]
+
+        return BuildingWays(ids, coords, offsets, osm_types, names)
+
+
+def collect_buildings(elements):
+    """Collect the building ways from an iterable of Overpass elements."""
+    return BuildingCollector().add_all(elements).finish()
@@ -0,0 +1,529 @@
+"""Fetching building data from the public Overpass API mirrors."""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from functools import partial
+
+import requests
+import requests.adapters
+
+from apps.NETontwerp.osm_stream import collect_buildings, iter_overpass_elements
+from apps.NETontwerp.overpass_query import (
+    OUTPUT_GEOMETRY,
+    SUBTILE_SIZE,
+    build_buildings_query,
+    polygon_bbox,
+    split_polygon,
+)
+
+logger = logging.getLogger(__name__)
+
+OVERPASS_URLS = [
+    'https://overpass-api.de/api/interpreter',
+    'https://overpass.kumi.systems/api/interpreter',
+    'https://overpass.openstreetmap.ru/api/interpreter',
+]
+
+HEDGE_DELAY = 2.0  # seconds before the next mirror is raced
+REQUEST_TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+MAX_PARALLEL = 3  # concurrent sub-area queries, kept low for the public mirrors
+ERROR_PENALTY = 10.0  # seconds added to a mirror's score per unit of error rate
+MAX_RETRIES = 2  # extra rounds over all mirrors when every mirror failed
+RETRY_BACKOFF = 1.0  # seconds, doubled per retry and jittered
+BREAKER_COOLDOWN = 300  # seconds a failing mirror is skipped
+
+
+class MirrorStats:
+    """Tracks smoothed latency and error rate per mirror to order them."""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._abandoned = {}
+
+    def record(self, url, latency, ok):
+        with self._lock:
+            stats = self._stats.setdefault(
+                url,
+                {'latency': latency, 'error_rate': 0.0, 'requests': 0, 'failures': 0},
+            )
+            stats['requests'] += 1
+            if ok:
+                stats['latency'] += self.alpha * (latency - stats['latency'])
+            else:
+                stats['failures'] += 1
+            error = 0.0 if ok else 1.0
+            stats['error_rate'] += self.alpha * (error - stats['error_rate'])
+
+    def record_latency(self, url, latency):
+        """Add a latency sample that says nothing about the mirror's health."""
+        with self._lock:
+            stats = self._stats.setdefault(
+                url,
+                {'latency': latency, 'error_rate': 0.0, 'requests': 0, 'failures': 0},
+            )
+            stats['latency'] += self.alpha * (latency - stats['latency'])
+
+    def record_abandoned(self, url):
+        """Count an attempt that lost the race and was left to finish alone.
+
+        A failure is recorded when it completes, an answer only adds its
+        latency: its body is never read, so it does not count as healthy.
+        """
+        with self._lock:
+            self._abandoned[url] = self._abandoned.get(url, 0) + 1
+
+    def score(self, url):
+        stats = self._stats.get(url)
+        if stats is None:
+            return 0.0  # untried mirrors go first so they get measured
+        return stats['latency'] + ERROR_PENALTY * stats['error_rate']
+
+    def order(self, urls):
+        """Return the mirrors sorted from most to least preferred."""
+        with self._lock:
+            return sorted(urls, key=self.score)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {url: dict(stats) for url, stats in self._stats.items()}
+            for url, count in self._abandoned.items():
+                snapshot.setdefault(url, {})['abandoned'] = count
+            return snapshot
+
+
+class CircuitBreaker:
+    """Skips a mirror for a cool-down window after repeated failures.
+
+    After failure_threshold consecutive failures the breaker opens. Once
+    the cool-down has passed one trial request is let through (half-open):
+    its success closes the breaker, its failure restarts the cool-down.
+    Other requests skip the mirror until the trial has an outcome, or
+    until it is released without one.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=300):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        """True when a request may go to the mirror now.
+
+        In the half-open state this claims the single trial request; a
+        trial that never reports back is given up after another cool-down.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.cooldown:
+                return False
+            if self._trial_at is not None and now - self._trial_at < self.cooldown:
+                return False
+            self._trial_at = now
+            return True
+
+    def release(self):
+        """End a trial request that gave no verdict on the mirror."""
+        with self._lock:
+            self._trial_at = None
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+            self._trial_at = None
+
+
+class HedgeCancelled(requests.RequestException):
+    """Raised by a hedged attempt that lost the race to another mirror."""
+
+
+def _is_mirror_failure(error):
+    """True for errors that say something about the mirror, not the query."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return True
+
+
+class OverpassClient:
+    """Pooled, hedged access to the Overpass mirrors.
+
+    One keep-alive session is shared by all requests, responses are
+    transferred gzip-compressed, every mirror has a circuit breaker, and a
+    round in which all mirrors fail is retried a bounded number of times
+    with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        max_retries=MAX_RETRIES,
+        backoff=RETRY_BACKOFF,
+        failure_threshold=3,
+        cooldown=BREAKER_COOLDOWN,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.mirror_stats = MirrorStats()
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(
+            {'User-Agent': 'NETontwerp/1.0', 'Accept-Encoding': 'gzip, deflate'}
+        )
+
+    def breaker(self, url):
+        with self._lock:
+            breaker = self._breakers.get(url)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.cooldown)
+                self._breakers[url] = breaker
+            return breaker
+
+    def stats(self):
+        """Per-mirror latency, error rate, request counts and breaker state."""
+        stats = self.mirror_stats.snapshot()
+        with self._lock:
+            breakers = dict(self._breakers)
+        for url, breaker in breakers.items():
+            entry = stats.setdefault(url, {})
+            entry['breaker'] = breaker.state
+            entry['consecutive_failures'] = breaker.failures
+        return stats
+
+    def _open_mirror(self, url, query, timeout, cancelled):
+        """POST the query and return the response once its headers are in.
+
+        Failures are recorded right away. An answer is only recorded by
+        read_elements once its body has been read, so the response keeps
+        its mirror and latency.
+        """
+        start = time.monotonic()
+        breaker = self.breaker(url)
+        try:
+            response = self.session.post(
+                url, data={'data': query}, timeout=timeout, stream=True
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            if _is_mirror_failure(e):
+                breaker.record_failure()
+                self.mirror_stats.record(url, time.monotonic() - start, ok=False)
+            else:
+                breaker.record_success()
+            raise
+
+        response.mirror_url = url
+        response.mirror_latency = time.monotonic() - start
+        if cancelled.is_set():
+            self._discard(response)
+            raise HedgeCancelled(f'{url} lost the hedge')
+        return response
+
+    def _discard(self, response):
+        """Close a response that lost the race and release its trial.
+
+        Its latency is kept, its body is never read so its health is not.
+        """
+        self.mirror_stats.record_latency(response.mirror_url, response.mirror_latency)
+        response.close()
+        self.breaker(response.mirror_url).release()
+
+    def _record_body(self, response, ok):
+        breaker = self.breaker(response.mirror_url)
+        if ok is None:
+            breaker.release()
+            return
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        self.mirror_stats.record(response.mirror_url, response.mirror_latency, ok=ok)
+
+    def read_elements(self, response, chunk_size=CHUNK_SIZE):
+        """Yield the elements of a response from open_stream as they arrive.
+
+        The mirror counts as healthy once the whole body has been parsed,
+        and as failed when the body breaks off or is not valid JSON.
+        """
+        ok = None
+        try:
+            with response:
+                yield from iter_overpass_elements(
+                    response.iter_content(chunk_size=chunk_size)
+                )
+            ok = True
+        except ValueError as e:
+            ok = False
+            raise requests.RequestException(
+                f'Invalid Overpass response from {response.url}: {e}'
+            ) from e
+        except requests.RequestException:
+            ok = False
+            raise
+        finally:
+            self._record_body(response, ok)
+
+    def _available_mirrors(self, urls):
+        """Return (mirrors, forced); forced when all of them are cooling down."""
+        ordered = self.mirror_stats.order(urls)
+        available = [url for url in ordered if self.breaker(url).state != 'open']
+        if not available:
+            logger.warning('All Overpass mirrors are cooling down, trying them anyway')
+            return ordered, True
+        return available, False
+
+    def open_stream(
+        self, query, urls=None, hedge_delay=HEDGE_DELAY, timeout=REQUEST_TIMEOUT
+    ):
+        """Run a hedged query and return the winning, still unread response.
+
+        Retries the whole round with jittered backoff when every mirror
+        failed; errors caused by the query itself are raised right away.
+        """
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.info(f'Retrying Overpass query in {delay:.1f}s')
+                time.sleep(delay)
+            try:
+                return self._hedged_round(query, urls, hedge_delay, timeout)
+            except requests.RequestException as e:
+                if not _is_mirror_failure(e):
+                    raise
+                last_error = e
+        raise last_error
+
+    def _hedged_round(self, query, urls, hedge_delay, timeout):
+        """Race the mirrors once.
+
+        The preferred mirror is asked first. Whenever no answer arrived
+        within hedge_delay seconds, or an attempt failed, the next mirror is
+        started as well. The first mirror to answer with a good status wins;
+        the other attempts are closed.
+        """
+        urls, forced = self._available_mirrors(urls or OVERPASS_URLS)
+        cancelled = threading.Event()
+        executor = ThreadPoolExecutor(
+            max_workers=len(urls), thread_name_prefix='overpass-hedge'
+        )
+        pending = set()
+        remaining = list(urls)
+        last_error = None
+
+        def launch():
+            while remaining:
+                url = remaining.pop(0)
+                if not (forced or self.breaker(url).allow()):
+                    logger.info(f'Skipping {url}, another request is probing it')
+                    continue
+                logger.info(f'Trying {url}...')
+                future = executor.submit(
+                    self._open_mirror, url, query, timeout, cancelled
+                )
+                future.url = url
+                pending.add(future)
+                return
+
+        try:
+            launch()
+            while pending:
+                done, _ = wait(
+                    pending,
+                    timeout=hedge_delay if remaining else None,
+                    return_when=FIRST_COMPLETED,
+                )
+                if not done:
+                    logger.info(f'No answer within {hedge_delay}s, hedging')
+                    launch()
+                    continue
+
+                for future in done:
+                    pending.discard(future)
+                    try:
+                        response = future.result()
+                    except requests.RequestException as e:
+                        logger.warning(f'Failed with {future.url}: {e}')
+                        if not _is_mirror_failure(e):
+                            raise
+                        last_error = e
+                        if remaining:
+                            launch()
+                        continue
+                    logger.info(f'Success with {future.url}')
+                    for other in done - {future}:
+                        self._discard_future(other)
+                    return response
+        finally:
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            for future in pending:
+                self.mirror_stats.record_abandoned(future.url)
+                future.add_done_callback(self._discard_future)
+
+        if last_error:
+            raise last_error
+        raise requests.RequestException('All Overpass API servers failed')
+
+    def _discard_future(self, future):
+        if future.cancelled():
+            self.breaker(future.url).release()
+        elif future.exception() is None:
+            self._discard(future.result())
+
+
+overpass_client = OverpassClient()
+
+
+def open_overpass_stream(query, **options):
+    """Hedged query through the shared OverpassClient, see open_stream."""
+    return overpass_client.open_stream(query, **options)
+
+
+def fetch_overpass_elements(query, **fetch_options):
+    """Yield the elements of a query result while the body is downloaded."""
+    response = open_overpass_stream(query, **fetch_options)
+    yield from overpass_client.read_elements(response)
+
+
+def _fetch_part(query, fetch_options):
+    return list(fetch_overpass_elements(query, **fetch_options))
+
+
+def _fetch_tile_block(cache, tiles, bbox, fetch_options):
+    ways = collect_buildings(
+        fetch_overpass_elements(build_buildings_query(bbox=bbox), **fetch_options)
+    )
+    fetched = cache.split_by_tile(ways, tiles)
+    cache.put_many(fetched)
+    return [element for elements in fetched.values() for element in elements]
+
+
+def _run_parts(parts, max_workers, progress):
+    """Run part fetches on a bounded pool, yielding elements in part order.
+
+    Parts finishing early are held back until the parts before them are
+    yielded, so the element order is the same for identical requests.
+    """
+    total = len(parts)
+    if total == 1:
+        yield from parts[0]()
+        if progress:
+            progress(1, total)
+        return
+
+    executor = ThreadPoolExecutor(
+        max_workers=min(max_workers, total), thread_name_prefix='overpass-part'
+    )
+    try:
+        futures = {executor.submit(part): i for i, part in enumerate(parts)}
+        finished = {}
+        next_part = 0
+        for done, future in enumerate(as_completed(futures), start=1):
+            elements = future.result()
+            logger.info(f'Sub-area {done}/{total} done ({len(elements)} elements)')
+            if progress:
+                progress(done, total)
+            finished[futures[future]] = elements
+            while next_part in finished:
+                yield from finished.pop(next_part)
+                next_part += 1
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_building_elements(
+    polygon_coords,
+    cache=None,
+    output=OUTPUT_GEOMETRY,
+    subtile_size=SUBTILE_SIZE,
+    max_workers=MAX_PARALLEL,
+    progress=None,
+    **fetch_options,
+):
+    """Yield the OSM building elements for a polygon.
+
+    Without a TileCache, or for ``out center`` requests, the polygon is
+    clipped server-side with a ``poly:`` filter. With a cache, footprints
+    are answered from cached tiles and only the missing tiles are fetched.
+    Large areas are split into sub-areas of about subtile_size degrees that
+    are fetched concurrently by up to max_workers threads; ways on the seams
+    appear more than once and are deduplicated by id downstream.
+    progress(done, total) is called after every sub-area.
+    fetch_options are passed on to open_overpass_stream.
+    """
+    if cache is None or output != OUTPUT_GEOMETRY:
+        areas = split_polygon(polygon_coords, subtile_size)
+        logger.info(
+            f'Querying Overpass API with polygon ({output}, {len(areas)} part(s))'
+        )
+        parts = [
+            partial(
+                _fetch_part, build_buildings_query(area, output=output), fetch_options
+            )
+            for area in areas
+        ]
+        yield from _run_parts(parts, max_workers, progress)
+        return
+
+    tiles = cache.tiles_for_bbox(*polygon_bbox(polygon_coords))
+    missing = []
+    for tile in tiles:
+        elements = cache.get(tile)
+        if elements is None:
+            missing.append(tile)
+        else:
+            yield from elements
+
+    logger.info(
+        f'Tile cache: {len(tiles) - len(missing)} hit(s), {len(missing)} miss(es)'
+    )
+    if not missing:
+        if progress:
+            progress(1, 1)
+        return
+
+    block_size = max(1, round(subtile_size / cache.tile_size))
+    blocks = cache.group_tiles(missing, block_size)
+    logger.info(f'Querying Overpass API for {len(blocks)} tile block(s)')
+    parts = [
+        partial(_fetch_tile_block, cache, block_tiles, bbox, fetch_options)
+        for block_tiles, bbox in blocks
+    ]
+    yield from _run_parts(parts, max_workers, progress)
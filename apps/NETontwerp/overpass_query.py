@@ -0,0 +1,110 @@
+"""Building Overpass QL queries for building extraction."""
+
+import math
+
+OUTPUT_GEOMETRY = 'geom'
+OUTPUT_CENTER = 'center'
+
+DETAIL_FULL = 'full'
+DETAIL_CENTERS = 'centers'
+
+QUERY_TIMEOUT = 90
+SUBTILE_SIZE = 0.02  # degrees; larger polygons are split into a grid of this size
+
+
+def polygon_bbox(polygon_coords):
+    """Return (south, west, north, east) of a [[lat, lon], ...] polygon."""
+    lats = [coord[0] for coord in polygon_coords]
+    lngs = [coord[1] for coord in polygon_coords]
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+
+def split_polygon(polygon_coords, cell_size=SUBTILE_SIZE):
+    """Split a polygon into parts no larger than cell_size degrees per side.
+
+    The polygon's bbox is divided into an even grid and every cell is
+    intersected with the polygon. Holes are dropped from the parts, which
+    only widens the query; the centroid test still uses the full polygon.
+    """
+    import shapely
+
+    south, west, north, east = polygon_bbox(polygon_coords)
+    ny = max(1, math.ceil((north - south) / cell_size))
+    nx = max(1, math.ceil((east - west) / cell_size))
+    if nx == 1 and ny == 1:
+        return [polygon_coords]
+
+    polygon = shapely.Polygon(polygon_coords)
+    if not polygon.is_valid:
+        polygon = shapely.make_valid(polygon)
+    step_lat = (north - south) / ny
+    step_lon = (east - west) / nx
+    cells = [
+        shapely.box(
+            south + iy * step_lat,
+            west + ix * step_lon,
+            south + (iy + 1) * step_lat,
+            west + (ix + 1) * step_lon,
+        )
+        for iy in range(ny)
+        for ix in range(nx)
+    ]
+
+    parts = []
+    for clipped in shapely.intersection(polygon, cells):
+        for part in shapely.get_parts(clipped):
+            if isinstance(part, shapely.Polygon) and part.area > 0:
+                parts.append([list(coord) for coord in part.exterior.coords[:-1]])
+    return parts
+
+
+def format_poly_filter(polygon_coords):
+    """Format a polygon for the Overpass ``poly:`` filter."""
+    points = ' '.join(f'{lat:.7f} {lon:.7f}' for lat, lon in polygon_coords)
+    return f'poly:"{points}"'
+
+
+def format_bbox_filter(south, west, north, east):
+    return f'{south},{west},{north},{east}'
+
+
+def select_output_mode(detail=DETAIL_FULL):
+    """Pick the cheapest Overpass output mode that still answers the request.
+
+    Footprints (and therefore area and house type) need ``out geom``, which
+    inlines the coordinates into each way so no separate node elements are
+    sent. When the caller only wants locations and counts, ``out center``
+    sends a single point per way.
+    """
+    if detail == DETAIL_CENTERS:
+        return OUTPUT_CENTER
+    return OUTPUT_GEOMETRY
+
+
+def build_buildings_query(
+    polygon_coords=None, bbox=None, output=OUTPUT_GEOMETRY, timeout=QUERY_TIMEOUT
+):
+    """Query building ways inside a polygon, or inside a bbox when given one.
+
+    The polygon is clipped on the Overpass server, so buildings outside a
+    diagonal or L-shaped area are never transferred.
+    """
+    if bbox is not None:
+        area_filter = format_bbox_filter(*bbox)
+    elif polygon_coords:
+        area_filter = format_poly_filter(polygon_coords)
+    else:
+        raise ValueError('Either polygon_coords or bbox is required')
+
+    if output == OUTPUT_CENTER:
+        out = 'out tags center qt;'
+    elif output == OUTPUT_GEOMETRY:
+        out = 'out geom qt;'
+    else:
+        raise ValueError(f'Unknown output mode: {output}')
+
+    return f"""
+        [out:json][timeout:{timeout}];
+        way["building"]({area_filter});
+        {out}
+        """
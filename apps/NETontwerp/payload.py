@@ -0,0 +1,177 @@
+"""Compact encoding of building extraction results for the browser.
+
+The default payload repeats every key and full-precision coordinate for
+every building. The compact form is columnar instead: coordinates are
+quantized to integers and delta-encoded, repeated strings such as the house
+type are replaced by an index into a small table, and the JSON is
+compressed with brotli (when installed) or gzip. decodeCompactBuildings in
+map_extraction.html turns it back into the regular building dicts.
+
+Results can also be streamed as newline-delimited JSON records, so the
+browser can draw the first batch of buildings while the rest is fetched.
+"""
+
+import gzip
+import json
+import zlib
+
+import numpy as np
+
+from apps.NETontwerp.building_store import _dictionary_encode
+
+FORMAT_JSON = 'json'
+FORMAT_COMPACT = 'compact'
+COMPACT_MEDIA_TYPE = 'application/vnd.netontwerp.compact+json'
+COMPACT_VERSION = 1
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+COORD_PRECISION = 6  # decimals kept, about 0.1 m
+MIN_COMPRESS_SIZE = 1024  # bytes; smaller bodies are sent as they are
+
+_SUMMARY_KEYS = (
+    'success',
+    'result_id',
+    'detail',
+    'count',
+    'total_amperage',
+    'total_area_m2',
+    'previous',
+    'delta',
+    'removed',
+)
+
+
+def requested_format(args, accept):
+    """Pick the payload format from a ``format`` argument or Accept header."""
+    payload_format = args.get('format')
+    if payload_format in (FORMAT_JSON, FORMAT_COMPACT):
+        return payload_format
+    if COMPACT_MEDIA_TYPE in (accept or ''):
+        return FORMAT_COMPACT
+    return FORMAT_JSON
+
+
+def wants_stream(args, accept):
+    """True when the client asked for newline-delimited JSON records."""
+    if args.get('stream') in ('1', 'true'):
+        return True
+    return NDJSON_MEDIA_TYPE in (accept or '')
+
+
+def _delta_encode(values):
+    """Replace each row by its difference with the previous row."""
+    deltas = values.copy()
+    deltas[1:] -= values[:-1]
+    return deltas
+
+
+def encode_compact(result, precision=COORD_PRECISION):
+    """Encode an extraction result dict into the compact columnar form."""
+    encoded = {key: result[key] for key in _SUMMARY_KEYS if key in result}
+    encoded.update({'format': FORMAT_COMPACT, 'version': COMPACT_VERSION})
+
+    buildings = result.get('buildings', [])
+    scale = 10**precision
+    centers = np.rint(
+        np.array([b['center'] for b in buildings], dtype=float).reshape(-1, 2) * scale
+    ).astype(np.int64)
+    osm_type_table, osm_type_codes = _dictionary_encode(
+        b['osm_type'] for b in buildings
+    )
+
+    encoded.update(
+        {
+            'scale': scale,
+            'ids': _delta_encode(np.array([b['id'] for b in buildings])).tolist(),
+            'centers': _delta_encode(centers).ravel().tolist(),
+            'osm_types': osm_type_table,
+            'osm_type': osm_type_codes,
+            'names': {str(i): b['name'] for i, b in enumerate(buildings) if b['name']},
+        }
+    )
+
+    if buildings and 'coords' in buildings[0]:
+        type_table, type_codes = _dictionary_encode(b['type'] for b in buildings)
+        counts = np.array([len(b['coords']) for b in buildings])
+        coords = np.array(
+            [point for b in buildings for point in b['coords']], dtype=float
+        ).reshape(-1, 2)
+        points = np.rint(coords * scale).astype(np.int64)
+
+        # Every ring starts relative to its own center, so one building's
+        # coordinates do not depend on the building before it.
+        deltas = _delta_encode(points)
+        has_points = counts > 0
+        starts = (np.cumsum(counts) - counts)[has_points]
+        deltas[starts] = points[starts] - centers[has_points]
+
+        encoded.update(
+            {
+                'types': type_table,
+                'type': type_codes,
+                'area_m2_x10': [round(b['area_m2'] * 10) for b in buildings],
+                'rings': counts.tolist(),
+                'coords': deltas.ravel().tolist(),
+            }
+        )
+
+    return encoded
+
+
+def encode_payload(result, payload_format):
+    """Return the result in the requested format, ready for JSON."""
+    if payload_format == FORMAT_COMPACT and result.get('buildings') is not None:
+        return encode_compact(result)
+    return result
+
+
+def encode_batch(store, payload_format):
+    """A BuildingStore batch as a {'buildings': ...} payload for the browser."""
+    return encode_payload({'buildings': store.to_buildings()}, payload_format)
+
+
+def compress_body(body, accept_encoding):
+    """Compress a response body for the client.
+
+    Returns (body, content_encoding) where content_encoding is None when
+    the body was left as it is.
+    """
+    accept_encoding = accept_encoding or ''
+    if len(body) < MIN_COMPRESS_SIZE:
+        return body, None
+    if 'br' in accept_encoding:
+        try:
+            import brotli
+        except ImportError:
+            pass
+        else:
+            return brotli.compress(body, quality=5), 'br'
+    if 'gzip' in accept_encoding:
+        return gzip.compress(body, compresslevel=6), 'gzip'
+    return body, None
+
+
+def dump_payload(payload):
+    """Serialize a payload as compact UTF-8 JSON."""
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def iter_ndjson(records, payload_format):
+    """Serialize extraction records as NDJSON lines.
+
+    Building batches are encoded in the requested payload format; a
+    compact batch carries its own scale and type tables, so every line can
+    be decoded on its own.
+    """
+    for record in records:
+        if record['type'] == 'batch':
+            record = dict(encode_payload(record, payload_format), type='batch')
+        yield dump_payload(record) + b'\n'
+
+
+def gzip_stream(chunks):
+    """Gzip a stream of chunks, flushing after each so none is held back."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
@@ -0,0 +1,58 @@
+"""Rasterization of PDF map uploads for house detection.
+
+Pages are rendered one at a time with pypdfium2, an optional dependency,
+so a large multi-page plan never has more than one rendered page per
+worker in memory. A PDF is given as a path or as the uploaded bytes.
+"""
+
+import cv2
+
+PDF_DPI = 150
+POINTS_PER_INCH = 72
+
+
+def _pdfium():
+    try:
+        import pypdfium2
+    except ImportError as e:
+        raise ValueError(
+            'PDF-bestanden worden niet ondersteund, installeer pypdfium2'
+        ) from e
+    return pypdfium2
+
+
+def _open(source):
+    if not isinstance(source, bytes):
+        source = str(source)
+    return _pdfium().PdfDocument(source)
+
+
+def is_pdf(data):
+    """True when the bytes start with the PDF signature."""
+    return data[:5] == b'%PDF-'
+
+
+def _render(pdf, page_index, dpi):
+    page = pdf[page_index]
+    try:
+        bitmap = page.render(scale=dpi / POINTS_PER_INCH)
+        # The array is a view on the bitmap buffer, copy it before closing
+        image = bitmap.to_numpy().copy()
+        bitmap.close()
+    finally:
+        page.close()
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    return image
+
+
+def iter_pdf_pages(source, dpi=PDF_DPI):
+    """Yield (page_index, BGR image) for each page, rendering on demand."""
+    pdf = _open(source)
+    try:
+        for page_index in range(len(pdf)):
+            yield page_index, _render(pdf, page_index, dpi)
+    finally:
+        pdf.close()
@@ -0,0 +1,143 @@
+"""Automatic placement of stroomkasten (distribution cabinets).
+
+Every building must lie within the coverage radius of the cabinet it is
+connected to, and the houses connected to one cabinet may together draw
+at most the ampere budget. Finding the smallest such set is a capacitated
+set cover problem; this uses the greedy heuristic on candidate sites at
+the building centers:
+
+1. An STRtree over the building centers (projected to meters) gives, for
+   every candidate site, the buildings within the radius.
+2. The site that can take the most not yet connected load, capped at the
+   budget, becomes a cabinet and takes its nearest unconnected buildings
+   until the budget is reached.
+3. Repeat until every building is connected.
+
+A site's gain only drops as buildings get connected, so gains are kept in
+a heap and only recomputed for the site on top (lazy greedy).
+"""
+
+import heapq
+import math
+
+import numpy as np
+import shapely
+
+from apps.NETontwerp.capacity import AMPERE_PER_HOUSE, SIMULTANEITY
+
+COVERAGE_RADIUS_M = 150
+METERS_PER_DEGREE = 111320
+
+
+def project_to_meters(centers):
+    """Project (lat, lon) rows to local (x, y) meters around their mean."""
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    if not len(centers):
+        return np.zeros((0, 2))
+    ref_lat, ref_lon = centers.mean(axis=0)
+    x = (centers[:, 1] - ref_lon) * METERS_PER_DEGREE * math.cos(math.radians(ref_lat))
+    y = (centers[:, 0] - ref_lat) * METERS_PER_DEGREE
+    return np.column_stack([x, y])
+
+
+def _neighbours(points, radius):
+    """CSR arrays (offsets, buildings, distances) of buildings per site."""
+    # Only the square around every site goes through the tree, the circle
+    # is cut out with NumPy; a dwithin predicate is several times slower.
+    x, y = points[:, 0], points[:, 1]
+    tree = shapely.STRtree(shapely.points(points))
+    sites, buildings = tree.query(
+        shapely.box(x - radius, y - radius, x + radius, y + radius)
+    )
+    distances = np.hypot(x[sites] - x[buildings], y[sites] - y[buildings])
+    inside = distances <= radius
+    sites, buildings, distances = sites[inside], buildings[inside], distances[inside]
+
+    # Per site, nearest buildings first, sorted on one key
+    order = np.argsort(sites * (2.0 * radius + 1) + distances)
+    sites, buildings, distances = sites[order], buildings[order], distances[order]
+    offsets = np.zeros(len(points) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sites, minlength=len(points)), out=offsets[1:])
+    return offsets, buildings, distances
+
+
+def place_cabinets(
+    centers,
+    ampere_budget,
+    radius_m=COVERAGE_RADIUS_M,
+    ampere_per_house=AMPERE_PER_HOUSE,
+    simultaneity=SIMULTANEITY,
+):
+    """Place cabinets so every building is covered within budget and radius.
+
+    centers are (lat, lon) rows; ampere_per_house may also be an array
+    with the load per building. Returns (cabinets, assignment) where
+    cabinets is a list of dicts with the site (a building index), center,
+    building count, load and farthest connection, and assignment gives
+    the cabinet index of every building.
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    count = len(centers)
+    load = np.broadcast_to(
+        np.asarray(ampere_per_house, dtype=np.float64) * simultaneity, count
+    )
+    if not (0 < radius_m < math.inf and 0 < ampere_budget < math.inf):
+        raise ValueError('Straal en ampèrebudget moeten groter dan 0 zijn')
+    if not np.all((load > 0) & np.isfinite(load)):
+        raise ValueError(
+            'Stroom per woning en gelijktijdigheid moeten groter dan 0 zijn'
+        )
+    if np.any(load > ampere_budget):
+        raise ValueError(
+            f'Een gebouw vraagt meer dan het budget van {ampere_budget}A per stroomkast'
+        )
+
+    assignment = np.full(count, -1, dtype=np.int64)
+    if not count:
+        return [], assignment
+
+    offsets, buildings, distances = _neighbours(project_to_meters(centers), radius_m)
+    neighbour_load = load[buildings]
+    site_load = np.add.reduceat(neighbour_load, offsets[:-1])
+
+    heap = [
+        (-min(gain, ampere_budget), site)
+        for site, gain in enumerate(site_load.tolist())
+    ]
+    heapq.heapify(heap)
+
+    cabinets = []
+    remaining = count
+    while remaining and heap:
+        _, site = heapq.heappop(heap)
+        start, stop = offsets[site], offsets[site + 1]
+        open_mask = assignment[buildings[start:stop]] < 0
+        gain = min(float(neighbour_load[start:stop][open_mask].sum()), ampere_budget)
+        if not gain:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, site))
+            continue
+
+        # Connect the nearest open buildings until the budget is used
+        candidates = buildings[start:stop][open_mask]
+        within_budget = np.cumsum(load[candidates]) <= ampere_budget
+        taken = candidates[within_budget]
+        assignment[taken] = len(cabinets)
+        remaining -= len(taken)
+        cabinets.append(
+            {
+                'site': site,
+                'center': centers[site].tolist(),
+                'buildings': len(taken),
+                'ampere': round(float(load[taken].sum()), 1),
+                'max_distance_m': round(
+                    float(distances[start:stop][open_mask][within_budget].max()), 1
+                ),
+            }
+        )
+        # The site may still have open buildings after reaching its budget
+        # once, but never more than a new cabinet could take.
+        heapq.heappush(heap, (-gain, site))
+
+    return cabinets, assignment
@@ -3,6 +3,7 @@ import os
 
 from flask import (
     Blueprint,
+    Response,
     current_app,
     flash,
     jsonify,
@@ -50,12 +51,46 @@ def house_detection():
     return render_template('NETontwerp/house_detection_upload.html')
 
 
+@bp.route('/detection-images/<key>', methods=['GET'])
+@handle_errors(redirect_endpoint='NETontwerp.house_detection')
+def detection_image(key):
+    """Annotated detection image from the in-memory image store"""
+    from apps.NETontwerp.image_store import get_image_store
+
+    image = get_image_store(current_app.config).get(key)
+    if image is None:
+        return jsonify({'error': 'Onbekende of verlopen afbeelding'}), 404
+
+    data, mimetype = image
+    response = Response(data, mimetype=mimetype)
+    # The key is the hash of the content, so the image never changes
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.headers['ETag'] = f'"{key}"'
+    return response
+
+
 @bp.route('/street-assignment', methods=['GET', 'POST'])
 @handle_errors(redirect_endpoint='NETontwerp.house_detection')
 def street_assignment():
     if request.method == 'POST':
         return handle_street_assignment()
 
+    result_id = request.args.get('result_id')
+    if result_id:
+        from apps.NETontwerp.building_store import get_result_store
+
+        store = get_result_store().get(result_id)
+        if store is None:
+            flash(
+                'Het kaartresultaat is verlopen. Detecteer de huizen opnieuw.',
+                'error',
+            )
+            return redirect(url_for('NETontwerp.map_extraction'))
+        session['house_count'] = len(store)
+        session['result_id'] = result_id
+        session['detection_image'] = None
+        session['detection_pages_key'] = None
+
     house_count = session.get('house_count', 0)
     detection_image = session.get('detection_image')
 
@@ -63,19 +98,31 @@ def street_assignment():
         flash('Geen huizen gedetecteerd. Upload eerst een screenshot.', 'error')
         return redirect(url_for('NETontwerp.house_detection'))
 
-    cable_types = get_cable_types()
+    import json
+
+    from apps.NETontwerp.cables import get_cable_catalog
+    from apps.NETontwerp.image_store import get_image_store
+
+    cable_types = get_cable_catalog(current_app.config).cables
+
+    # The page list is kept in the image store, the cookie only has its key
+    detection_pages = None
+    pages_key = session.get('detection_pages_key')
+    if pages_key:
+        stored = get_image_store(current_app.config).get(pages_key)
+        if stored is not None:
+            detection_pages = json.loads(stored[0])
 
     return render_template(
         'NETontwerp/street_assignment.html',
         house_count=house_count,
         detection_image=detection_image,
+        detection_pages=detection_pages,
         cable_types=cable_types,
     )
 
 
 def handle_house_detection_upload():
-    ensure_upload_folder()
-
     if 'screenshot' not in request.files:
         flash('Geen bestand geüpload', 'error')
         return redirect(url_for('NETontwerp.house_detection'))
@@ -86,30 +133,63 @@ def handle_house_detection_upload():
         return redirect(url_for('NETontwerp.house_detection'))
 
     if not allowed_file(file.filename):
-        flash('Alleen PNG, JPG en JPEG bestanden zijn toegestaan', 'error')
+        flash('Alleen PNG, JPG, JPEG en PDF bestanden zijn toegestaan', 'error')
         return redirect(url_for('NETontwerp.house_detection'))
 
     filename = secure_filename(file.filename)
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    data = file.read()
 
     try:
+        import json
+
+        from apps.NETontwerp.detection_cache import (
+            detection_key,
+            get_detection_cache,
+        )
         from apps.NETontwerp.house_analysis import (
-            detect_houses_from_image,
-            draw_house_detections,
+            detect_houses_in_upload,
+            detection_params,
         )
+        from apps.NETontwerp.image_store import get_image_store
+
+        params = detection_params(current_app.config['HOUSE_DETECTION_PROFILE'])
+        extension = os.path.splitext(filename)[1].lower().replace('jpeg', 'jpg')
+        dpi = current_app.config['HOUSE_DETECTION_PDF_DPI']
+
+        cache = get_detection_cache(current_app.config)
+        key = detection_key(data, params, extension=extension, dpi=dpi)
+        pages = cache.get(key)
+        if pages is None:
+            pages = detect_houses_in_upload(
+                data,
+                params,
+                extension=extension,
+                dpi=dpi,
+                tile_size=current_app.config['HOUSE_DETECTION_TILE_SIZE'],
+                workers=current_app.config['HOUSE_DETECTION_WORKERS'] or None,
+            )
+            cache.put(key, pages)
+
+        image_store = get_image_store(current_app.config)
+        detection_pages = [
+            {
+                'page': number,
+                'house_count': page['house_count'],
+                'detection_image': image_store.put(*page['image']),
+            }
+            for number, page in enumerate(pages, start=1)
+        ]
+        house_count = sum(page['house_count'] for page in detection_pages)
+        detection_image = detection_pages[0]['detection_image']
 
-        image, house_shapes = detect_houses_from_image(filepath)
-
-        detection_filename = f'detection_{filename}'
-        detection_filepath = os.path.join(
-            current_app.config['UPLOAD_FOLDER'], detection_filename
+        # A PDF can have many pages, more than fit in the session cookie
+        pages_key = image_store.put(
+            json.dumps(detection_pages).encode('utf-8'), 'application/json'
         )
 
-        house_count = draw_house_detections(image, house_shapes, detection_filepath)
-
         session['house_count'] = house_count
-        session['detection_image'] = detection_filename
+        session['detection_image'] = detection_image
+        session['detection_pages_key'] = pages_key
         session['original_image'] = filename
 
         logger.info(f'Detected {house_count} houses in {filename}')
@@ -122,6 +202,18 @@ def handle_house_detection_upload():
         return redirect(url_for('NETontwerp.house_detection'))
 
 
+STREET_FIELDS = (
+    'name',
+    'houses',
+    'ampere_needed',
+    'kva_needed',
+    'cable',
+    'cable_auto',
+    'can_handle',
+    'connected',
+)
+
+
 def handle_street_assignment():
     street_names_input = request.form.get('street_names', '')
     street_names = [s.strip() for s in street_names_input.split(',') if s.strip()]
@@ -130,44 +222,43 @@ def handle_street_assignment():
         flash('Voer minimaal één straatnaam in', 'error')
         return redirect(url_for('NETontwerp.street_assignment'))
 
+    from apps.NETontwerp.cables import get_cable_catalog
+    from apps.NETontwerp.capacity import (
+        assign_cables,
+        even_split,
+        round_kva,
+        street_capacity,
+    )
+
+    catalog = get_cable_catalog(current_app.config)
     house_count = session.get('house_count', 0)
     houses_per_street = house_count // len(street_names)
 
-    cable_assignments = {}
-    for street in street_names:
-        cable_type = request.form.get(f'cable_{street}')
-        if cable_type:
-            cable_assignments[street] = cable_type
-
-    street_data = []
-    total_connected = 0
-
-    for street in street_names:
-        cable = cable_assignments.get(street)
-        houses_in_street = houses_per_street
-        ampere_needed = houses_in_street * 10
-        kva_needed = ampere_needed * 0.23
-
-        if cable:
-            cable_capacity = get_cable_capacity(cable)
-            can_handle = cable_capacity >= ampere_needed
-            connected = houses_in_street if can_handle else 0
-            total_connected += connected
-        else:
-            can_handle = False
-            connected = 0
-
-        street_data.append(
-            {
-                'name': street,
-                'houses': houses_in_street,
-                'ampere_needed': ampere_needed,
-                'kva_needed': round(kva_needed, 2),
-                'cable': cable,
-                'can_handle': can_handle,
-                'connected': connected,
-            }
-        )
+    houses = even_split(house_count, len(street_names))
+    cables, cable_auto = assign_cables(
+        [request.form.get(f'cable_{street}') or None for street in street_names],
+        houses,
+        catalog,
+    )
+    result = street_capacity(
+        houses,
+        catalog.capacities(cables),
+        has_cable=[cable is not None for cable in cables],
+    )
+    total_connected = int(result['total_connected'])
+
+    columns = zip(
+        street_names,
+        houses.tolist(),
+        result['ampere_needed'].tolist(),
+        round_kva(result['kva_needed']),
+        cables,
+        cable_auto,
+        result['can_handle'].tolist(),
+        result['connected'].tolist(),
+        strict=True,
+    )
+    street_data = [dict(zip(STREET_FIELDS, row, strict=True)) for row in columns]
 
     result_data = {
         'total_houses': house_count,
@@ -182,32 +273,43 @@ def handle_street_assignment():
     return render_template('NETontwerp/cable_assignment_result.html', data=result_data)
 
 
-def get_cable_types():
-    return [
-        {'name': '4*240mm2 Al', 'capacity': 240},
-        {'name': '4*150mm2 Al (basis)', 'capacity': 150},
-        {'name': '4*95mm2 Al', 'capacity': 95},
-        {'name': '4*50mm2 Al', 'capacity': 50},
-        {'name': '4*16mm2 Cu', 'capacity': 70},
-        {'name': '4*6mm2 Cu', 'capacity': 30},
-    ]
-
-
-def get_cable_capacity(cable_name):
-    cables = get_cable_types()
-    for cable in cables:
-        if cable['name'] == cable_name:
-            return cable['capacity']
-    return 0
-
-
 @bp.route('/berekening', methods=['GET', 'POST'])
 @handle_errors(redirect_endpoint='NETontwerp.main')
 def berekening():
     if request.method == 'POST':
         return handle_form_submission()
 
-    cable_types = [c['name'] for c in get_cable_types()]
+    from apps.NETontwerp.cables import get_cable_catalog
+    from apps.NETontwerp.capacity import load_ampere
+
+    catalog = get_cable_catalog(current_app.config)
+    cable_types = catalog.names()
+
+    # Prefill the number of houses from a stored map extraction, with the
+    # cheapest cable that carries them preselected and the cable length of
+    # automatically placed stroomkasten
+    aantal_woningen = None
+    suggested_cable = None
+    kabel_hoeveelheid = None
+    result_id = request.args.get('result_id')
+    if result_id:
+        from apps.NETontwerp.cable_routes import cable_routes
+        from apps.NETontwerp.placement import place_cabinets
+
+        try:
+            centers = _request_centers({'result_id': result_id})
+        except KeyError:
+            centers = None
+        if centers is not None:
+            aantal_woningen = len(centers)
+            cable = catalog.cheapest_adequate(load_ampere(aantal_woningen))
+            suggested_cable = cable['name'] if cable else None
+        if centers is not None and len(centers):
+            radius, budget = _placement_options({})
+            cabinets, assignment = place_cabinets(centers, budget, radius)
+            stations = [cabinet['center'] for cabinet in cabinets]
+            routes = cable_routes(centers, stations, assignment)
+            kabel_hoeveelheid = round(routes['total_length_m'])
 
     station_types = [
         'pacto 10 tot 400 kva',
@@ -222,6 +324,9 @@ def berekening():
         'NETontwerp/berekeningen.html',
         cable_types=cable_types,
         station_types=station_types,
+        aantal_woningen=aantal_woningen,
+        suggested_cable=suggested_cable,
+        kabel_hoeveelheid=kabel_hoeveelheid,
     )
 
 
@@ -250,11 +355,23 @@ def handle_form_submission():
         'benodigde_stations': request.form.get('benodigde_stations'),
         'om_te_bouwen_stations': request.form.get('om_te_bouwen_stations'),
         'kabel_type': request.form.get('kabel_type'),
+        'kabel_type_auto': False,
         'kabel_hoeveelheid': request.form.get('kabel_hoeveelheid'),
         'station_type': request.form.get('station_type'),
         'uploaded_file': uploaded_file,
     }
 
+    aantal_woningen = form_data['aantal_woningen']
+    if not form_data['kabel_type'] and aantal_woningen and aantal_woningen.isdigit():
+        from apps.NETontwerp.cables import get_cable_catalog
+        from apps.NETontwerp.capacity import load_ampere
+
+        catalog = get_cable_catalog(current_app.config)
+        cable = catalog.cheapest_adequate(load_ampere(int(aantal_woningen)))
+        if cable:
+            form_data['kabel_type'] = cable['name']
+            form_data['kabel_type_auto'] = True
+
     return render_template('NETontwerp/resultaat.html', data=form_data)
 
 
@@ -265,155 +382,555 @@ def map_extraction():
     return render_template('NETontwerp/map_extraction.html')
 
 
+def _payload_response(data):
+    """JSON response compressed with the best encoding the client accepts"""
+    from apps.NETontwerp.payload import compress_body, dump_payload
+
+    body, encoding = compress_body(
+        dump_payload(data), request.headers.get('Accept-Encoding')
+    )
+    response = Response(body, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept, Accept-Encoding'
+    return response
+
+
 @bp.route('/api/extract-buildings', methods=['POST'])
 @handle_errors(redirect_endpoint='NETontwerp.main')
 def extract_buildings():
     """API endpoint to extract buildings within a polygon using Overpass API"""
-    import requests
-    from shapely.geometry import Point, Polygon
-    import math
-
-    def calculate_area_m2(building_poly, center_lat):
-        """Calculate approximate area in square meters using local projection"""
-        meters_per_lat = 111320
-        meters_per_lon = 111320 * math.cos(math.radians(center_lat))
-        area_deg = building_poly.area
-        area_m2 = area_deg * meters_per_lat * meters_per_lon
-        return abs(area_m2)
-
-    def classify_house_type(area_m2):
-        """Classify building based on area - simple and permissive"""
-        if area_m2 < 30:
-            return None  # Filter out sheds
-        elif area_m2 < 80:
-            return 'Rijtjeshuis'
-        elif area_m2 < 150:
-            return 'Twee onder een kap'
+    from apps.NETontwerp.extraction import (
+        ExtractionRequestError,
+        extraction_error_message,
+        extraction_settings,
+        iter_extraction_records,
+        parse_extraction_request,
+        run_extraction_coalesced,
+        run_incremental_extraction,
+    )
+    from apps.NETontwerp.payload import (
+        NDJSON_MEDIA_TYPE,
+        encode_payload,
+        gzip_stream,
+        iter_ndjson,
+        requested_format,
+        wants_stream,
+    )
+
+    data = request.get_json()
+    try:
+        polygon_coords, detail = parse_extraction_request(data)
+    except ExtractionRequestError as e:
+        return jsonify({'error': str(e)}), 400
+
+    payload_format = requested_format(request.args, request.headers.get('Accept'))
+    settings = extraction_settings(current_app.config)
+
+    # An edit of an earlier result only fetches the area that was added
+    previous_id = (data or {}).get('previous')
+    if previous_id:
+        try:
+            result = run_incremental_extraction(
+                polygon_coords, detail, previous_id, settings
+            )
+        except Exception as e:
+            return jsonify({'error': extraction_error_message(e)}), 500
+        if result is not None:
+            return _payload_response(encode_payload(result, payload_format))
+        logger.info(f'Previous result {previous_id} unavailable, extracting fully')
+
+    # Opt-in for API clients: the response holds a server thread until the
+    # last record, so the map page runs the extraction as a job instead
+    if wants_stream(request.args, request.headers.get('Accept')):
+        records = iter_extraction_records(polygon_coords, detail, settings)
+        body = iter_ndjson(records, payload_format)
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            body = gzip_stream(body)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(body, mimetype=NDJSON_MEDIA_TYPE, headers=headers)
+
+    try:
+        result = run_extraction_coalesced(polygon_coords, detail, settings)
+    except Exception as e:
+        return jsonify({'error': extraction_error_message(e)}), 500
+
+    return _payload_response(encode_payload(result, payload_format))
+
+
+@bp.route('/api/results/<result_id>', methods=['GET'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def extraction_result(result_id):
+    """Totals and house type counts of a stored extraction result"""
+    from apps.NETontwerp.building_store import get_result_store
+    from apps.NETontwerp.extraction import result_summary
+
+    store = get_result_store().get(result_id)
+    if store is None:
+        return jsonify({'error': 'Onbekend of verlopen resultaat'}), 404
+
+    data = result_summary(store)
+    data['result_id'] = result_id
+    if store.has_footprints:
+        data['type_counts'] = store.type_counts()
+    return jsonify(data)
+
+
+@bp.route('/api/results/<result_id>/export', methods=['GET'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def export_result(result_id):
+    """Download a stored extraction result as GeoJSON or CSV"""
+    from apps.NETontwerp.building_store import get_result_store
+    from apps.NETontwerp.export import (
+        EXPORT_CSV,
+        EXPORT_GEOJSON,
+        iter_csv,
+        iter_geojson,
+    )
+
+    store = get_result_store().get(result_id)
+    if store is None:
+        return jsonify({'error': 'Onbekend of verlopen resultaat'}), 404
+
+    export_format = request.args.get('format', EXPORT_GEOJSON)
+    if export_format == EXPORT_CSV:
+        body, mimetype = iter_csv(store), 'text/csv'
+    elif export_format == EXPORT_GEOJSON:
+        body, mimetype = iter_geojson(store), 'application/geo+json'
+    else:
+        return jsonify({'error': f'Onbekend exportformaat: {export_format}'}), 400
+
+    filename = f'gebouwen_{result_id[:8]}.{export_format}'
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+
+@bp.route('/api/results/<result_id>/tiles/<int:z>/<int:x>/<int:y>.mvt')
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def building_tile(result_id, z, x, y):
+    """Mapbox Vector Tile with the buildings of an extraction result"""
+    from apps.NETontwerp.payload import compress_body
+    from apps.NETontwerp.vector_tiles import get_tile_set
+
+    tile_set = get_tile_set(result_id)
+    if tile_set is None:
+        return jsonify({'error': 'Onbekend of verlopen resultaat'}), 404
+
+    body, encoding = compress_body(
+        tile_set.tile(z, x, y), request.headers.get('Accept-Encoding')
+    )
+    response = Response(body, mimetype='application/vnd.mapbox-vector-tile')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+@bp.route('/api/extraction-stats', methods=['GET'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def extraction_stats():
+    """Counters for request coalescing, the tile cache and Overpass mirrors"""
+    from apps.NETontwerp.extraction import extraction_flight
+    from apps.NETontwerp.overpass import overpass_client
+    from apps.NETontwerp.tile_cache import get_tile_cache
+
+    cache = get_tile_cache(current_app.config)
+    return jsonify(
+        {
+            'coalescing': extraction_flight.stats(),
+            'tile_cache': cache.stats() if cache else None,
+            'mirrors': overpass_client.stats(),
+        }
+    )
+
+
+@bp.route('/api/street-capacity', methods=['POST'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def street_capacity_api():
+    """Capacity check for many streets or scenarios in one request
+
+    Takes houses per street (a list, or a list of lists for scenarios) with
+    either cable names ("auto" for the cheapest adequate one) or capacities
+    in ampere per street, and optionally ampere_per_house and simultaneity
+    as numbers or lists per street.
+    """
+    import numpy as np
+
+    from apps.NETontwerp.cables import get_cable_catalog
+    from apps.NETontwerp.capacity import (
+        AMPERE_PER_HOUSE,
+        SIMULTANEITY,
+        assign_cables,
+        round_kva,
+        street_capacity,
+    )
+
+    data = request.get_json(silent=True) or {}
+    if 'houses' not in data:
+        return jsonify({'error': 'Geef het aantal huizen per straat op'}), 400
+
+    cables = None
+    try:
+        houses = np.asarray(data['houses'], dtype=np.int64)
+        ampere_per_house = np.asarray(
+            data.get('ampere_per_house', AMPERE_PER_HOUSE), dtype=np.float64
+        )
+        simultaneity = np.asarray(
+            data.get('simultaneity', SIMULTANEITY), dtype=np.float64
+        )
+        if 'cables' in data:
+            catalog = get_cable_catalog(current_app.config)
+            cables, _ = assign_cables(
+                [cable or None for cable in data['cables']],
+                houses,
+                catalog,
+                ampere_per_house,
+                simultaneity,
+            )
+            capacities = catalog.capacities(cables)
+            has_cable = [cable is not None for cable in cables]
         else:
-            return 'Vrijstaand'
+            capacities = np.asarray(data.get('capacities', 0), dtype=np.float64)
+            has_cable = None
+        result = street_capacity(
+            houses,
+            capacities,
+            has_cable=has_cable,
+            ampere_per_house=ampere_per_house,
+            simultaneity=simultaneity,
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Ongeldige invoer: {e}'}), 400
+
+    return jsonify(
+        {
+            'cables': cables,
+            'ampere_needed': result['ampere_needed'].tolist(),
+            'kva_needed': round_kva(result['kva_needed']),
+            'can_handle': result['can_handle'].tolist(),
+            'connected': result['connected'].tolist(),
+            'total_houses': result['total_houses'].tolist(),
+            'total_connected': result['total_connected'].tolist(),
+            'total_unconnected': result['total_unconnected'].tolist(),
+        }
+    )
+
+
+def _request_centers(data):
+    """(lat, lon) house centers from a stored result_id or a centers list
+
+    Returns None when neither is given and raises KeyError for an unknown
+    result.
+    """
+    if data.get('result_id'):
+        import numpy as np
+
+        from apps.NETontwerp.building_store import get_result_store
+
+        store = get_result_store().get(data['result_id'])
+        if store is None:
+            raise KeyError(data['result_id'])
+        return np.column_stack([store.records['lat'], store.records['lon']])
+    return data.get('centers')
+
 
+def _placement_options(data):
+    """Coverage radius and ampere budget for stroomkast placement"""
+    from apps.NETontwerp.cables import get_cable_catalog
+    from apps.NETontwerp.placement import COVERAGE_RADIUS_M
+
+    config = current_app.config
+    radius = data.get('radius_m', config.get('STROOMKAST_RADIUS_M', COVERAGE_RADIUS_M))
+    budget = data.get('ampere_budget') or config.get('STROOMKAST_AMPERE_BUDGET')
+    if not budget:
+        catalog = get_cable_catalog(config)
+        budget = max(cable['capacity'] for cable in catalog.cables)
+    return float(radius), float(budget)
+
+
+@bp.route('/api/stroomkasten', methods=['POST'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def place_stroomkasten():
+    """Place stroomkasten over the buildings of an extraction result
+
+    Takes a result_id (or a list of [lat, lon] centers) and optionally
+    radius_m, ampere_budget, ampere_per_house and simultaneity. Every
+    building ends up within radius_m of its stroomkast and no stroomkast
+    carries more than ampere_budget.
+    """
+    import time
+
+    from apps.NETontwerp.capacity import AMPERE_PER_HOUSE, SIMULTANEITY
+    from apps.NETontwerp.placement import place_cabinets
+
+    data = request.get_json(silent=True) or {}
     try:
-        data = request.get_json()
-        polygon_coords = data.get('polygon', [])
-
-        if len(polygon_coords) < 3:
-            return jsonify({'error': 'Polygon moet minimaal 3 punten hebben'}), 400
-
-        # Create bounding box for Overpass API query
-        lats = [coord[0] for coord in polygon_coords]
-        lngs = [coord[1] for coord in polygon_coords]
-        bbox = f"{min(lats)},{min(lngs)},{max(lats)},{max(lngs)}"
-
-        # Query Overpass API for buildings only (no roads = faster)
-        # Try multiple Overpass API instances for reliability
-        overpass_urls = [
-            "https://overpass-api.de/api/interpreter",
-            "https://overpass.kumi.systems/api/interpreter",
-            "https://overpass.openstreetmap.ru/api/interpreter",
-        ]
+        centers = _request_centers(data)
+    except KeyError:
+        return jsonify({'error': 'Onbekend of verlopen resultaat'}), 404
+    if centers is None:
+        return jsonify({'error': 'Geef een result_id of gebouwcentra op'}), 400
 
-        overpass_query = f"""
-        [out:json][timeout:90];
-        (
-          way["building"]({bbox});
-        );
-        out body;
-        >;
-        out skel qt;
-        """
-
-        logger.info(f'Querying Overpass API with bbox: {bbox}')
-
-        # Try each API endpoint until one works
-        last_error = None
-        for overpass_url in overpass_urls:
-            try:
-                logger.info(f'Trying {overpass_url}...')
-                response = requests.post(
-                    overpass_url,
-                    data={'data': overpass_query},
-                    timeout=60,
-                    headers={'User-Agent': 'NETontwerp/1.0'}
+    started = time.perf_counter()
+    try:
+        radius, budget = _placement_options(data)
+        cabinets, assignment = place_cabinets(
+            centers,
+            budget,
+            radius_m=radius,
+            ampere_per_house=float(data.get('ampere_per_house', AMPERE_PER_HOUSE)),
+            simultaneity=float(data.get('simultaneity', SIMULTANEITY)),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Ongeldige invoer: {e}'}), 400
+    seconds = time.perf_counter() - started
+    logger.info(
+        f'{len(cabinets)} stroomkasten geplaatst voor {len(assignment)} gebouwen '
+        f'in {seconds:.2f}s'
+    )
+
+    return jsonify(
+        {
+            'count': len(cabinets),
+            'building_count': len(assignment),
+            'ampere_budget': budget,
+            'stroomkasten': cabinets,
+            'assignment': assignment.tolist(),
+            'seconds': round(seconds, 3),
+        }
+    )
+
+
+@bp.route('/api/cable-routes', methods=['POST'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def cable_routes_api():
+    """Cable route length per station and per cable type
+
+    Takes a result_id (or a list of [lat, lon] centers) and optionally the
+    stations as [lat, lon] with the station index of every house in
+    assignment (default: the nearest station). Without stations they are
+    placed as by /api/stroomkasten. cable is a cable name or "auto" (the
+    default) for the cheapest one carrying each station's houses.
+    """
+    import time
+
+    from apps.NETontwerp.cable_routes import cable_routes, route_features
+    from apps.NETontwerp.cables import AUTO_CABLE, get_cable_catalog
+    from apps.NETontwerp.capacity import AMPERE_PER_HOUSE, SIMULTANEITY, assign_cables
+    from apps.NETontwerp.placement import place_cabinets
+
+    data = request.get_json(silent=True) or {}
+    try:
+        centers = _request_centers(data)
+    except KeyError:
+        return jsonify({'error': 'Onbekend of verlopen resultaat'}), 404
+    if centers is None:
+        return jsonify({'error': 'Geef een result_id of gebouwcentra op'}), 400
+
+    catalog = get_cable_catalog(current_app.config)
+    cable = data.get('cable') or AUTO_CABLE
+    if cable != AUTO_CABLE and cable not in catalog:
+        return jsonify({'error': f'Onbekend kabeltype: {cable}'}), 400
+
+    started = time.perf_counter()
+    try:
+        ampere_per_house = float(data.get('ampere_per_house', AMPERE_PER_HOUSE))
+        simultaneity = float(data.get('simultaneity', SIMULTANEITY))
+        if not (ampere_per_house > 0 and simultaneity > 0):
+            raise ValueError(
+                'Stroom per woning en gelijktijdigheid moeten groter dan 0 zijn'
+            )
+        stations = data.get('stations')
+        assignment = data.get('assignment')
+        if stations is None:
+            radius, budget = _placement_options(data)
+            cabinets, assignment = place_cabinets(
+                centers, budget, radius, ampere_per_house, simultaneity
+            )
+            stations = [cabinet['center'] for cabinet in cabinets]
+        routes = cable_routes(centers, stations, assignment)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Ongeldige invoer: {e}'}), 400
+
+    cables, _ = assign_cables(
+        [cable] * len(stations),
+        routes['houses'],
+        catalog,
+        ampere_per_house,
+        simultaneity,
+    )
+    lengths_per_cable = {}
+    for name, length in zip(cables, routes['length_m'].tolist(), strict=True):
+        if name is not None:
+            lengths_per_cable[name] = lengths_per_cable.get(name, 0) + length
+    seconds = time.perf_counter() - started
+    logger.info(
+        f'Kabelroutes voor {len(stations)} stations: '
+        f'{routes["total_length_m"]:.0f} m in {seconds:.2f}s'
+    )
+
+    return jsonify(
+        {
+            'stations': [
+                {
+                    'center': list(center),
+                    'houses': houses,
+                    'length_m': round(length, 1),
+                    'cable': name,
+                }
+                for center, houses, length, name in zip(
+                    stations,
+                    routes['houses'].tolist(),
+                    routes['length_m'].tolist(),
+                    cables,
+                    strict=True,
                 )
-                response.raise_for_status()
-                logger.info(f'Success with {overpass_url}')
-                break
-            except requests.RequestException as e:
-                logger.warning(f'Failed with {overpass_url}: {e}')
-                last_error = e
+            ],
+            'lengths_per_cable': {
+                name: round(length, 1) for name, length in lengths_per_cable.items()
+            },
+            'total_length_m': round(routes['total_length_m'], 1),
+            'routes': route_features(routes, cables),
+            'seconds': round(seconds, 3),
+        }
+    )
+
+
+@bp.route('/api/detection-stats', methods=['GET'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def detection_stats():
+    """Counters for the detection result cache and the image store"""
+    from apps.NETontwerp.detection_cache import get_detection_cache
+    from apps.NETontwerp.image_store import get_image_store
+
+    return jsonify(
+        {
+            'cache': get_detection_cache(current_app.config).stats(),
+            'images': get_image_store(current_app.config).stats(),
+        }
+    )
+
+
+@bp.route('/api/extraction-jobs', methods=['POST'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def create_extraction_job():
+    """Start a background extraction and return its job id right away"""
+    from apps.NETontwerp.building_store import get_result_store
+    from apps.NETontwerp.extraction import (
+        ExtractionRequestError,
+        extraction_error_message,
+        extraction_key,
+        extraction_settings,
+        parse_extraction_request,
+        run_extraction_job,
+    )
+    from apps.NETontwerp.jobs import get_job_manager
+
+    try:
+        polygon_coords, detail = parse_extraction_request(request.get_json())
+    except ExtractionRequestError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The job keeps only the totals and result_id; the buildings are read
+    # from the result store when the finished job is fetched, so a job
+    # whose result has been evicted there is run again.
+    def result_available(job):
+        return get_result_store().get(job.result['result_id']) is not None
+
+    settings = extraction_settings(current_app.config)
+    job, created = get_job_manager(current_app.config).submit(
+        extraction_key(polygon_coords, detail),
+        lambda progress, publish: run_extraction_job(
+            polygon_coords, detail, settings, progress, publish
+        ),
+        extraction_error_message,
+        reusable=result_available,
+    )
+
+    data = job.to_dict(include_result=False)
+    data['status_url'] = url_for('NETontwerp.extraction_job_status', job_id=job.id)
+    data['events_url'] = url_for('NETontwerp.extraction_job_events', job_id=job.id)
+    return jsonify(data), 202 if created else 200
+
+
+@bp.route('/api/extraction-jobs/<job_id>', methods=['GET'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def extraction_job_status(job_id):
+    """Poll the status, progress and (when done) result of a job
+
+    With ?since=N the batches of buildings published from the N-th one on
+    are included while the job runs, so the map can draw them before the
+    result is there.
+    """
+    from apps.NETontwerp.building_store import get_result_store
+    from apps.NETontwerp.jobs import get_job_manager
+    from apps.NETontwerp.payload import encode_batch, encode_payload, requested_format
+
+    manager = get_job_manager(current_app.config)
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Onbekende of verlopen taak'}), 404
+
+    payload_format = requested_format(request.args, request.headers.get('Accept'))
+    since = request.args.get('since', type=int)
+    data = job.to_dict()
+    if since is not None:
+        batches, data['next'] = manager.batches_since(job, since)
+        if 'result' in data:
+            batches = []
+        data['batches'] = [encode_batch(batch, payload_format) for batch in batches]
+    if 'result' in data:
+        store = get_result_store().get(data['result']['result_id'])
+        if store is None:
+            return jsonify({'error': 'Onbekend of verlopen resultaat'}), 404
+        result = dict(data['result'], buildings=store.to_buildings())
+        data['result'] = encode_payload(result, payload_format)
+    return _payload_response(data)
+
+
+@bp.route('/api/extraction-jobs/<job_id>/events', methods=['GET'])
+@handle_errors(redirect_endpoint='NETontwerp.main')
+def extraction_job_events(job_id):
+    """Server-Sent Events stream with progress and batches until the job finishes"""
+    import json
+
+    from apps.NETontwerp.jobs import get_job_manager
+    from apps.NETontwerp.payload import encode_batch, requested_format
+
+    manager = get_job_manager(current_app.config)
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Onbekende of verlopen taak'}), 404
+
+    payload_format = requested_format(request.args, request.headers.get('Accept'))
+
+    def events():
+        version = -1
+        sent = 0
+        while True:
+            current = manager.wait_for_change(job, version)
+            if current == version:
+                yield ': keep-alive\n\n'
                 continue
-        else:
-            # All APIs failed
-            raise last_error if last_error else requests.RequestException("All Overpass API servers failed")
-
-        osm_data = response.json()
-        logger.info(f'Received {len(osm_data.get("elements", []))} OSM elements')
-
-        # Create polygon for intersection check
-        poly = Polygon(polygon_coords)
-
-        # Process buildings
-        buildings = []
-        nodes = {}
-        total_area = 0
-
-        # First pass: collect all nodes
-        for element in osm_data.get('elements', []):
-            if element['type'] == 'node':
-                nodes[element['id']] = (element['lat'], element['lon'])
-
-        # Second pass: process buildings
-        for element in osm_data.get('elements', []):
-            if element['type'] == 'way' and 'building' in element.get('tags', {}):
-                node_ids = element.get('nodes', [])
-                building_coords = []
-
-                for node_id in node_ids:
-                    if node_id in nodes:
-                        lat, lon = nodes[node_id]
-                        building_coords.append([lat, lon])
-
-                if len(building_coords) >= 3:
-                    # Check if building center is within polygon
-                    building_poly = Polygon(building_coords)
-                    center = building_poly.centroid
-
-                    if poly.contains(Point(center.x, center.y)):
-                        # Calculate area
-                        area_m2 = calculate_area_m2(building_poly, center.x)
-
-                        # Classify
-                        house_type = classify_house_type(area_m2)
-
-                        # Only include if valid (not shed)
-                        if house_type:
-                            buildings.append({
-                                'id': element['id'],
-                                'coords': building_coords,
-                                'center': [center.x, center.y],
-                                'type': house_type,
-                                'osm_type': element.get('tags', {}).get('building', 'yes'),
-                                'name': element.get('tags', {}).get('name', ''),
-                                'area_m2': round(area_m2, 1),
-                            })
-                            total_area += area_m2
-
-        logger.info(f'Found {len(buildings)} houses (sheds filtered)')
-
-        # Calculate total amperage
-        total_amperage = len(buildings) * 10
-
-        return jsonify({
-            'success': True,
-            'count': len(buildings),
-            'buildings': buildings,
-            'total_amperage': total_amperage,
-            'total_area_m2': round(total_area, 1),
-        })
-
-    except requests.RequestException as e:
-        logger.error(f'Overpass API error: {e}')
-        return jsonify({'error': f'API fout: {str(e)}'}), 500
-    except Exception as e:
-        logger.error(f'Building extraction error: {e}')
-        return jsonify({'error': f'Extractie fout: {str(e)}'}), 500
+            version = current
+            # Read before the batches, so a finished job has sent them all
+            finished = job.finished
+            batches, sent = manager.batches_since(job, sent)
+            for batch in batches:
+                payload = json.dumps(encode_batch(batch, payload_format))
+                yield f'event: batch\ndata: {payload}\n\n'
+            event = 'done' if finished else 'progress'
+            payload = json.dumps(job.to_dict(include_result=finished))
+            yield f'event: {event}\ndata: {payload}\n\n'
+            if finished:
+                return
+
+    return Response(
+        events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
@@ -0,0 +1,225 @@
+"""On-disk cache of Overpass building elements keyed by fixed lat/lon tiles."""
+
+import gzip
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TILE_SIZE = 0.01  # degrees, roughly 1.1 x 0.7 km in the Netherlands
+CACHE_FORMAT = 'v2'  # bump when the stored element format changes
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+class TileCache:
+    """Stores building ways per tile with a TTL and LRU size bound.
+
+    Every tile is one gzipped JSON file. The file's mtime is bumped on each
+    read so eviction can drop the least recently used tiles first, while the
+    fetch time is kept inside the payload to enforce the TTL.
+    """
+
+    def __init__(
+        self,
+        cache_dir,
+        tile_size=DEFAULT_TILE_SIZE,
+        ttl=7 * 24 * 3600,
+        max_bytes=256 * 1024 * 1024,
+    ):
+        self.cache_dir = cache_dir
+        self.tile_size = tile_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def tiles_for_bbox(self, south, west, north, east):
+        """Return the (ix, iy) keys of all tiles covering the bounding box."""
+        size = self.tile_size
+        x0, x1 = math.floor(west / size), math.floor(east / size)
+        y0, y1 = math.floor(south / size), math.floor(north / size)
+        return [(ix, iy) for iy in range(y0, y1 + 1) for ix in range(x0, x1 + 1)]
+
+    def tile_bounds(self, tile):
+        """Return (south, west, north, east) of a tile."""
+        ix, iy = tile
+        size = self.tile_size
+        return (
+            round(iy * size, 7),
+            round(ix * size, 7),
+            round((iy + 1) * size, 7),
+            round((ix + 1) * size, 7),
+        )
+
+    def group_tiles(self, tiles, block_size):
+        """Group tiles into blocks of block_size x block_size tiles.
+
+        Returns (tiles, bbox) pairs, one per block that contains tiles.
+        """
+        blocks = {}
+        for tile in tiles:
+            ix, iy = tile
+            blocks.setdefault((ix // block_size, iy // block_size), []).append(tile)
+
+        groups = []
+        for block_tiles in blocks.values():
+            bounds = [self.tile_bounds(tile) for tile in block_tiles]
+            bbox = (
+                min(b[0] for b in bounds),
+                min(b[1] for b in bounds),
+                max(b[2] for b in bounds),
+                max(b[3] for b in bounds),
+            )
+            groups.append((block_tiles, bbox))
+        return groups
+
+    def _path(self, tile):
+        ix, iy = tile
+        return os.path.join(
+            self.cache_dir, f'{CACHE_FORMAT}_{self.tile_size:g}_{ix}_{iy}.json.gz'
+        )
+
+    def get(self, tile):
+        """Return the cached elements of a tile, or None when missing/expired."""
+        path = self._path(tile)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f'Dropping unreadable cache tile {path}: {e}')
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        if time.time() - payload.get('fetched_at', 0) > self.ttl:
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return payload['elements']
+
+    def put(self, tile, elements):
+        """Store the elements of a tile, replacing any previous entry atomically."""
+        path = self._path(tile)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        payload = {'fetched_at': time.time(), 'elements': elements}
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def put_many(self, tiles_elements):
+        for tile, elements in tiles_elements.items():
+            self.put(tile, elements)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used tiles until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith('.json.gz'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+            logger.info(f'Tile cache evicted down to {total} bytes')
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def split_by_tile(self, ways, tiles):
+        """Distribute resolved BuildingWays over the tiles they touch.
+
+        A way is stored in every requested tile that contains one of its
+        points, in Overpass ``out geom`` form so each tile can be served on
+        its own. Tiles without any building still get an (empty) entry.
+        """
+        wanted = set(tiles)
+        per_tile = {tile: [] for tile in tiles}
+        point_ix = np.floor(ways.coords[:, 1] / self.tile_size).astype(np.int64)
+        point_iy = np.floor(ways.coords[:, 0] / self.tile_size).astype(np.int64)
+
+        for i in range(len(ways)):
+            start, end = ways.offsets[i], ways.offsets[i + 1]
+            way_tiles = set(
+                zip(
+                    point_ix[start:end].tolist(),
+                    point_iy[start:end].tolist(),
+                    strict=True,
+                )
+            )
+            way_tiles &= wanted
+            if not way_tiles:
+                continue
+            element = {
+                'type': 'way',
+                'id': int(ways.ids[i]),
+                'tags': {'building': ways.osm_types[i]},
+                'geometry': [
+                    {'lat': lat, 'lon': lon}
+                    for lat, lon in ways.coords[start:end].tolist()
+                ],
+            }
+            if ways.names[i]:
+                element['tags']['name'] = ways.names[i]
+            for tile in way_tiles:
+                per_tile[tile].append(element)
+
+        return per_tile
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def get_tile_cache(config):
+    """Return the shared TileCache for the app config, or None when disabled."""
+    cache_dir = config.get('OVERPASS_CACHE_DIR')
+    if not cache_dir:
+        return None
+
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = TileCache(
+                cache_dir,
+                tile_size=config.get('OVERPASS_TILE_SIZE', DEFAULT_TILE_SIZE),
+                ttl=config.get('OVERPASS_CACHE_TTL', 7 * 24 * 3600),
+                max_bytes=config.get('OVERPASS_CACHE_MAX_BYTES', 256 * 1024 * 1024),
+            )
+            _caches[cache_dir] = cache
+        return cache
@@ -0,0 +1,336 @@
+"""Mapbox Vector Tiles for extracted buildings.
+
+A stored extraction result gets a BuildingTileSet on first use. Tiles are
+cut from it on request: the buildings overlapping the tile are clipped to
+the tile (plus a small buffer), simplified to a fraction of a pixel, and
+encoded with the small protobuf writer below, so no extra
+dependency is needed. Below POLYGON_MIN_ZOOM a building is only a point.
+Encoded tiles are cached per tile set.
+"""
+
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import shapely
+
+from apps.NETontwerp.building_store import get_result_store
+from apps.NETontwerp.buildings import build_polygons
+
+LAYER_NAME = 'buildings'
+EXTENT = 4096
+BUFFER = 64  # tile units drawn outside the tile so edges do not show seams
+SIMPLIFY_TOLERANCE = 4  # tile units, a quarter pixel on a 256 px tile
+POLYGON_MIN_ZOOM = 15
+MAX_TILE_SETS = 16
+MAX_CACHED_TILES = 1024  # per tile set
+
+GEOM_POINT = 1
+GEOM_POLYGON = 3
+
+_CMD_MOVE_TO = 1
+_CMD_LINE_TO = 2
+_CMD_CLOSE_PATH = 7
+
+_tile_sets = OrderedDict()
+_tile_sets_lock = threading.Lock()
+
+
+def lonlat_to_world(lat, lon):
+    """Project to Web Mercator in [0, 1] world units, y pointing down."""
+    x = (np.asarray(lon) + 180.0) / 360.0
+    lat_rad = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0
+    return x, y
+
+
+def _varint(value):
+    if value < 0:
+        # Would never leave the loop below; signed values go through _zigzag
+        raise ValueError(f'Varints cannot be negative, got {value}')
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field_varint(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _field_bytes(number, payload):
+    return _varint((number << 3) | 2) + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _field_bytes(number, b''.join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    if isinstance(value, str):
+        return _field_bytes(1, value.encode('utf-8'))
+    if isinstance(value, bool):
+        return _field_varint(7, int(value))
+    if isinstance(value, int):
+        return _field_varint(6, _zigzag(value))
+    return _varint((3 << 3) | 1) + struct.pack('<d', value)
+
+
+class _GeometryWriter:
+    """Builds the command integers of one feature geometry."""
+
+    def __init__(self):
+        self.commands = []
+        self.x = 0
+        self.y = 0
+
+    def _command(self, command, count):
+        self.commands.append((command & 0x7) | (count << 3))
+
+    def _point(self, x, y):
+        self.commands.append(_zigzag(x - self.x))
+        self.commands.append(_zigzag(y - self.y))
+        self.x, self.y = x, y
+
+    def point(self, x, y):
+        self._command(_CMD_MOVE_TO, 1)
+        self._point(x, y)
+
+    def ring(self, points):
+        self._command(_CMD_MOVE_TO, 1)
+        self._point(*points[0])
+        self._command(_CMD_LINE_TO, len(points) - 1)
+        for x, y in points[1:]:
+            self._point(x, y)
+        self._command(_CMD_CLOSE_PATH, 1)
+
+
+def _ring_points(coords, exterior):
+    """Integer ring without repeated or closing points, wound for MVT.
+
+    Exterior rings are clockwise on screen (positive area with y down),
+    holes the other way. Returns None for rings that collapsed.
+    """
+    points = np.rint(coords[:-1]).astype(np.int64)
+    if len(points) < 3:
+        return None
+    keep = np.any(points != np.roll(points, 1, axis=0), axis=1)
+    points = points[keep]
+    if len(points) < 3:
+        return None
+    x, y = points[:, 0], points[:, 1]
+    area = np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)
+    if area == 0:
+        return None
+    if (area > 0) != exterior:
+        points = points[::-1]
+    return points.tolist()
+
+
+def _polygon_geometry(geometry):
+    writer = _GeometryWriter()
+    for part in shapely.get_parts(geometry):
+        if not isinstance(part, shapely.Polygon) or part.is_empty:
+            continue
+        exterior = _ring_points(np.asarray(part.exterior.coords), exterior=True)
+        if exterior is None:
+            continue
+        writer.ring(exterior)
+        for interior in part.interiors:
+            hole = _ring_points(np.asarray(interior.coords), exterior=False)
+            if hole is not None:
+                writer.ring(hole)
+    return writer.commands
+
+
+class _LayerWriter:
+    def __init__(self, name):
+        self.name = name
+        self.features = []
+        self.keys = {}
+        self.values = {}
+
+    def _tags(self, properties):
+        tags = []
+        for key, value in properties.items():
+            if value is None or value == '':
+                continue
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault((type(value), value), len(self.values)))
+        return tags
+
+    def add(self, feature_id, geom_type, geometry, properties):
+        feature = (
+            _field_varint(1, feature_id)
+            + _packed(2, self._tags(properties))
+            + _field_varint(3, geom_type)
+            + _packed(4, geometry)
+        )
+        self.features.append(_field_bytes(2, feature))
+
+    def encode(self):
+        layer = _field_varint(15, 2) + _field_bytes(1, self.name.encode('utf-8'))
+        layer += b''.join(self.features)
+        layer += b''.join(_field_bytes(3, key.encode('utf-8')) for key in self.keys)
+        layer += b''.join(
+            _field_bytes(4, _encode_value(value)) for _, value in self.values
+        )
+        layer += _field_varint(5, EXTENT)
+        return _field_bytes(3, layer)
+
+
+class BuildingTileSet:
+    """The buildings of one stored result, ready to be cut into tiles.
+
+    Only the Web Mercator projection of the footprints and the bounds are
+    computed here; ids and properties are read from the BuildingStore.
+    """
+
+    def __init__(self, store, max_cached_tiles=MAX_CACHED_TILES):
+        self.store = store
+        self.ids = store.records['id'].tolist()
+        self.center_x, self.center_y = lonlat_to_world(
+            store.records['lat'], store.records['lon']
+        )
+        self.offsets = store.offsets
+        world_x, world_y = lonlat_to_world(store.coords[:, 0], store.coords[:, 1])
+        self.coords = np.column_stack([world_x, world_y])
+
+        # Per-building bounds, falling back to the center without footprint
+        self.bounds = np.column_stack(
+            [self.center_x, self.center_y, self.center_x, self.center_y]
+        )
+        has_coords = np.diff(self.offsets) > 0
+        if has_coords.any():
+            starts = self.offsets[:-1][has_coords]
+            self.bounds[has_coords, :2] = np.minimum.reduceat(self.coords, starts)
+            self.bounds[has_coords, 2:] = np.maximum.reduceat(self.coords, starts)
+        self.has_coords = has_coords
+
+        self._cache = OrderedDict()
+        self._max_cached_tiles = max_cached_tiles
+        self._lock = threading.Lock()
+
+    def tile(self, z, x, y):
+        """Return the encoded MVT tile z/x/y, from cache when possible."""
+        key = (z, x, y)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                return data
+
+        data = self._render(z, x, y)
+        with self._lock:
+            self._cache[key] = data
+            while len(self._cache) > self._max_cached_tiles:
+                self._cache.popitem(last=False)
+        return data
+
+    def _properties(self, i):
+        store = self.store
+        record = store.records[i]
+        properties = {'id': self.ids[i], 'nr': i + 1, 'name': store.names[i]}
+        if store.has_footprints:
+            properties['type'] = store.type_names[record['type_code']]
+            properties['area_m2'] = round(float(record['area_m2']), 1)
+        return properties
+
+    def _render(self, z, x, y):
+        scale = 2**z
+        margin = BUFFER / EXTENT / scale
+        min_x, min_y = x / scale - margin, y / scale - margin
+        max_x, max_y = (x + 1) / scale + margin, (y + 1) / scale + margin
+        selected = np.flatnonzero(
+            (self.bounds[:, 2] >= min_x)
+            & (self.bounds[:, 0] <= max_x)
+            & (self.bounds[:, 3] >= min_y)
+            & (self.bounds[:, 1] <= max_y)
+        )
+        if not len(selected):
+            return b''
+        layer = _LayerWriter(LAYER_NAME)
+
+        def to_tile(wx, wy):
+            return (wx * scale - x) * EXTENT, (wy * scale - y) * EXTENT
+
+        polygons = z >= POLYGON_MIN_ZOOM
+        points = selected[~self.has_coords[selected]] if polygons else selected
+        if len(points):
+            tile_x, tile_y = to_tile(self.center_x[points], self.center_y[points])
+            inside = (
+                (tile_x >= 0) & (tile_x < EXTENT) & (tile_y >= 0) & (tile_y < EXTENT)
+            )
+            for i, px, py in zip(
+                points[inside].tolist(),
+                np.rint(tile_x[inside]).astype(np.int64).tolist(),
+                np.rint(tile_y[inside]).astype(np.int64).tolist(),
+                strict=True,
+            ):
+                writer = _GeometryWriter()
+                writer.point(px, py)
+                layer.add(self.ids[i], GEOM_POINT, writer.commands, self._properties(i))
+
+        if polygons:
+            shapes = selected[self.has_coords[selected]]
+            if len(shapes):
+                self._add_polygons(layer, shapes, to_tile)
+
+        return layer.encode() if layer.features else b''
+
+    def _add_polygons(self, layer, shapes, to_tile):
+        counts = np.diff(self.offsets)[shapes]
+        starts = self.offsets[:-1][shapes]
+        point_index = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        point_index += np.arange(int(counts.sum()))
+        tile_x, tile_y = to_tile(
+            self.coords[point_index, 0], self.coords[point_index, 1]
+        )
+        offsets = np.zeros(len(shapes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        geoms = build_polygons(np.column_stack([tile_x, tile_y]), offsets)
+        valid = geoms != None  # noqa: E711
+        geoms = shapely.clip_by_rect(
+            geoms[valid], -BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER
+        )
+        geoms = shapely.simplify(geoms, SIMPLIFY_TOLERANCE)
+        for i, geometry in zip(shapes[valid].tolist(), geoms, strict=True):
+            if geometry.is_empty:
+                continue
+            commands = _polygon_geometry(geometry)
+            if commands:
+                layer.add(self.ids[i], GEOM_POLYGON, commands, self._properties(i))
+
+
+def get_tile_set(result_id):
+    """Return the BuildingTileSet of a stored result, or None if unknown.
+
+    Tile sets are built on first use and kept for the most recent results;
+    a result that was stored again under the same id gets a new tile set.
+    """
+    store = get_result_store().get(result_id)
+    if store is None:
+        return None
+    with _tile_sets_lock:
+        tile_set = _tile_sets.get(result_id)
+        if tile_set is not None and tile_set.store is store:
+            _tile_sets.move_to_end(result_id)
+            return tile_set
+
+    tile_set = BuildingTileSet(store)
+    with _tile_sets_lock:
+        _tile_sets[result_id] = tile_set
+        while len(_tile_sets) > MAX_TILE_SETS:
+            _tile_sets.popitem(last=False)
+    return tile_set
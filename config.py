@@ -13,6 +13,52 @@ class Config:
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16777216))
     ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'pdf,xlsx,csv').split(','))
 
+    # Overpass tile cache, set OVERPASS_CACHE_DIR to an empty string to disable
+    OVERPASS_CACHE_DIR = os.getenv('OVERPASS_CACHE_DIR', 'cache/overpass')
+    OVERPASS_TILE_SIZE = float(os.getenv('OVERPASS_TILE_SIZE', 0.01))
+    OVERPASS_CACHE_TTL = int(os.getenv('OVERPASS_CACHE_TTL', 7 * 24 * 3600))
+    OVERPASS_CACHE_MAX_BYTES = int(os.getenv('OVERPASS_CACHE_MAX_BYTES', 268435456))
+
+    # Overpass mirrors (comma separated, empty for the built-in list) and hedging
+    OVERPASS_URLS = [u for u in os.getenv('OVERPASS_URLS', '').split(',') if u]
+    OVERPASS_HEDGE_DELAY = float(os.getenv('OVERPASS_HEDGE_DELAY', 2.0))
+    OVERPASS_TIMEOUT = int(os.getenv('OVERPASS_TIMEOUT', 60))
+
+    # Polygons larger than this (degrees per side) are fetched as parallel parts
+    OVERPASS_SUBTILE_SIZE = float(os.getenv('OVERPASS_SUBTILE_SIZE', 0.02))
+    OVERPASS_MAX_PARALLEL = int(os.getenv('OVERPASS_MAX_PARALLEL', 3))
+
+    # Offline building index (manage.py build-building-index), used when present
+    BUILDING_INDEX_PATH = os.getenv('BUILDING_INDEX_PATH', 'data/building_index')
+
+    # Background extraction jobs. Jobs, results and detection images live in
+    # process memory: run gunicorn with one worker process (see README.md)
+    EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', 4))
+    EXTRACTION_JOB_TTL = int(os.getenv('EXTRACTION_JOB_TTL', 3600))
+
+    # Cable catalog data file, empty for the one shipped with NETontwerp
+    CABLE_CATALOG_PATH = os.getenv('CABLE_CATALOG_PATH', '')
+
+    # Automatic stroomkast placement, 0 ampere means the strongest catalog cable
+    STROOMKAST_RADIUS_M = float(os.getenv('STROOMKAST_RADIUS_M', 150))
+    STROOMKAST_AMPERE_BUDGET = float(os.getenv('STROOMKAST_AMPERE_BUDGET', 0))
+
+    # House detection threshold profile (see house_analysis.DETECTION_PROFILES)
+    HOUSE_DETECTION_PROFILE = os.getenv('HOUSE_DETECTION_PROFILE', 'default')
+
+    # Tiled house detection for large images, 0 workers means one per CPU
+    HOUSE_DETECTION_TILE_SIZE = int(os.getenv('HOUSE_DETECTION_TILE_SIZE', 2048))
+    HOUSE_DETECTION_WORKERS = int(os.getenv('HOUSE_DETECTION_WORKERS', 0))
+    HOUSE_DETECTION_PDF_DPI = int(os.getenv('HOUSE_DETECTION_PDF_DPI', 150))
+
+    # Detection results by hash of the upload and parameters
+    DETECTION_CACHE_MAX_BYTES = int(os.getenv('DETECTION_CACHE_MAX_BYTES', 134217728))
+
+    # Annotated detection images, kept in memory and served by content hash
+    DETECTION_IMAGE_STORE_MAX_BYTES = int(
+        os.getenv('DETECTION_IMAGE_STORE_MAX_BYTES', 268435456)
+    )
+
 
 class DevelopmentConfig(Config):
     DEBUG = True
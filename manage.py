@@ -1,3 +1,4 @@
+import json
 import os
 import subprocess
 import sys
@@ -33,6 +34,78 @@ def deploy(target):
     deploy_to_production(target)
 
 
+@cli.command()
+@click.option('--count', default=5000, help='Number of synthetic buildings')
+@click.option('--repeat', default=3, help='Runs per implementation, best is kept')
+def benchmark_buildings(count, repeat):
+    """Benchmark the building extraction pipeline"""
+    from apps.NETontwerp.benchmarks import benchmark_building_extraction
+
+    result = benchmark_building_extraction(count=count, repeat=repeat)
+    click.echo(json.dumps(result, indent=2))
+
+
+@cli.command()
+@click.option(
+    '--sizes', default='1,5,12,25,50', help='Image sizes in megapixels, comma separated'
+)
+@click.option(
+    '--mode',
+    type=click.Choice(['auto', 'tiled', 'untiled']),
+    default='auto',
+    help='Tiled detection, or auto by image size',
+)
+@click.option('--repeat', default=1, help='Runs per size, best is kept')
+@click.option('--seed', default=0, help='Seed for the synthetic maps')
+@click.option('--output', type=click.Path(dir_okay=False), help='Also write to file')
+def benchmark_detection(sizes, mode, repeat, seed, output):
+    """Benchmark house detection on synthetic map images"""
+    from apps.NETontwerp.benchmarks import benchmark_house_detection
+
+    try:
+        sizes = [float(size) for size in sizes.split(',')]
+    except ValueError as e:
+        raise click.BadParameter('sizes needs numbers like 1,5,12') from e
+    tiled = {'auto': None, 'tiled': True, 'untiled': False}[mode]
+
+    results = benchmark_house_detection(sizes, tiled=tiled, repeat=repeat, seed=seed)
+    body = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(body + '\n')
+    click.echo(body)
+
+
+@cli.command()
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--output', default='data/building_index', help='Index directory to write'
+)
+@click.option('--bbox', help='Only keep buildings in south,west,north,east')
+def build_building_index(source, output, bbox):
+    """Build the offline building index from an OSM .pbf or BAG .gpkg"""
+    from apps.NETontwerp.building_index import build_index
+
+    if bbox:
+        try:
+            bbox = tuple(float(v) for v in bbox.split(','))
+        except ValueError as e:
+            raise click.BadParameter(
+                'bbox needs four numbers: south,west,north,east', param_hint='--bbox'
+            ) from e
+        if len(bbox) != 4:
+            raise click.BadParameter(
+                'bbox needs four numbers: south,west,north,east', param_hint='--bbox'
+            )
+
+    click.echo(f'Building index from {source}...')
+    try:
+        count = build_index(source, output, bbox=bbox)
+    except (RuntimeError, ValueError) as e:
+        raise click.ClickException(str(e)) from e
+    click.echo(f'✓ Indexed {count} buildings into {output}')
+
+
 def create_new_app(app_name):
     app_dir = f'apps/{app_name}'
 
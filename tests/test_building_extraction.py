@@ -0,0 +1,94 @@
+import pytest
+
+from apps.NETontwerp.benchmarks import (
+    legacy_extract_houses,
+    synthetic_overpass_elements,
+)
+from apps.NETontwerp.building_store import BuildingStore
+from apps.NETontwerp.buildings import (
+    extract_house_store,
+    extract_houses,
+    iter_house_batches,
+)
+
+
+def as_geometry_elements(elements):
+    """The same ways in ``out geom`` form, without separate nodes."""
+    nodes = {e['id']: e for e in elements if e['type'] == 'node'}
+    ways = []
+    for element in elements:
+        if element['type'] != 'way':
+            continue
+        geometry = [
+            {'lat': nodes[ref]['lat'], 'lon': nodes[ref]['lon']}
+            for ref in element['nodes']
+        ]
+        ways.append({**element, 'geometry': geometry})
+        del ways[-1]['nodes']
+    return ways
+
+
+def assert_same_houses(actual, expected):
+    buildings, total_area = actual
+    legacy_buildings, legacy_area = expected
+    assert [b['id'] for b in buildings] == [b['id'] for b in legacy_buildings]
+    for building, legacy in zip(buildings, legacy_buildings, strict=True):
+        assert building['coords'] == legacy['coords']
+        assert building['center'] == pytest.approx(legacy['center'], abs=1e-12)
+        assert building['area_m2'] == legacy['area_m2']
+        for key in ('type', 'osm_type', 'name'):
+            assert building[key] == legacy[key]
+    assert total_area == pytest.approx(legacy_area)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_vectorized_extraction_matches_legacy_loop(seed):
+    elements, polygon = synthetic_overpass_elements(800, seed=seed)
+
+    houses = extract_houses(elements, polygon)
+
+    assert houses[0]
+    assert_same_houses(houses, legacy_extract_houses(elements, polygon))
+
+
+def test_malformed_ways_are_skipped_like_the_legacy_loop():
+    elements, polygon = synthetic_overpass_elements(100, seed=3)
+    inside = next(e for e in elements if e['type'] == 'way' and e['id'] == 10_000_055)
+    nodes = inside['nodes']
+    elements += [
+        # Two usable nodes only
+        {'type': 'way', 'id': 1, 'nodes': [nodes[0], nodes[1], 999_999], 'tags': {}},
+        {
+            'type': 'way',
+            'id': 2,
+            'nodes': [nodes[0], nodes[1]],
+            'tags': {'building': 'yes'},
+        },
+        # Not a building
+        {'type': 'way', 'id': 3, 'nodes': nodes, 'tags': {'highway': 'service'}},
+        {'type': 'relation', 'id': 4, 'members': [], 'tags': {'building': 'yes'}},
+    ]
+
+    houses = extract_houses(elements, polygon)
+
+    assert_same_houses(houses, legacy_extract_houses(elements, polygon))
+
+
+def test_geometry_output_gives_the_same_houses():
+    elements, polygon = synthetic_overpass_elements(400, seed=4)
+
+    from_nodes = extract_houses(elements, polygon)
+    from_geometry = extract_houses(as_geometry_elements(elements), polygon)
+
+    assert from_geometry == from_nodes
+
+
+def test_streamed_batches_add_up_to_the_full_extraction():
+    elements, polygon = synthetic_overpass_elements(600, seed=5)
+
+    batches = list(iter_house_batches(as_geometry_elements(elements), polygon, 100))
+    streamed = BuildingStore.concat(batches, polygon)
+    full = extract_house_store(elements, polygon)
+
+    assert len(batches) > 2
+    assert streamed.to_buildings() == full.to_buildings()
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from apps.NETontwerp.cable_routes import cable_routes, nearest_stations, route_features
+from apps.NETontwerp.placement import METERS_PER_DEGREE, project_to_meters
+from core.app_factory import create_app
+
+
+def prim_length(points):
+    """Minimum spanning tree length over all pairs, O(n^2)."""
+    if len(points) < 2:
+        return 0.0
+    distances = np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+    best = distances[0].copy()
+    in_tree = np.zeros(len(points), dtype=bool)
+    in_tree[0] = True
+    total = 0.0
+    for _ in range(len(points) - 1):
+        best[in_tree] = np.inf
+        nearest = int(best.argmin())
+        total += best[nearest]
+        in_tree[nearest] = True
+        best = np.minimum(best, distances[nearest])
+    return total
+
+
+def reference_lengths(centers, stations, assignment):
+    points = project_to_meters(np.vstack([stations, centers]))
+    station_points, house_points = points[: len(stations)], points[len(stations) :]
+    return [
+        prim_length(np.vstack([station_points[s], house_points[assignment == s]]))
+        for s in range(len(stations))
+    ]
+
+
+def random_points(count, seed, spread=0.01):
+    rng = np.random.default_rng(seed)
+    return np.column_stack(
+        [52.0 + rng.uniform(0, spread, count), 5.0 + rng.uniform(0, spread, count)]
+    )
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_route_lengths_match_a_brute_force_tree(seed):
+    centers = random_points(400, seed)
+    stations = random_points(5, seed + 10)
+
+    routes = cable_routes(centers, stations)
+
+    assignment = nearest_stations(centers, stations)
+    expected = reference_lengths(centers, stations, assignment)
+    assert routes['length_m'] == pytest.approx(expected, rel=1e-9)
+    assert routes['total_length_m'] == pytest.approx(sum(expected), rel=1e-9)
+    assert routes['houses'].tolist() == np.bincount(assignment, minlength=5).tolist()
+    # A tree over a station and its n houses has n edges
+    assert [len(s) for s in routes['segments']] == routes['houses'].tolist()
+
+
+def test_nearest_stations_matches_brute_force():
+    centers = random_points(300, seed=3)
+    stations = random_points(7, seed=4)
+
+    points = project_to_meters(np.vstack([stations, centers]))
+    station_points, house_points = points[:7], points[7:]
+    distances = np.hypot(
+        *(house_points[:, None, :] - station_points[None, :, :]).transpose(2, 0, 1)
+    )
+    assert nearest_stations(centers, stations).tolist() == distances.argmin(1).tolist()
+
+
+def test_duplicate_points_are_connected_with_zero_length():
+    station = [52.0, 5.0]
+    house = [52.0 + 100 / METERS_PER_DEGREE, 5.0]
+    centers = [station, house, house, house]
+
+    routes = cable_routes(centers, [station])
+
+    assert routes['houses'].tolist() == [4]
+    assert len(routes['segments'][0]) == 4
+    assert routes['total_length_m'] == pytest.approx(100, rel=1e-3)
+
+
+def test_collinear_houses_form_a_chain():
+    step = 25 / METERS_PER_DEGREE
+    centers = [[52.0 + i * step, 5.0] for i in range(1, 9)]
+
+    routes = cable_routes(centers, [[52.0, 5.0]])
+
+    assert len(routes['segments'][0]) == 8
+    assert routes['total_length_m'] == pytest.approx(8 * 25, rel=1e-3)
+
+
+def test_explicit_assignment_is_used_and_checked():
+    centers = random_points(50, seed=5)
+    stations = random_points(2, seed=6)
+    assignment = np.arange(50) % 2
+
+    routes = cable_routes(centers, stations, assignment)
+
+    assert routes['houses'].tolist() == [25, 25]
+    expected = reference_lengths(centers, stations, assignment)
+    assert routes['length_m'] == pytest.approx(expected, rel=1e-9)
+    with pytest.raises(ValueError):
+        cable_routes(centers, stations, assignment[:-1])
+    with pytest.raises(ValueError):
+        cable_routes(centers, stations, np.full(50, 2))
+    with pytest.raises(ValueError):
+        cable_routes(centers, [])
+
+
+def test_station_without_houses_has_no_route():
+    routes = cable_routes(random_points(10, seed=7), [[52.005, 5.005], [53.0, 6.0]])
+
+    assert routes['houses'].tolist() == [10, 0]
+    assert routes['segments'][1] == []
+    assert routes['length_m'][1] == 0
+
+
+def test_route_features_are_geojson_lines():
+    station = [52.0, 5.0]
+    house = [52.001, 5.002]
+    routes = cable_routes([station, house], [station])
+
+    features = route_features(routes, ['4*150mm2 Al'])
+
+    assert features['type'] == 'FeatureCollection'
+    (feature,) = features['features']
+    # The house at the station needs no line, coordinates are (lon, lat)
+    assert feature['geometry'] == {
+        'type': 'MultiLineString',
+        'coordinates': [[station[::-1], house[::-1]]],
+    }
+    assert feature['properties']['station'] == 1
+    assert feature['properties']['houses'] == 2
+    assert feature['properties']['cable'] == '4*150mm2 Al'
+    assert feature['properties']['length_m'] == round(routes['total_length_m'], 1)
+
+
+@pytest.mark.parametrize('stations', [None, [[52.005, 5.005]]])
+@pytest.mark.parametrize('field', ['ampere_per_house', 'simultaneity'])
+def test_api_answers_a_bad_load_with_a_json_error(stations, field):
+    client = create_app('development').test_client()
+    data = {'centers': random_points(5, seed=8).tolist(), field: 0}
+    if stations is not None:
+        data['stations'] = stations
+
+    response = client.post('/NETontwerp/api/cable-routes', json=data)
+
+    assert response.status_code == 400
+    assert 'groter dan 0' in response.get_json()['error']
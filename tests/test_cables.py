@@ -0,0 +1,98 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from apps.NETontwerp.cables import CableCatalog
+
+
+def brute_force_cheapest(cables, ampere):
+    adequate = [cable for cable in cables if cable['capacity'] >= ampere]
+    if not adequate:
+        return None
+    if all('cost_per_m' in cable for cable in cables):
+        return min(adequate, key=lambda c: (c['cost_per_m'], -c['capacity']))
+    return min(adequate, key=lambda cable: cable['capacity'])
+
+
+def random_cables(rng, with_costs):
+    cables = []
+    for i in range(12):
+        cable = {'name': f'kabel {i}', 'capacity': rng.choice([30, 50, 70.5, 95, 150])}
+        if with_costs:
+            cable['cost_per_m'] = rng.choice([4.0, 6.5, 9.0, 12.5])
+        cables.append(cable)
+    return cables
+
+
+@pytest.mark.parametrize('with_costs', [True, False])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_cheapest_adequate_matches_brute_force(seed, with_costs):
+    rng = random.Random(seed)
+    cables = random_cables(rng, with_costs)
+    catalog = CableCatalog(cables)
+    loads = [rng.uniform(0, 160) for _ in range(200)] + [30, 70.5, 150, 151]
+
+    for load in loads:
+        expected = brute_force_cheapest(cables, load)
+        cable = catalog.cheapest_adequate(load)
+        if expected is None:
+            assert cable is None
+        else:
+            assert cable['capacity'] >= load
+            assert cable.get('cost_per_m') == expected.get('cost_per_m')
+            if not with_costs:
+                assert cable['capacity'] == expected['capacity']
+    assert catalog.select(np.array(loads)) == [
+        catalog.cheapest_adequate(load) for load in loads
+    ]
+
+
+def test_capacities_keep_fractional_amperes():
+    catalog = CableCatalog(
+        [{'name': 'dun', 'capacity': 70.5}, {'name': 'dik', 'capacity': 150}]
+    )
+
+    capacities = catalog.capacities(['dun', 'dik', None, 'onbekend'])
+
+    assert capacities.dtype == np.float64
+    assert capacities.tolist() == [70.5, 150.0, 0.0, 0.0]
+
+
+def test_lookup_by_name_and_file_order():
+    catalog = CableCatalog(
+        [{'name': 'b', 'capacity': 150}, {'name': 'a', 'capacity': 50}]
+    )
+
+    assert catalog.names() == ['b', 'a']
+    assert len(catalog) == 2
+    assert 'a' in catalog and 'c' not in catalog
+    assert catalog.get('a') == {'name': 'a', 'capacity': 50}
+    assert catalog.get('c') is None
+    assert catalog.capacity('c') == 0
+
+
+@pytest.mark.parametrize(
+    'cable',
+    [
+        {'capacity': 50},
+        {'name': '', 'capacity': 50},
+        {'name': 'x'},
+        {'name': 'x', 'capacity': '50'},
+    ],
+)
+def test_invalid_cables_are_rejected(cable):
+    with pytest.raises(ValueError):
+        CableCatalog([cable])
+
+
+def test_catalog_is_loaded_from_a_file(tmp_path):
+    path = tmp_path / 'kabels.json'
+    path.write_text(json.dumps([{'name': 'x', 'capacity': 95, 'cost_per_m': 3}]))
+
+    catalog = CableCatalog.from_file(str(path))
+
+    assert catalog.cheapest_adequate(90)['name'] == 'x'
+    assert catalog.cheapest_adequate(96) is None
+    assert len(CableCatalog.from_file()) > 0
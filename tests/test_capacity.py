@@ -0,0 +1,118 @@
+import random
+
+import numpy as np
+import pytest
+
+from apps.NETontwerp.cables import AUTO_CABLE, CableCatalog
+from apps.NETontwerp.capacity import (
+    assign_cables,
+    even_split,
+    load_ampere,
+    round_kva,
+    street_capacity,
+)
+
+CATALOG = CableCatalog(
+    [
+        {'name': '4*240mm2 Al', 'capacity': 240, 'cost_per_m': 20.0},
+        {'name': '4*150mm2 Al', 'capacity': 150, 'cost_per_m': 12.5},
+        {'name': '4*95mm2 Al', 'capacity': 95, 'cost_per_m': 13.0},
+        {'name': '4*50mm2 Al', 'capacity': 50, 'cost_per_m': 6.0},
+    ]
+)
+
+
+def legacy_streets(houses, cables):
+    """The per-street loop the capacity module replaced."""
+    streets = []
+    total_connected = 0
+    for houses_in_street, cable in zip(houses, cables, strict=True):
+        ampere_needed = houses_in_street * 10
+        kva_needed = ampere_needed * 0.23
+        if cable:
+            can_handle = CATALOG.capacity(cable) >= ampere_needed
+            connected = houses_in_street if can_handle else 0
+            total_connected += connected
+        else:
+            can_handle = False
+            connected = 0
+        streets.append(
+            {
+                'ampere_needed': ampere_needed,
+                'kva_needed': round(kva_needed, 2),
+                'can_handle': can_handle,
+                'connected': connected,
+            }
+        )
+    return streets, total_connected
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_street_capacity_matches_the_legacy_loop(seed):
+    rng = random.Random(seed)
+    names = [*CATALOG.names(), None, 'Onbekende kabel']
+    houses = [rng.randint(0, 30) for _ in range(200)]
+    cables = [rng.choice(names) for _ in houses]
+
+    result = street_capacity(
+        houses, CATALOG.capacities(cables), has_cable=[bool(c) for c in cables]
+    )
+
+    streets, total_connected = legacy_streets(houses, cables)
+    assert result['ampere_needed'].tolist() == [s['ampere_needed'] for s in streets]
+    assert round_kva(result['kva_needed']) == [s['kva_needed'] for s in streets]
+    assert result['can_handle'].tolist() == [s['can_handle'] for s in streets]
+    assert result['connected'].tolist() == [s['connected'] for s in streets]
+    assert result['total_connected'] == total_connected
+    assert result['total_unconnected'] == sum(houses) - total_connected
+
+
+def test_scenarios_are_checked_row_by_row():
+    houses = np.array([[3, 9, 20], [5, 5, 5], [0, 16, 24]])
+    capacities = np.array([95, 150, 240])
+
+    batch = street_capacity(houses, capacities, simultaneity=0.8)
+
+    for row, scenario in enumerate(houses):
+        single = street_capacity(scenario, capacities, simultaneity=0.8)
+        for key, values in single.items():
+            assert np.array_equal(batch[key][row], values), key
+
+
+def test_load_broadcasts_per_house_values():
+    houses = np.array([4, 10])
+
+    assert load_ampere(houses, np.array([10, 25]), 0.5).tolist() == [20, 125]
+    assert load_ampere(houses).tolist() == [40, 100]
+
+
+def test_capacity_defaults_to_a_cable_above_zero():
+    result = street_capacity([0, 3, 3], [0, 0, 50])
+
+    assert result['can_handle'].tolist() == [False, False, True]
+    assert result['total_connected'] == 3
+
+
+def test_negative_houses_are_rejected():
+    with pytest.raises(ValueError):
+        street_capacity([3, -1], [95, 95])
+
+
+def test_even_split_rounds_down():
+    assert even_split(17, 4).tolist() == [4, 4, 4, 4]
+    assert even_split(0, 2).tolist() == [0, 0]
+
+
+def test_auto_cable_is_the_cheapest_that_carries_the_load():
+    cables = [AUTO_CABLE, '4*240mm2 Al', AUTO_CABLE, AUTO_CABLE]
+
+    picked, auto = assign_cables(cables, [4, 30, 9, 30], CATALOG)
+
+    # 90 A fits 4*95mm2 and 4*150mm2, and 4*150mm2 is cheaper per meter
+    assert picked == ['4*50mm2 Al', '4*240mm2 Al', '4*150mm2 Al', None]
+    assert auto == [True, False, True, True]
+
+
+def test_auto_cable_needs_a_single_scenario():
+    with pytest.raises(ValueError):
+        assign_cables([AUTO_CABLE], [[3], [4]], CATALOG)
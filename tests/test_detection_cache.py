@@ -0,0 +1,41 @@
+from apps.NETontwerp.detection_cache import DetectionCache, detection_key
+
+
+def pages(size):
+    return [{'house_count': 1, 'image': (b'x' * size, 'image/png')}]
+
+
+def test_key_depends_on_bytes_params_and_options():
+    params = {'min_area': 1500}
+    key = detection_key(b'upload', params, extension='.png')
+    assert key == detection_key(b'upload', dict(params), extension='.png')
+    assert key != detection_key(b'other', params, extension='.png')
+    assert key != detection_key(b'upload', {'min_area': 400}, extension='.png')
+    assert key != detection_key(b'upload', params, extension='.jpg')
+
+
+def test_least_recently_used_entry_is_evicted_by_image_bytes():
+    cache = DetectionCache(max_bytes=250)
+    cache.put('a', pages(100))
+    cache.put('b', pages(100))
+    assert cache.get('a') is not None
+    cache.put('c', pages(100))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.stats()['bytes'] == 200
+
+
+def test_entry_larger_than_the_cache_is_not_kept():
+    cache = DetectionCache(max_bytes=50)
+    cache.put('a', pages(100))
+
+    assert cache.get('a') is None
+    assert cache.stats() == {
+        'entries': 0,
+        'bytes': 0,
+        'hits': 0,
+        'misses': 1,
+        'hit_rate': 0.0,
+    }
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+
+import pytest
+
+from apps.NETontwerp import extraction, overpass
+from apps.NETontwerp.building_store import get_result_store
+from apps.NETontwerp.jobs import get_job_manager
+from apps.NETontwerp.tile_cache import TileCache
+from core.app_factory import create_app
+from tests.test_extraction_order import POLYGON, house_ways
+
+JOBS_URL = '/NETontwerp/api/extraction-jobs'
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    ways = house_ways(120, seed=3)
+    monkeypatch.setattr(
+        overpass, 'fetch_overpass_elements', lambda query, **options: iter(ways)
+    )
+    settings = {
+        'index': None,
+        'cache': TileCache(str(tmp_path), tile_size=0.01),
+        'fetch_options': {'subtile_size': 0.02, 'max_workers': 3},
+    }
+    monkeypatch.setattr(extraction, 'extraction_settings', lambda config: settings)
+    app = create_app('development')
+    with app.test_client() as client:
+        client.ways = ways
+        client.manager = get_job_manager(app.config)
+        yield client
+
+
+def wait_until_done(client, job_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get(f'{JOBS_URL}/{job_id}')
+        if response.get_json().get('status') in ('done', 'failed'):
+            return response
+        time.sleep(0.02)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+def test_finished_job_keeps_only_the_summary(client):
+    created = client.post(JOBS_URL, json={'polygon': POLYGON})
+    job_id = created.get_json()['job_id']
+
+    response = wait_until_done(client, job_id)
+
+    result = client.manager.get(job_id).result
+    assert 'buildings' not in result
+    assert result['count'] == len(client.ways)
+    # The buildings are encoded from the result store
+    buildings = response.get_json()['result']['buildings']
+    assert [b['id'] for b in buildings] == sorted(way['id'] for way in client.ways)
+
+
+def test_job_with_an_evicted_result_runs_again(client):
+    polygon = [[lat, lon + 1e-3] for lat, lon in POLYGON]
+    first = client.post(JOBS_URL, json={'polygon': polygon}).get_json()['job_id']
+    result_id = wait_until_done(client, first).get_json()['result']['result_id']
+
+    assert client.post(JOBS_URL, json={'polygon': polygon}).status_code == 200
+    get_result_store()._results.pop(result_id)
+    assert client.get(f'{JOBS_URL}/{first}').status_code == 404
+
+    again = client.post(JOBS_URL, json={'polygon': polygon})
+    assert again.status_code == 202
+    response = wait_until_done(client, again.get_json()['job_id'])
+    assert response.get_json()['result']['result_id'] == result_id
+
+
+@pytest.fixture
+def paused_elements(client, monkeypatch):
+    """Elements that stop halfway until the returned event is set."""
+    ways = house_ways(1200, seed=4)
+    resume = threading.Event()
+
+    def elements():
+        yield from ways[:600]
+        resume.wait(10)
+        yield from ways[600:]
+
+    monkeypatch.setattr(
+        extraction,
+        '_building_elements',
+        lambda polygon, detail, settings, progress=None: (elements(), detail),
+    )
+    yield resume
+    resume.set()
+
+
+def start_job(client, offset):
+    # Every test needs its own polygon, identical jobs are deduplicated
+    polygon = [[lat, lon + offset] for lat, lon in POLYGON]
+    return client.post(JOBS_URL, json={'polygon': polygon}).get_json()['job_id']
+
+
+def test_batches_are_served_while_the_job_runs(client, paused_elements):
+    job_id = start_job(client, 2e-3)
+    status_url = f'{JOBS_URL}/{job_id}'
+
+    deadline = time.monotonic() + 5
+    while not (running := client.get(f'{status_url}?since=0').get_json())['next']:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    assert running['status'] == 'running'
+    assert 'result' not in running
+    seen = [b['id'] for batch in running['batches'] for b in batch['buildings']]
+    assert seen
+    assert client.get(f'{status_url}?since=1').get_json()['batches'] == []
+
+    paused_elements.set()
+    wait_until_done(client, job_id)
+    done = client.get(f'{status_url}?since={running["next"]}').get_json()
+
+    # The result replaces the batches that were not fetched yet
+    assert done['batches'] == []
+    assert done['next'] > running['next']
+    result_ids = [b['id'] for b in done['result']['buildings']]
+    assert result_ids == sorted(result_ids)
+    assert set(seen) < set(result_ids)
+
+
+def test_events_stream_every_batch(client, paused_elements):
+    job_id = start_job(client, 3e-3)
+
+    response = client.get(f'{JOBS_URL}/{job_id}/events')
+    events = []
+    for chunk in response.response:
+        if not chunk.startswith(b'event: '):
+            continue
+        name, data = chunk.decode().split('\n')[:2]
+        events.append((name.split(': ')[1], json.loads(data.split(': ', 1)[1])))
+        if name == 'event: batch':
+            paused_elements.set()
+    response.close()
+
+    assert events[-1][0] == 'done'
+    batches = [data for name, data in events if name == 'batch']
+    assert len(batches) == events[-1][1]['batches'] >= 2
+    streamed = [b['id'] for batch in batches for b in batch['buildings']]
+    result = events[-1][1]['result']
+    assert 'buildings' not in result
+    assert len(streamed) == result['count']
+    final = client.get(f'{JOBS_URL}/{job_id}').get_json()['result']
+    assert sorted(streamed) == [b['id'] for b in final['buildings']]
@@ -0,0 +1,73 @@
+import random
+import time
+from functools import partial
+
+from apps.NETontwerp import overpass
+from apps.NETontwerp.extraction import run_extraction
+from apps.NETontwerp.overpass import _run_parts
+from apps.NETontwerp.tile_cache import TileCache
+
+POLYGON = [[52.0, 5.0], [52.0, 5.039], [52.029, 5.039], [52.029, 5.0]]
+
+
+def slow_part(index, delay):
+    time.sleep(delay)
+    return [index]
+
+
+def test_parts_are_yielded_in_submission_order():
+    delays = [0.15, 0.05, 0.1, 0.0]
+    parts = [partial(slow_part, i, delay) for i, delay in enumerate(delays)]
+    progress = []
+
+    elements = list(_run_parts(parts, 4, lambda done, total: progress.append(done)))
+
+    assert elements == [0, 1, 2, 3]
+    assert progress == [1, 2, 3, 4]
+
+
+def house_ways(count, seed):
+    rng = random.Random(seed)
+    ways = []
+    for way_id in rng.sample(range(1, 10 * count), count):
+        lat = rng.uniform(52.001, 52.027)
+        lon = rng.uniform(5.001, 5.037)
+        ring = [
+            (lat, lon),
+            (lat, lon + 1e-4),
+            (lat + 1e-4, lon + 1e-4),
+            (lat + 1e-4, lon),
+        ]
+        ways.append(
+            {
+                'type': 'way',
+                'id': way_id,
+                'tags': {'building': 'house'},
+                'geometry': [{'lat': a, 'lon': b} for a, b in ring + ring[:1]],
+            }
+        )
+    return ways
+
+
+def test_cold_and_warm_cache_give_the_same_building_order(tmp_path, monkeypatch):
+    ways = house_ways(300, seed=1)
+    rng = random.Random(2)
+
+    def fake_fetch(query, **options):
+        shuffled = list(ways)
+        rng.shuffle(shuffled)
+        return iter(shuffled)
+
+    monkeypatch.setattr(overpass, 'fetch_overpass_elements', fake_fetch)
+    settings = {
+        'index': None,
+        'cache': TileCache(str(tmp_path), tile_size=0.01),
+        'fetch_options': {'subtile_size': 0.02, 'max_workers': 3},
+    }
+
+    cold = run_extraction(POLYGON, 'full', settings)
+    warm = run_extraction(POLYGON, 'full', settings)
+
+    cold_ids = [building['id'] for building in cold['buildings']]
+    assert cold_ids == [building['id'] for building in warm['buildings']]
+    assert cold_ids == sorted(way['id'] for way in ways)
@@ -0,0 +1,200 @@
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+import pytest
+
+from apps.NETontwerp import house_analysis
+from apps.NETontwerp.benchmarks import (
+    HOUSE_FILL,
+    HOUSE_OUTLINE,
+    MAP_BACKGROUND,
+    synthetic_map_image,
+)
+from apps.NETontwerp.house_analysis import detect_houses, plan_tiles
+
+
+class SerialPool:
+    """Runs every tile right away, in this process."""
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+
+@pytest.fixture
+def serial_pool(monkeypatch):
+    monkeypatch.setattr(
+        house_analysis, 'get_detection_pool', lambda workers: SerialPool()
+    )
+
+
+def draw_house(image, center_x, center_y, w=120, h=90):
+    """Clear the area around a center and draw one house on it."""
+    cv2.rectangle(
+        image,
+        (center_x - 130, center_y - 130),
+        (center_x + 130, center_y + 130),
+        MAP_BACKGROUND,
+        -1,
+    )
+    corner = (center_x - w // 2, center_y - h // 2)
+    far = (corner[0] + w - 1, corner[1] + h - 1)
+    cv2.rectangle(image, corner, far, HOUSE_FILL, -1)
+    cv2.rectangle(image, corner, far, HOUSE_OUTLINE, 1)
+    return (*corner, w, h)
+
+
+def boxes(house_shapes):
+    return [cv2.boundingRect(shape) for shape in house_shapes]
+
+
+def seam_map(megapixels, tile_size):
+    """A synthetic map with houses across a vertical seam and a tile corner."""
+    image, _ = synthetic_map_image(megapixels, seed=1)
+    seam_houses = [
+        draw_house(image, tile_size, tile_size // 2),
+        draw_house(image, tile_size, tile_size),
+    ]
+    return image, seam_houses
+
+
+def assert_same_detection(tiled, untiled):
+    assert boxes(tiled) == boxes(untiled)
+    assert [c.tolist() for c in tiled] == [c.tolist() for c in untiled]
+
+
+def test_plan_tiles_cover_the_image_once():
+    tiles = plan_tiles(5000, 3000, tile_size=2048, margin=512)
+
+    assert len(tiles) == 3 * 2
+    covered = sum((x1 - x0) * (y1 - y0) for (x0, y0, x1, y1), _ in tiles)
+    assert covered == 5000 * 3000
+    for (cx0, cy0, cx1, cy1), (wx0, wy0, wx1, wy1) in tiles:
+        assert (wx0, wy0) == (max(cx0 - 512, 0), max(cy0 - 512, 0))
+        assert (wx1, wy1) == (min(cx1 + 512, 5000), min(cy1 + 512, 3000))
+
+
+def test_tiled_matches_untiled_on_a_12_mp_map(serial_pool):
+    image, seam_houses = seam_map(12, house_analysis.TILE_SIZE)
+
+    tiled = detect_houses(image, tiled=True)
+    untiled = detect_houses(image, tiled=False)
+
+    assert len(untiled) > 500
+    assert_same_detection(tiled, untiled)
+    # Each seam house is found once for its outline and once for its fill
+    for house in seam_houses:
+        found = [box for box in boxes(tiled) if abs(box[0] - house[0]) <= 1]
+        assert len([b for b in found if abs(b[1] - house[1]) <= 1]) == 2
+
+
+@pytest.mark.parametrize('tile_size, margin', [(700, 200), (900, 150)])
+def test_small_tiles_match_untiled(serial_pool, tile_size, margin):
+    image, _ = seam_map(3, tile_size)
+
+    tiled = detect_houses(image, tiled=True, tile_size=tile_size, margin=margin)
+    untiled = detect_houses(image, tiled=False)
+
+    assert_same_detection(tiled, untiled)
+    seams = range(tile_size, max(image.shape), tile_size)
+    crossing = [
+        (x, y, w, h)
+        for x, y, w, h in boxes(tiled)
+        if any(x < seam < x + w or y < seam < y + h for seam in seams)
+    ]
+    assert len(crossing) >= 10
+
+
+def test_process_pool_matches_untiled():
+    image, _ = seam_map(3, 1000)
+    try:
+        tiled = detect_houses(image, tiled=True, tile_size=1000, workers=2)
+    finally:
+        house_analysis.shutdown_detection_pool()
+
+    assert_same_detection(tiled, detect_houses(image, tiled=False))
+
+
+def baseline_filter(contours, params):
+    """The per-contour filter that filter_house_contours replaced."""
+    house_shapes = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        hull_area = cv2.contourArea(cv2.convexHull(contour))
+        solidity = area / hull_area if hull_area > 0 else 0
+        _, _, w, h = cv2.boundingRect(contour)
+        aspect_ratio = max(w, h) / min(w, h) if min(w, h) > 0 else 0
+
+        if area < params['min_area'] or area > params['max_area']:
+            continue
+        if solidity < params['min_solidity']:
+            continue
+        if aspect_ratio > params['max_aspect_ratio']:
+            continue
+        house_shapes.append(contour)
+    return house_shapes
+
+
+def cluttered_contours(seed):
+    """Canny contours of a map with shapes that fail every single check."""
+    image, _ = synthetic_map_image(3, seed=seed)
+    rng = np.random.default_rng(seed)
+    height, width = image.shape[:2]
+    for _ in range(300):
+        x, y = int(rng.integers(0, width - 400)), int(rng.integers(0, height - 400))
+        size = int(rng.choice([8, 20, 40, 80, 160, 300]))
+        kind = rng.integers(0, 4)
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        if kind == 0:
+            # Long and thin, in both directions
+            long_side, short_side = size, max(size // int(rng.integers(2, 9)), 1)
+            w, h = long_side, short_side
+            if rng.random() < 0.5:
+                w, h = h, w
+            cv2.rectangle(image, (x, y), (x + w, y + h), color, -1)
+        elif kind == 1:
+            # Concave L shapes with a low solidity
+            arm = max(size // int(rng.integers(3, 7)), 2)
+            points = np.array(
+                [(0, 0), (size, 0), (size, arm), (arm, arm), (arm, size), (0, size)]
+            )
+            cv2.fillPoly(image, [points + (x, y)], color)
+        elif kind == 2:
+            cv2.circle(image, (x + size, y + size), size // 2, color, -1)
+        else:
+            cv2.rectangle(image, (x, y), (x + size, y + size), color, -1)
+    # Noise on the left half only, so the right half keeps whole outlines
+    left = image[:, : width // 2].astype(np.int16)
+    left += rng.integers(-25, 25, left.shape, dtype=np.int16)
+    image[:, : width // 2] = np.clip(left, 0, 255)
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    edges = cv2.Canny(gray, 50, 150, apertureSize=3)
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
+
+@pytest.mark.parametrize('profile', sorted(house_analysis.DETECTION_PROFILES))
+def test_filter_matches_the_baseline_filter(profile):
+    params = house_analysis.DETECTION_PROFILES[profile]
+    contours = cluttered_contours(seed=2)
+
+    kept = house_analysis.filter_house_contours(contours, params)
+
+    expected = baseline_filter(contours, params)
+    assert [id(c) for c in kept] == [id(c) for c in expected]
+    assert 0 < len(expected) < len(contours)
+    # Every check rejects contours on its own
+    for name, tightened in [
+        ('min_area', params['min_area'] * 2),
+        ('max_area', params['max_area'] // 4),
+        ('min_solidity', 0.9),
+        ('max_aspect_ratio', 1.5),
+    ]:
+        stricter = dict(params, **{name: tightened})
+        kept = house_analysis.filter_house_contours(contours, stricter)
+        expected = baseline_filter(contours, stricter)
+        assert [id(c) for c in kept] == [id(c) for c in expected], name
+        assert len(expected) < len(baseline_filter(contours, params)), name
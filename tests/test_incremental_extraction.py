@@ -0,0 +1,132 @@
+import pytest
+import shapely
+
+from apps.NETontwerp import extraction
+from apps.NETontwerp.building_store import get_result_store
+from apps.NETontwerp.extraction import (
+    MIN_ADDED_AREA,
+    run_extraction,
+    run_incremental_extraction,
+)
+from tests.test_extraction_order import house_ways
+
+OLD = [[52.0, 5.0], [52.0, 5.03], [52.02, 5.03], [52.02, 5.0]]
+# OLD grown north and east, without the corner between the two strips,
+# so the added area comes in two parts that touch at (52.02, 5.03)
+GROWN = [
+    [52.0, 5.0],
+    [52.0, 5.04],
+    [52.02, 5.04],
+    [52.02, 5.03],
+    [52.03, 5.03],
+    [52.03, 5.0],
+]
+SETTINGS = {'index': None}
+
+
+def way(way_id, south, west, north, east):
+    ring = [(south, west), (south, east), (north, east), (north, west)]
+    return {
+        'type': 'way',
+        'id': way_id,
+        'tags': {'building': 'house'},
+        'geometry': [{'lat': a, 'lon': b} for a, b in ring + ring[:1]],
+    }
+
+
+def footprint(element):
+    return shapely.Polygon([(p['lat'], p['lon']) for p in element['geometry']])
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    """Serve the ways touching a queried polygon, as Overpass does."""
+    ways = [w for w in house_ways(600, seed=5) if w['id'] > 1000]
+    ways += [
+        # Centered in the north strip, crossing into the east strip
+        way(1, 52.0199, 5.0298, 52.0203, 5.0301),
+        # Centered in OLD, crossing into the north strip
+        way(2, 52.0195, 5.01, 52.0203, 5.0104),
+    ]
+    queries = []
+
+    def building_elements(polygon_coords, detail, settings, progress=None):
+        area = shapely.Polygon(polygon_coords)
+        queries.append(area)
+        return iter([w for w in ways if footprint(w).intersects(area)]), detail
+
+    monkeypatch.setattr(extraction, '_building_elements', building_elements)
+    return queries
+
+
+def result_ids(result_id):
+    return get_result_store().get(result_id).records['id'].tolist()
+
+
+def full_ids(polygon):
+    return [b['id'] for b in run_extraction(polygon, 'full', SETTINGS)['buildings']]
+
+
+def test_grown_polygon_fetches_only_the_added_parts(fetched):
+    grown_ids = full_ids(GROWN)
+    previous = run_extraction(OLD, 'full', SETTINGS)
+    old_ids = [b['id'] for b in previous['buildings']]
+    assert 1 in grown_ids and 1 not in old_ids
+    assert 2 in old_ids
+    fetched.clear()
+
+    result = run_incremental_extraction(GROWN, 'full', previous['result_id'], SETTINGS)
+
+    assert len(fetched) == 2
+    added_area = shapely.difference(shapely.Polygon(GROWN), shapely.Polygon(OLD))
+    assert sum(area.area for area in fetched) == pytest.approx(added_area.area)
+    assert result['delta'] is True
+    assert result['previous'] == previous['result_id']
+    assert result['removed'] == []
+    # Ways returned by both parts or already kept are added once
+    added = [b['id'] for b in result['buildings']]
+    assert len(added) == len(set(added))
+    assert sorted(added) == sorted(set(grown_ids) - set(old_ids))
+    assert result['count'] == len(grown_ids)
+    assert result_ids(result['result_id']) == grown_ids
+
+
+def test_shrunk_polygon_only_removes(fetched):
+    old_ids = full_ids(OLD)
+    previous = run_extraction(GROWN, 'full', SETTINGS)
+    fetched.clear()
+
+    result = run_incremental_extraction(OLD, 'full', previous['result_id'], SETTINGS)
+
+    assert fetched == []
+    assert result['buildings'] == []
+    grown_ids = [b['id'] for b in previous['buildings']]
+    assert result['removed'] == sorted(set(grown_ids) - set(old_ids))
+    assert result['count'] == len(old_ids)
+    assert result_ids(result['result_id']) == old_ids
+
+
+def test_change_below_the_threshold_fetches_nothing(fetched):
+    previous = run_extraction(OLD, 'full', SETTINGS)
+    fetched.clear()
+    moved = [list(point) for point in OLD]
+    moved[2][0] += 1e-9
+    sliver = shapely.difference(shapely.Polygon(moved), shapely.Polygon(OLD))
+    assert 0 < sliver.area < MIN_ADDED_AREA
+
+    result = run_incremental_extraction(moved, 'full', previous['result_id'], SETTINGS)
+
+    assert fetched == []
+    assert result['buildings'] == []
+    assert result['removed'] == []
+    assert result_ids(result['result_id']) == result_ids(previous['result_id'])
+
+
+def test_unknown_or_other_detail_falls_back(fetched):
+    previous = run_extraction(OLD, 'full', SETTINGS)
+
+    assert run_incremental_extraction(GROWN, 'full', 'onbekend', SETTINGS) is None
+    assert (
+        run_incremental_extraction(GROWN, 'centers', previous['result_id'], SETTINGS)
+        is None
+    )
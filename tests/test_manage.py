@@ -0,0 +1,18 @@
+import pytest
+from click.testing import CliRunner
+
+from manage import cli
+
+
+@pytest.mark.parametrize('bbox', ['52,4.9,x,5.1', '52,4.9,52.1', '52,4.9,52.1,5.1,0'])
+def test_build_building_index_rejects_bad_bbox(tmp_path, bbox):
+    source = tmp_path / 'area.pbf'
+    source.write_bytes(b'')
+
+    result = CliRunner().invoke(
+        cli, ['build-building-index', str(source), '--bbox', bbox]
+    )
+
+    assert result.exit_code == 2
+    assert 'Invalid value for --bbox' in result.output
+    assert 'Traceback' not in result.output
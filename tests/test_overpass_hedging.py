@@ -0,0 +1,305 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from apps.NETontwerp.overpass import CircuitBreaker, OverpassClient
+
+HEDGE_DELAY = 0.2
+SLOW_DELAY = 2.0
+
+
+class StubMirror:
+    """A local Overpass stand-in that answers after a delay with a status.
+
+    body is 'truncated' to hang up halfway through the body, or 'invalid'
+    to send a body that is not JSON.
+    """
+
+    def __init__(self, name, delay=0.0, status=200, body=None):
+        self.name = name
+        self.delay = delay
+        self.status = status
+        self.body = body
+        self.hits = []
+        mirror = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                mirror.hits.append(time.monotonic())
+                time.sleep(mirror.delay)
+                body = json.dumps(
+                    {
+                        'elements': [
+                            {'type': 'node', 'id': 1, 'tags': {'m': mirror.name}}
+                        ]
+                    }
+                ).encode()
+                length = len(body)
+                if mirror.body == 'truncated':
+                    body = body[: length // 2]
+                elif mirror.body == 'invalid':
+                    body = b'<html>' + b' ' * (length - 6)
+                try:
+                    self.send_response(mirror.status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(length))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass  # the client hung up after losing the race
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/api/interpreter'
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        ).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def mirrors():
+    started = []
+
+    def start(name, **behaviour):
+        mirror = StubMirror(name, **behaviour)
+        started.append(mirror)
+        return mirror
+
+    yield start
+    for mirror in started:
+        mirror.close()
+
+
+def winner(client, response):
+    elements = list(client.read_elements(response, chunk_size=1024))
+    return elements[0]['tags']['m']
+
+
+def open_stream(client, urls, hedge_delay=HEDGE_DELAY):
+    started = time.monotonic()
+    response = client.open_stream('[out:json];', urls=urls, hedge_delay=hedge_delay)
+    return response, time.monotonic() - started
+
+
+def test_fast_mirror_wins_when_preferred_one_is_slow(mirrors):
+    slow = mirrors('slow', delay=SLOW_DELAY)
+    fast = mirrors('fast')
+
+    client = OverpassClient()
+    response, elapsed = open_stream(client, [slow.url, fast.url])
+
+    assert winner(client, response) == 'fast'
+    # Capped near the hedge delay, not the slow mirror's answer time
+    assert HEDGE_DELAY <= elapsed < HEDGE_DELAY + 0.5
+    assert len(slow.hits) == 1
+    assert fast.hits[0] - slow.hits[0] == pytest.approx(HEDGE_DELAY, abs=0.15)
+
+
+def test_fast_preferred_mirror_is_not_hedged(mirrors):
+    fast = mirrors('fast')
+    slow = mirrors('slow', delay=SLOW_DELAY)
+
+    client = OverpassClient()
+    response, elapsed = open_stream(client, [fast.url, slow.url])
+
+    assert winner(client, response) == 'fast'
+    assert elapsed < HEDGE_DELAY
+    assert slow.hits == []
+
+
+def test_failing_mirror_fails_over_without_waiting(mirrors):
+    broken = mirrors('broken', status=500)
+    fast = mirrors('fast')
+    spare = mirrors('spare')
+
+    client = OverpassClient(max_retries=0)
+    response, elapsed = open_stream(client, [broken.url, fast.url, spare.url])
+
+    assert winner(client, response) == 'fast'
+    assert elapsed < HEDGE_DELAY
+    assert len(broken.hits) == 1
+    assert broken.hits[0] <= fast.hits[0]
+    assert spare.hits == []
+    assert client.stats()[broken.url]['failures'] == 1
+
+
+def test_failover_follows_mirror_order(mirrors):
+    first = mirrors('first', status=500)
+    second = mirrors('second', status=502)
+    third = mirrors('third')
+
+    client = OverpassClient(max_retries=0)
+    response, _ = open_stream(client, [first.url, second.url, third.url])
+
+    assert winner(client, response) == 'third'
+    assert first.hits[0] <= second.hits[0] <= third.hits[0]
+
+
+def test_failed_mirror_is_tried_last_next_time(mirrors):
+    broken = mirrors('broken', status=500)
+    fast = mirrors('fast')
+
+    client = OverpassClient(max_retries=0)
+    winner(client, open_stream(client, [broken.url, fast.url])[0])
+    response, _ = open_stream(client, [broken.url, fast.url])
+
+    assert winner(client, response) == 'fast'
+    assert len(broken.hits) == 1
+
+
+def test_all_mirrors_failing_raises_after_retries(mirrors):
+    first = mirrors('first', status=500)
+    second = mirrors('second', status=503)
+
+    client = OverpassClient(max_retries=1, backoff=0.01)
+    with pytest.raises(requests.HTTPError):
+        open_stream(client, [first.url, second.url])
+
+    assert len(first.hits) == 2
+    assert len(second.hits) == 2
+
+
+def test_query_error_is_not_retried_on_other_mirrors(mirrors):
+    bad_query = mirrors('bad', status=400)
+    fast = mirrors('fast')
+
+    with pytest.raises(requests.HTTPError):
+        open_stream(OverpassClient(), [bad_query.url, fast.url])
+
+    assert fast.hits == []
+
+
+def wait_for_stats(client, url, key, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = client.stats().get(url, {})
+        if key in stats:
+            return stats
+        time.sleep(0.02)
+    raise AssertionError(f'no {key} recorded for {url}')
+
+
+def test_losing_attempt_is_recorded_when_it_completes(mirrors):
+    slow = mirrors('slow', delay=0.6)
+    fast = mirrors('fast')
+
+    client = OverpassClient()
+    winner(client, open_stream(client, [slow.url, fast.url])[0])
+
+    # Abandoned, but not measured yet
+    stats = client.stats()[slow.url]
+    assert stats['abandoned'] == 1
+    assert 'latency' not in stats
+    # Its answer adds a latency, but its body is never read, so the
+    # mirror is not counted as a healthy request
+    stats = wait_for_stats(client, slow.url, 'latency')
+    assert stats['latency'] == pytest.approx(0.6, abs=0.2)
+    assert stats['requests'] == 0
+    assert stats['error_rate'] == 0.0
+    assert client.stats()[fast.url]['requests'] == 1
+    assert client.mirror_stats.order([slow.url, fast.url]) == [fast.url, slow.url]
+
+
+def test_hung_mirror_is_recorded_as_a_failure(mirrors):
+    hung = mirrors('hung', delay=SLOW_DELAY)
+    fast = mirrors('fast')
+
+    client = OverpassClient()
+    response = client.open_stream(
+        '[out:json];', urls=[hung.url, fast.url], hedge_delay=HEDGE_DELAY, timeout=0.5
+    )
+    assert winner(client, response) == 'fast'
+
+    stats = wait_for_stats(client, hung.url, 'failures')
+    assert stats['failures'] == 1
+    assert stats['error_rate'] > 0
+    assert stats['abandoned'] == 1
+    assert client.mirror_stats.order([hung.url, fast.url]) == [fast.url, hung.url]
+
+
+def test_success_is_recorded_once_the_body_is_read(mirrors):
+    fast = mirrors('fast')
+
+    client = OverpassClient()
+    response, _ = open_stream(client, [fast.url])
+
+    assert fast.url not in client.stats() or 'requests' not in client.stats()[fast.url]
+    assert winner(client, response) == 'fast'
+    stats = client.stats()[fast.url]
+    assert stats['requests'] == 1
+    assert stats['failures'] == 0
+    assert stats['breaker'] == 'closed'
+
+
+@pytest.mark.parametrize('body', ['truncated', 'invalid'])
+def test_broken_body_counts_as_a_failure(mirrors, body):
+    broken = mirrors('broken', body=body)
+
+    client = OverpassClient(failure_threshold=1)
+    response, _ = open_stream(client, [broken.url])
+
+    with pytest.raises(requests.RequestException):
+        winner(client, response)
+    stats = client.stats()[broken.url]
+    assert stats['requests'] == 1
+    assert stats['failures'] == 1
+    assert stats['breaker'] == 'open'
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.1)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.15)
+    assert breaker.state == 'half-open'
+    trials = []
+    threads = [
+        threading.Thread(target=lambda: trials.append(breaker.allow()))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(trials) == [False] * 7 + [True]
+
+    # A trial without a verdict frees the slot, a success closes the breaker
+    breaker.release()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow() and breaker.allow()
+
+
+def test_half_open_mirror_is_probed_by_one_request(mirrors):
+    recovering = mirrors('recovering')
+    spare = mirrors('spare')
+
+    client = OverpassClient(failure_threshold=1, cooldown=60)
+    breaker = client.breaker(recovering.url)
+    breaker.record_failure()
+    breaker.opened_at -= 60  # the cool-down has passed
+
+    # The probe holds the trial until its body is read
+    probe, _ = open_stream(client, [recovering.url, spare.url])
+    response, elapsed = open_stream(client, [recovering.url, spare.url])
+    assert winner(client, response) == 'spare'
+    assert elapsed < HEDGE_DELAY
+    assert len(recovering.hits) == 1
+
+    assert winner(client, probe) == 'recovering'
+    assert client.stats()[recovering.url]['breaker'] == 'closed'
@@ -0,0 +1,207 @@
+import gzip
+import json
+import sys
+
+import numpy as np
+import pytest
+
+from apps.NETontwerp.payload import (
+    COMPACT_MEDIA_TYPE,
+    FORMAT_COMPACT,
+    FORMAT_JSON,
+    MIN_COMPRESS_SIZE,
+    compress_body,
+    dump_payload,
+    encode_payload,
+    requested_format,
+)
+
+COMPACT_KEYS = [
+    'format',
+    'version',
+    'scale',
+    'ids',
+    'centers',
+    'osm_types',
+    'osm_type',
+    'names',
+    'types',
+    'type',
+    'area_m2_x10',
+    'rings',
+    'coords',
+]
+
+
+def decode_compact(data):
+    """decodeCompactBuildings from map_extraction.html, line by line."""
+    buildings = []
+    way_id = lat = lng = offset = 0
+    for i in range(len(data['ids'])):
+        way_id += data['ids'][i]
+        lat += data['centers'][2 * i]
+        lng += data['centers'][2 * i + 1]
+        building = {
+            'id': way_id,
+            'center': [lat / data['scale'], lng / data['scale']],
+            'osm_type': data['osm_types'][data['osm_type'][i]],
+            'name': data['names'].get(str(i), ''),
+        }
+        if 'coords' in data:
+            coords = []
+            point_lat, point_lng = lat, lng
+            for _ in range(data['rings'][i]):
+                point_lat += data['coords'][offset]
+                point_lng += data['coords'][offset + 1]
+                coords.append([point_lat / data['scale'], point_lng / data['scale']])
+                offset += 2
+            building['coords'] = coords
+            building['type'] = data['types'][data['type'][i]]
+            building['area_m2'] = data['area_m2_x10'][i] / 10
+        buildings.append(building)
+
+    decoded = {key: value for key, value in data.items() if key not in COMPACT_KEYS}
+    decoded['buildings'] = buildings
+    return decoded
+
+
+def random_buildings(count, seed, footprints=True):
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(10**9, count, replace=False))
+    buildings = []
+    for i, way_id in enumerate(ids.tolist()):
+        center = [52.0 + rng.uniform(0, 0.05), 5.0 + rng.uniform(0, 0.05)]
+        building = {
+            'id': way_id,
+            'center': center,
+            'osm_type': str(rng.choice(['house', 'yes', 'garage'])),
+            # Most buildings have no name
+            'name': f'Straat {i}' if i % 7 == 0 else '',
+        }
+        if footprints:
+            corners = rng.integers(0, 6) if i % 11 else 0
+            building['coords'] = (
+                np.array(center) + rng.uniform(-2e-4, 2e-4, (corners, 2))
+            ).tolist()
+            building['type'] = (
+                None if i % 5 == 0 else str(rng.choice(['Rijwoning', 'Vrijstaand']))
+            )
+            building['area_m2'] = round(float(rng.uniform(20, 400)), 1)
+        buildings.append(building)
+    return buildings
+
+
+def round_trip(result):
+    encoded = encode_payload(result, FORMAT_COMPACT)
+    return decode_compact(json.loads(dump_payload(encoded)))
+
+
+def assert_buildings_equal(decoded, buildings):
+    assert len(decoded) == len(buildings)
+    for got, expected in zip(decoded, buildings, strict=True):
+        assert got.keys() == expected.keys()
+        for key, value in expected.items():
+            if key in ('center', 'coords'):
+                got_points = np.array(got[key]).reshape(-1, 2)
+                expected_points = np.array(value).reshape(-1, 2)
+                assert got_points.shape == expected_points.shape
+                np.testing.assert_allclose(got_points, expected_points, atol=1e-6)
+            else:
+                assert got[key] == value, key
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_compact_round_trip_with_footprints(seed):
+    buildings = random_buildings(300, seed)
+    result = {'success': True, 'result_id': 'abc', 'count': 300, 'buildings': buildings}
+
+    decoded = round_trip(result)
+
+    assert decoded['success'] is True
+    assert decoded['result_id'] == 'abc'
+    assert decoded['count'] == 300
+    assert_buildings_equal(decoded['buildings'], buildings)
+
+
+def test_compact_round_trip_with_centers_only():
+    buildings = random_buildings(100, seed=2, footprints=False)
+
+    decoded = round_trip({'buildings': buildings})
+
+    assert_buildings_equal(decoded['buildings'], buildings)
+
+
+def test_compact_round_trip_of_unsorted_ids():
+    buildings = random_buildings(50, seed=3)[::-1]
+
+    decoded = round_trip({'buildings': buildings})
+
+    assert [b['id'] for b in decoded['buildings']] == [b['id'] for b in buildings]
+
+
+def test_compact_round_trip_of_no_buildings():
+    assert round_trip({'success': True, 'buildings': []}) == {
+        'success': True,
+        'buildings': [],
+    }
+
+
+def test_compact_payload_is_smaller():
+    result = {'buildings': random_buildings(300, seed=4)}
+
+    compact = dump_payload(encode_payload(result, FORMAT_COMPACT))
+
+    assert len(compact) < len(dump_payload(result)) / 2
+
+
+def test_results_without_buildings_are_left_as_they_are():
+    result = {'success': True, 'result_id': 'abc'}
+
+    assert encode_payload(result, FORMAT_COMPACT) is result
+    assert encode_payload({'buildings': []}, FORMAT_JSON) == {'buildings': []}
+
+
+def test_format_from_argument_or_accept_header():
+    assert requested_format({}, None) == FORMAT_JSON
+    assert requested_format({}, f'{COMPACT_MEDIA_TYPE}, */*') == FORMAT_COMPACT
+    assert requested_format({'format': FORMAT_JSON}, COMPACT_MEDIA_TYPE) == FORMAT_JSON
+    assert requested_format({'format': 'xml'}, None) == FORMAT_JSON
+
+
+BODY = dump_payload({'buildings': random_buildings(50, seed=5)})
+
+
+def test_small_or_unaccepted_bodies_are_not_compressed():
+    small = b'x' * (MIN_COMPRESS_SIZE - 1)
+
+    assert compress_body(small, 'gzip, br') == (small, None)
+    assert compress_body(BODY, None) == (BODY, None)
+    assert compress_body(BODY, 'identity') == (BODY, None)
+
+
+def test_gzip_is_used_when_accepted():
+    body, encoding = compress_body(BODY, 'gzip, deflate')
+
+    assert encoding == 'gzip'
+    assert gzip.decompress(body) == BODY
+    assert len(body) < len(BODY)
+
+
+def test_brotli_is_preferred_when_installed():
+    brotli = pytest.importorskip('brotli')
+
+    body, encoding = compress_body(BODY, 'gzip, br')
+
+    assert encoding == 'br'
+    assert brotli.decompress(body) == BODY
+
+
+def test_gzip_is_used_without_brotli(monkeypatch):
+    # A None entry makes the import raise ImportError
+    monkeypatch.setitem(sys.modules, 'brotli', None)
+
+    body, encoding = compress_body(BODY, 'gzip, br')
+
+    assert encoding == 'gzip'
+    assert gzip.decompress(body) == BODY
+    assert compress_body(BODY, 'br') == (BODY, None)
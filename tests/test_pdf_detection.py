@@ -0,0 +1,161 @@
+import io
+import tempfile
+
+import numpy as np
+import pytest
+
+from apps.NETontwerp import house_analysis
+from apps.NETontwerp.house_analysis import detect_houses, detect_houses_in_upload
+from apps.NETontwerp.pdf_pages import iter_pdf_pages
+from core.app_factory import create_app
+
+pytest.importorskip('pypdfium2')
+
+
+def rectangles_pdf(pages):
+    """A PDF whose pages hold filled rectangles, given as (x, y, w, h) in pt."""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None]
+    kids = []
+    for rects in pages:
+        content = b'0 0 0 rg\n' + b''.join(b'%d %d %d %d re f\n' % r for r in rects)
+        page_id, content_id = len(objects) + 1, len(objects) + 2
+        kids.append(b'%d 0 R' % page_id)
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 600 400] '
+            b'/Contents %d 0 R >>' % content_id
+        )
+        objects.append(
+            b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content)
+        )
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(kids),
+        len(kids),
+    )
+
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(pdf)
+
+
+def houses(count, shift=0):
+    return [
+        (40 + shift + 110 * (i % 5), 40 + 110 * (i // 5), 60, 40) for i in range(count)
+    ]
+
+
+def page_counts(pdf):
+    """House count per page, detected on the rendered pages one by one."""
+    return [len(detect_houses(image, tiled=False)) for _, image in iter_pdf_pages(pdf)]
+
+
+class LazyFuture:
+    def __init__(self, pool, func, args):
+        self.pool = pool
+        self.func = func
+        self.args = args
+
+    def result(self):
+        self.pool.pending -= 1
+        return self.func(*self.args)
+
+
+class InlinePool:
+    """Runs tasks when their result is asked for and records their arguments."""
+
+    def __init__(self):
+        self.tasks = []
+        self.pending = 0
+        self.max_pending = 0
+
+    def submit(self, func, *args):
+        self.tasks.append(args)
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        return LazyFuture(self, func, args)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = InlinePool()
+    monkeypatch.setattr(house_analysis, 'get_detection_pool', lambda workers: pool)
+    monkeypatch.setattr(house_analysis, '_pool_workers', 2)
+    return pool
+
+
+def test_every_page_is_detected(pool):
+    pdf = rectangles_pdf([houses(3), houses(0), houses(7)])
+
+    pages = detect_houses_in_upload(pdf, workers=8)
+
+    counts = [page['house_count'] for page in pages]
+    assert counts == page_counts(pdf)
+    assert counts[0] > 0 and counts[1] == 0
+    assert pages[0]['image'][1] == 'image/png'
+
+
+def test_tasks_get_rendered_pages_and_stay_within_the_pool_size(pool):
+    pdf = rectangles_pdf([houses(1)] * 6)
+
+    detect_houses_in_upload(pdf, workers=8)
+
+    # Pages are rendered from the bytes in memory, the tasks only get images
+    assert len(pool.tasks) == 6
+    assert all(isinstance(task[0], np.ndarray) for task in pool.tasks)
+    assert all(task[0].ndim == 3 for task in pool.tasks)
+    # The pool was started with 2 workers, not the 8 asked for now
+    assert pool.max_pending == 2
+
+
+def test_no_temporary_file_is_written(pool, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise AssertionError('PDF written to disk')
+
+    monkeypatch.setattr(tempfile, 'NamedTemporaryFile', refuse)
+    monkeypatch.setattr(tempfile, 'mkstemp', refuse)
+
+    pdf = rectangles_pdf([houses(2)])
+
+    pages = detect_houses_in_upload(pdf, workers=8)
+
+    assert [page['house_count'] for page in pages] == page_counts(pdf)
+
+
+def test_real_pool_matches_inline_detection():
+    pdf = rectangles_pdf([houses(4), houses(2)])
+    try:
+        pages = house_analysis.detect_houses_in_pdf(pdf, workers=2)
+    finally:
+        house_analysis.shutdown_detection_pool()
+
+    assert [page['house_count'] for page in pages] == page_counts(pdf)
+
+
+def test_page_list_is_kept_out_of_the_session_cookie(pool):
+    # Every page looks different, so the image keys do not compress away
+    pdf = rectangles_pdf([houses(2, shift=i) for i in range(40)])
+    app = create_app('development')
+    client = app.test_client()
+
+    response = client.post(
+        '/NETontwerp/house-detection',
+        data={'screenshot': (io.BytesIO(pdf), 'plan.pdf')},
+        content_type='multipart/form-data',
+    )
+
+    assert response.status_code == 302
+    assert len(response.headers['Set-Cookie']) < 1024
+    with client.session_transaction() as session:
+        assert session['house_count'] == sum(page_counts(pdf))
+        assert 'detection_pages' not in session
+    page = client.get('/NETontwerp/street-assignment').get_data(as_text=True)
+    assert 'Pagina 40' in page
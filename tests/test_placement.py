@@ -0,0 +1,131 @@
+import math
+
+import numpy as np
+import pytest
+
+from apps.NETontwerp.placement import (
+    METERS_PER_DEGREE,
+    place_cabinets,
+    project_to_meters,
+)
+from core.app_factory import create_app
+
+
+def random_centers(count, seed, spread=0.02):
+    rng = np.random.default_rng(seed)
+    return np.column_stack(
+        [52.0 + rng.uniform(0, spread, count), 5.0 + rng.uniform(0, spread, count)]
+    )
+
+
+def check_placement(centers, cabinets, assignment, budget, radius, load):
+    points = project_to_meters(centers)
+    assert assignment.min() >= 0
+    assert assignment.max() == len(cabinets) - 1
+    for index, cabinet in enumerate(cabinets):
+        members = np.flatnonzero(assignment == index)
+        distances = np.hypot(*(points[members] - points[cabinet['site']]).T)
+        assert distances.max() <= radius + 1e-6
+        assert load[members].sum() <= budget + 1e-9
+        assert cabinet['buildings'] == len(members)
+        assert cabinet['ampere'] == pytest.approx(load[members].sum(), abs=0.05)
+        assert cabinet['max_distance_m'] == pytest.approx(distances.max(), abs=0.05)
+        assert cabinet['center'] == centers[cabinet['site']].tolist()
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('budget', [50, 240])
+def test_every_building_is_covered_within_radius_and_budget(seed, budget):
+    centers = random_centers(800, seed)
+
+    cabinets, assignment = place_cabinets(centers, budget, radius_m=150)
+
+    load = np.full(len(centers), 10.0)
+    check_placement(centers, cabinets, assignment, budget, 150, load)
+    assert len(cabinets) >= math.ceil(load.sum() / budget)
+
+
+def test_per_building_loads_and_simultaneity():
+    centers = random_centers(300, seed=3, spread=0.005)
+    per_house = np.random.default_rng(4).choice([10.0, 25.0, 35.0], len(centers))
+
+    cabinets, assignment = place_cabinets(
+        centers, 100, radius_m=200, ampere_per_house=per_house, simultaneity=0.5
+    )
+
+    check_placement(centers, cabinets, assignment, 100, 200, per_house * 0.5)
+
+
+def test_far_apart_clusters_get_one_cabinet_each():
+    offsets = [(0.0, 0.0), (0.05, 0.0), (0.0, 0.05)]
+    centers = np.vstack(
+        [
+            random_centers(20, seed, spread=0.0005) + offset
+            for seed, offset in enumerate(offsets)
+        ]
+    )
+
+    cabinets, assignment = place_cabinets(centers, 240, radius_m=150)
+
+    assert len(cabinets) == 3
+    assert sorted(np.bincount(assignment).tolist()) == [20, 20, 20]
+
+
+def test_buildings_at_the_same_spot_share_a_cabinet():
+    centers = [[52.0, 5.0]] * 5 + [[52.0, 5.0 + 1000 / METERS_PER_DEGREE]]
+
+    cabinets, assignment = place_cabinets(centers, 100, radius_m=150)
+
+    assert len(cabinets) == 2
+    assert len(set(assignment[:5].tolist())) == 1
+    assert assignment[5] != assignment[0]
+
+
+def test_building_over_budget_is_rejected():
+    with pytest.raises(ValueError, match='budget'):
+        place_cabinets(random_centers(10, seed=5), 50, ampere_per_house=60)
+
+
+@pytest.mark.parametrize(
+    'radius, budget', [(0, 100), (150, 0), (-1, 100), (float('inf'), 100)]
+)
+def test_radius_and_budget_must_be_positive(radius, budget):
+    with pytest.raises(ValueError):
+        place_cabinets(random_centers(10, seed=6), budget, radius_m=radius)
+
+
+def test_no_buildings_gives_no_cabinets():
+    cabinets, assignment = place_cabinets([], 100)
+
+    assert cabinets == []
+    assert assignment.shape == (0,)
+
+
+@pytest.mark.parametrize(
+    'ampere_per_house, simultaneity',
+    [(0, 1.0), (10, 0), (-10, 1.0), (float('nan'), 1.0), ([10, -5, 10], 1.0)],
+)
+def test_load_must_be_positive(ampere_per_house, simultaneity):
+    centers = random_centers(3, seed=8)
+
+    with pytest.raises(ValueError, match='groter dan 0'):
+        place_cabinets(
+            centers,
+            100,
+            ampere_per_house=ampere_per_house,
+            simultaneity=simultaneity,
+        )
+
+
+@pytest.mark.parametrize('field', ['ampere_per_house', 'simultaneity'])
+@pytest.mark.parametrize('value', [0, -1])
+def test_api_answers_a_bad_load_with_a_json_error(field, value):
+    client = create_app('development').test_client()
+
+    response = client.post(
+        '/NETontwerp/api/stroomkasten',
+        json={'centers': random_centers(5, seed=9).tolist(), field: value},
+    )
+
+    assert response.status_code == 400
+    assert 'groter dan 0' in response.get_json()['error']
@@ -0,0 +1,85 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from apps.NETontwerp.singleflight import SingleFlight
+
+CALLERS = 8
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not reached'
+        time.sleep(0.005)
+
+
+def run_together(flight, key, func):
+    """Start CALLERS calls for key; func blocks until all have joined.
+
+    Returns the futures of the calls, in start order.
+    """
+    release = threading.Event()
+    calls = []
+
+    def blocking():
+        calls.append(threading.current_thread())
+        release.wait(5)
+        return func()
+
+    pool = ThreadPoolExecutor(CALLERS)
+    futures = [pool.submit(flight.do, key, blocking)]
+    wait_for(lambda: calls)
+    futures += [pool.submit(flight.do, key, blocking) for _ in range(CALLERS - 1)]
+    wait_for(lambda: flight.stats()['coalesced'] == CALLERS - 1)
+    release.set()
+    pool.shutdown(wait=True)
+    assert len(calls) == 1
+    return futures
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    result = object()
+
+    futures = run_together(flight, 'a', lambda: result)
+
+    outcomes = [future.result() for future in futures]
+    assert outcomes[0] == (result, False)
+    assert all(outcome == (result, True) for outcome in outcomes[1:])
+    assert flight.stats() == {
+        'executed': 1,
+        'coalesced': CALLERS - 1,
+        'in_flight': 0,
+    }
+
+
+def test_error_reaches_every_waiter_and_the_key_is_freed():
+    flight = SingleFlight()
+    error = RuntimeError('Overpass niet bereikbaar')
+
+    def fail():
+        raise error
+
+    futures = run_together(flight, 'a', fail)
+
+    for future in futures:
+        with pytest.raises(RuntimeError) as raised:
+            future.result()
+        assert raised.value is error
+    assert flight.stats()['in_flight'] == 0
+    # The failed call is not remembered, the next call runs again
+    assert flight.do('a', lambda: 42) == (42, False)
+    assert flight.stats()['executed'] == 2
+
+
+def test_finished_calls_are_not_cached_and_keys_are_separate():
+    flight = SingleFlight()
+    counter = iter(range(10))
+
+    assert flight.do('a', lambda: next(counter)) == (0, False)
+    assert flight.do('a', lambda: next(counter)) == (1, False)
+    assert flight.do('b', lambda: next(counter)) == (2, False)
+    assert flight.stats() == {'executed': 3, 'coalesced': 0, 'in_flight': 0}
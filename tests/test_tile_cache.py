@@ -0,0 +1,137 @@
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+from apps.NETontwerp import overpass
+from apps.NETontwerp.osm_stream import collect_buildings
+from apps.NETontwerp.tile_cache import TileCache
+
+
+def way(way_id, points, name=None):
+    tags = {'building': 'house'}
+    if name:
+        tags['name'] = name
+    return {
+        'type': 'way',
+        'id': way_id,
+        'tags': tags,
+        'geometry': [{'lat': lat, 'lon': lon} for lat, lon in points],
+    }
+
+
+def square(lat, lon, size=0.0001):
+    return [
+        (lat, lon),
+        (lat, lon + size),
+        (lat + size, lon + size),
+        (lat + size, lon),
+        (lat, lon),
+    ]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TileCache(str(tmp_path), tile_size=0.01)
+
+
+def test_tiles_for_bbox_covers_every_corner(cache):
+    tiles = cache.tiles_for_bbox(52.005, 4.995, 52.015, 5.005)
+    assert sorted(tiles) == [(499, 5200), (499, 5201), (500, 5200), (500, 5201)]
+    south, west, north, east = cache.tile_bounds((500, 5200))
+    assert (south, west, north, east) == (52.0, 5.0, 52.01, 5.01)
+
+
+def test_group_tiles_merges_bounds_per_block(cache):
+    tiles = [(500, 5200), (501, 5200), (502, 5200)]
+    groups = sorted(cache.group_tiles(tiles, 2))
+    assert groups == [
+        ([(500, 5200), (501, 5200)], (52.0, 5.0, 52.01, 5.02)),
+        ([(502, 5200)], (52.0, 5.02, 52.01, 5.03)),
+    ]
+
+
+def test_put_then_get_round_trips_and_counts(cache):
+    elements = [way(1, square(52.001, 5.001))]
+    assert cache.get((500, 5200)) is None
+    cache.put((500, 5200), elements)
+    assert cache.get((500, 5200)) == elements
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+
+def test_expired_tile_is_a_miss_and_removed(tmp_path):
+    cache = TileCache(str(tmp_path), ttl=60)
+    cache.put((500, 5200), [])
+    path = cache._path((500, 5200))
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump({'fetched_at': time.time() - 120, 'elements': []}, f)
+
+    assert cache.get((500, 5200)) is None
+    assert not os.path.exists(path)
+
+
+def test_unreadable_tile_is_dropped(cache):
+    path = cache._path((500, 5200))
+    with open(path, 'wb') as f:
+        f.write(b'not gzip')
+
+    assert cache.get((500, 5200)) is None
+    assert not os.path.exists(path)
+
+
+def test_evict_removes_least_recently_used_first(tmp_path):
+    cache = TileCache(str(tmp_path))
+    elements = [way(i, square(52.001, 5.001)) for i in range(50)]
+    tiles = [(500, 5200), (501, 5200), (502, 5200)]
+    for age, tile in zip((300, 200, 100), tiles, strict=True):
+        cache.put(tile, elements)
+        stamp = time.time() - age
+        os.utime(cache._path(tile), (stamp, stamp))
+    cache.get(tiles[0])  # reading makes the oldest tile the most recent
+
+    kept = [tiles[0], tiles[2]]
+    cache.max_bytes = sum(os.path.getsize(cache._path(tile)) for tile in kept)
+    cache.evict()
+
+    assert os.path.exists(cache._path(tiles[0]))
+    assert not os.path.exists(cache._path(tiles[1]))
+    assert os.path.exists(cache._path(tiles[2]))
+
+
+def test_split_by_tile_stores_ways_in_every_touched_tile(cache):
+    inside = way(1, square(52.001, 5.001), name='Kerk')
+    on_seam = way(2, square(52.005, 5.0095, size=0.001))
+    outside = way(3, square(52.051, 5.051))
+    ways = collect_buildings([inside, on_seam, outside])
+    tiles = [(500, 5200), (501, 5200), (500, 5201)]
+
+    per_tile = cache.split_by_tile(ways, tiles)
+
+    assert [e['id'] for e in per_tile[(500, 5200)]] == [1, 2]
+    assert [e['id'] for e in per_tile[(501, 5200)]] == [2]
+    assert per_tile[(500, 5201)] == []
+    assert per_tile[(500, 5200)][0]['tags'] == {'building': 'house', 'name': 'Kerk'}
+    restored = collect_buildings(per_tile[(501, 5200)])
+    assert restored.way_coords(0).tolist() == ways.way_coords(1).tolist()
+
+
+def test_second_fetch_is_served_from_the_cache(cache, monkeypatch):
+    fixture = [way(1, square(52.001, 5.001)), way(2, square(52.003, 5.012))]
+    queries = []
+
+    def fake_fetch(query, **options):
+        queries.append(query)
+        return iter(fixture)
+
+    monkeypatch.setattr(overpass, 'fetch_overpass_elements', fake_fetch)
+    polygon = [[52.0, 5.0], [52.0, 5.019], [52.009, 5.019], [52.009, 5.0]]
+
+    first = list(overpass.fetch_building_elements(polygon, cache=cache))
+    second = list(overpass.fetch_building_elements(polygon, cache=cache))
+
+    assert len(queries) == 1
+    assert sorted(e['id'] for e in first) == [1, 2]
+    assert sorted(e['id'] for e in second) == [1, 2]
+    assert cache.stats() == {'hits': 2, 'misses': 2}
@@ -0,0 +1,261 @@
+import math
+import struct
+
+import numpy as np
+import pytest
+import shapely
+
+from apps.NETontwerp import vector_tiles
+from apps.NETontwerp.building_store import BuildingStore
+from apps.NETontwerp.overpass_query import DETAIL_CENTERS
+from apps.NETontwerp.vector_tiles import (
+    BUFFER,
+    EXTENT,
+    GEOM_POINT,
+    GEOM_POLYGON,
+    BuildingTileSet,
+    lonlat_to_world,
+)
+
+Z = 16
+
+
+def read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def read_fields(data):
+    """(field number, value) pairs of one protobuf message."""
+    fields, pos = [], 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = struct.unpack('<d', data[pos : pos + 8])[0], pos + 8
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos : pos + length], pos + length
+        else:
+            raise AssertionError(f'Unexpected wire type {wire_type}')
+        fields.append((number, value))
+    return fields
+
+
+def read_packed(data):
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_value(data):
+    ((number, value),) = read_fields(data)
+    return {1: lambda v: v.decode(), 3: float, 6: unzigzag, 7: bool}[number](value)
+
+
+def decode_geometry(commands):
+    """Rings (or single points) as lists of (x, y) in tile units."""
+    parts, x, y, i = [], 0, 0, 0
+    while i < len(commands):
+        command, count = commands[i] & 0x7, commands[i] >> 3
+        i += 1
+        if command == 7:
+            continue
+        if command == 1:
+            parts.append([])
+        for _ in range(count):
+            x += unzigzag(commands[i])
+            y += unzigzag(commands[i + 1])
+            parts[-1].append((x, y))
+            i += 2
+    return parts
+
+
+def decode_tile(data):
+    """Layers of an MVT tile as {name: {'extent', 'features'}}."""
+    layers = {}
+    for number, layer_data in read_fields(data):
+        assert number == 3
+        fields = read_fields(layer_data)
+        keys = [v.decode() for n, v in fields if n == 3]
+        values = [decode_value(v) for n, v in fields if n == 4]
+        features = []
+        for feature_data in (v for n, v in fields if n == 2):
+            feature = dict(read_fields(feature_data))
+            tags = read_packed(feature.get(2, b''))
+            features.append(
+                {
+                    'id': feature[1],
+                    'type': feature[3],
+                    'geometry': decode_geometry(read_packed(feature[4])),
+                    'properties': {
+                        keys[k]: values[v]
+                        for k, v in zip(tags[::2], tags[1::2], strict=True)
+                    },
+                }
+            )
+        (name,) = [v.decode() for n, v in fields if n == 1]
+        layers[name] = {
+            'version': dict(fields)[15],
+            'extent': dict(fields)[5],
+            'features': features,
+        }
+    return layers
+
+
+def signed_area(ring):
+    x, y = np.array(ring, dtype=np.float64).T
+    return (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+
+def tile_to_lonlat(tx, ty, x, y, z=Z):
+    """(lat, lon) of tile units (tx, ty) in tile z/x/y."""
+    world_x = (x + tx / EXTENT) / 2**z
+    world_y = (y + ty / EXTENT) / 2**z
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * world_y))))
+    return [lat, world_x * 360 - 180]
+
+
+def tile_of(lat, lon, z=Z):
+    world_x, world_y = lonlat_to_world(lat, lon)
+    return int(world_x * 2**z), int(world_y * 2**z)
+
+
+X, Y = tile_of(52.0, 5.0)
+
+
+def building(way_id, corners, **properties):
+    """A building dict whose corners are given in tile units of X, Y."""
+    coords = [tile_to_lonlat(tx, ty, X, Y) for tx, ty in [*corners, corners[0]]]
+    center = np.mean(coords[:-1], axis=0).tolist()
+    return {
+        'id': way_id,
+        'coords': coords,
+        'center': center,
+        'type': 'Rijwoning',
+        'name': '',
+        'area_m2': 80.0,
+        **properties,
+    }
+
+
+SQUARE = [(1000, 1000), (1200, 1000), (1200, 1200), (1000, 1200)]
+
+
+def render(buildings, z=Z, x=X, y=Y, **kwargs):
+    tile_set = BuildingTileSet(BuildingStore.from_buildings(buildings, **kwargs))
+    data = tile_set.tile(z, x, y)
+    return decode_tile(data) if data else {}
+
+
+def test_varint_and_zigzag_round_trip():
+    for value in [0, 1, 127, 128, 300, 2**32, 2**63 - 1]:
+        assert read_varint(vector_tiles._varint(value), 0) == (
+            value,
+            len(vector_tiles._varint(value)),
+        )
+    for value in [0, -1, 1, -64, 64, -(2**31), 2**31]:
+        assert unzigzag(vector_tiles._zigzag(value)) == value
+
+
+def test_negative_varint_is_rejected():
+    with pytest.raises(ValueError):
+        vector_tiles._varint(-1)
+    with pytest.raises(ValueError):
+        render([building(-5, SQUARE)])
+
+
+@pytest.mark.parametrize('corners', [SQUARE, SQUARE[::-1]])
+def test_polygon_geometry_winding_and_attributes(corners):
+    layers = render([building(42, corners, name='Kerkstraat 1')])
+
+    layer = layers[vector_tiles.LAYER_NAME]
+    assert layer['version'] == 2
+    assert layer['extent'] == EXTENT
+    (feature,) = layer['features']
+    assert feature['id'] == 42
+    assert feature['type'] == GEOM_POLYGON
+    (ring,) = feature['geometry']
+    # The closing point is left to ClosePath
+    assert sorted(ring) == sorted(SQUARE)
+    # Exterior rings are clockwise on screen, whatever the input order
+    assert signed_area(ring) == pytest.approx(200 * 200)
+    assert feature['properties'] == {
+        'id': 42,
+        'nr': 1,
+        'name': 'Kerkstraat 1',
+        'type': 'Rijwoning',
+        'area_m2': 80.0,
+    }
+
+
+def test_holes_are_wound_against_the_exterior():
+    polygon = shapely.Polygon(
+        [(0, 0), (100, 0), (100, 100), (0, 100)],
+        holes=[[(20, 20), (20, 80), (80, 80), (80, 20)]],
+    )
+
+    exterior, hole = decode_geometry(vector_tiles._polygon_geometry(polygon))
+
+    assert signed_area(exterior) == pytest.approx(100 * 100)
+    assert signed_area(hole) == pytest.approx(-60 * 60)
+
+
+def test_polygon_is_clipped_to_the_buffer():
+    corners = [(-500, 2000), (300, 2000), (300, 2200), (-500, 2200)]
+
+    layers = render([building(7, corners)])
+
+    (ring,) = layers[vector_tiles.LAYER_NAME]['features'][0]['geometry']
+    xs = [x for x, _ in ring]
+    assert min(xs) == -BUFFER
+    assert max(xs) == 300
+
+
+def test_neighbouring_tile_gets_the_clipped_rest():
+    corners = [(-500, 2000), (300, 2000), (300, 2200), (-500, 2200)]
+
+    layers = render([building(7, corners)], x=X - 1)
+
+    (ring,) = layers[vector_tiles.LAYER_NAME]['features'][0]['geometry']
+    assert sorted({x for x, _ in ring}) == [EXTENT - 500, EXTENT + BUFFER]
+
+
+def test_low_zoom_and_centers_give_points():
+    buildings = [building(1, SQUARE), building(2, [(x + 400, y) for x, y in SQUARE])]
+    centers = [{key: b[key] for key in ('id', 'center', 'name')} for b in buildings]
+
+    for layers in [
+        render(buildings, z=Z - 2, x=X // 4, y=Y // 4),
+        render(centers, detail=DETAIL_CENTERS),
+    ]:
+        features = layers[vector_tiles.LAYER_NAME]['features']
+        assert [f['id'] for f in features] == [1, 2]
+        assert [f['type'] for f in features] == [GEOM_POINT, GEOM_POINT]
+        assert [len(f['geometry']) for f in features] == [1, 1]
+        assert [len(f['geometry'][0]) for f in features] == [1, 1]
+
+    (first,), (second,) = (f['geometry'] for f in features)
+    assert second[0][0] - first[0][0] == pytest.approx(400, abs=1)
+    assert second[0][1] == first[0][1] == pytest.approx(1100, abs=1)
+    assert features[0]['properties'] == {'id': 1, 'nr': 1}
+
+
+def test_empty_tile_is_empty():
+    tile_set = BuildingTileSet(BuildingStore.from_buildings([building(1, SQUARE)]))
+
+    assert tile_set.tile(Z, X + 5, Y) == b''